@@ -0,0 +1,76 @@
+"""
+Benchmarks of the simulation step pipeline.
+
+    python -m dem_sim.bench run -o results.json
+    python -m dem_sim.bench run --macro --sizes 150 1000 -o results.json
+    python -m dem_sim.bench compare baseline.json results.json --threshold 0.1
+
+run measures the micro-benchmarks of the per-object pipeline and the closed box macro-benchmarks, reports each as
+particle-steps per second, and saves the results as JSON. compare flags the benchmarks whose throughput fell by more
+than the threshold against a baseline, and exits with status 1 if there are any.
+"""
+import argparse
+import sys
+
+from dem_sim.bench.macro import macro_sizes, run_macro_benchmarks
+from dem_sim.bench.micro import micro_benchmarks, run_micro_benchmarks
+from dem_sim.bench.results import create_results, save_results, load_results, compare_results, print_results, \
+    print_comparison
+
+
+def run(args):
+    # With neither option given, both kinds are run.
+    micro = args.micro or not args.macro
+    macro = args.macro or not args.micro
+    results = {}
+    if micro:
+        results.update(run_micro_benchmarks(args.names, args.min_time, args.repeat))
+    if macro:
+        results.update(run_macro_benchmarks(args.sizes, args.steps, args.threads))
+
+    results = create_results(results)
+    print_results(results)
+    if args.output is not None:
+        save_results(results, args.output)
+        print("Saved results to {0}.".format(args.output))
+    return 0
+
+
+def compare(args):
+    rows, missing = compare_results(load_results(args.baseline), load_results(args.current), args.threshold)
+    print_comparison(rows, missing, args.threshold)
+    return 1 if any(row[4] for row in rows) else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m dem_sim.bench", description="Step pipeline benchmarks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmarks and save the results.")
+    run_parser.add_argument("-o", "--output", help="JSON file to save the results to.")
+    run_parser.add_argument("--micro", action="store_true", help="Run the micro-benchmarks.")
+    run_parser.add_argument("--macro", action="store_true", help="Run the closed box macro-benchmarks.")
+    run_parser.add_argument("--names", nargs="+", choices=list(micro_benchmarks),
+                            help="Micro-benchmarks to run. Default: all.")
+    run_parser.add_argument("--sizes", nargs="+", type=int, default=macro_sizes,
+                            help="Numbers of particles of the macro-benchmarks.")
+    run_parser.add_argument("--steps", type=int, help="Steps timed per macro-benchmark. Default: depends on size.")
+    run_parser.add_argument("--threads", type=int, help="Worker threads for the macro-benchmarks.")
+    run_parser.add_argument("--min-time", type=float, default=0.2,
+                            help="Minimum duration of each micro-benchmark measurement in seconds.")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Measurements of each micro-benchmark.")
+    run_parser.set_defaults(function=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare results against a baseline.")
+    compare_parser.add_argument("baseline", help="JSON results to compare against.")
+    compare_parser.add_argument("current", help="New JSON results.")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Fractional loss of throughput counted as a regression.")
+    compare_parser.set_defaults(function=compare)
+
+    args = parser.parse_args(argv)
+    return args.function(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
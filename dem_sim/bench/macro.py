@@ -0,0 +1,101 @@
+import math
+import time
+
+import numpy as np
+
+from dem_sim.generators.box import generate_closed_cube_box
+from dem_sim.objects.collision import AAWallCollisionKernel
+from dem_sim.objects.cv import CellList
+from dem_sim.objects.particle_system import ParticleSystem
+from dem_sim.objects.simulation import Simulation
+
+TIMESTEP = 0.0005
+DIAMETER = 0.1
+SPACING = 0.15
+
+# Sizes of the closed box macro-benchmark.
+macro_sizes = [150, 1000, 10000, 100000]
+
+
+def closed_box_simulation(number_of_particles, seed=0, threads=None):
+    """
+    Creates the closed box scenario with any number of particles.
+
+    Particles start on a jittered lattice filling the box from the bottom up, moving outwards as in the closed box sim.
+    The box grows with the number of particles so that the packing stays the same, and with 150 particles it is the
+    unit box of the closed box sim.
+
+    :param number_of_particles: Number of particles.
+    :param seed: Seed of the position jitter.
+    :param threads: Optional number of worker threads for the Simulation.
+    :return: The Simulation.
+    """
+    per_edge = math.ceil(number_of_particles ** (1 / 3) - 1e-9)
+    length = per_edge * SPACING + DIAMETER
+    axis = (np.arange(per_edge) - (per_edge - 1) / 2) * SPACING
+    # Layers are filled one at a time, from the bottom of the box.
+    y, x, z = np.meshgrid(axis, axis, axis, indexing="ij")
+    positions = np.column_stack([x.ravel(), y.ravel(), z.ravel()])[:number_of_particles]
+
+    rng = np.random.RandomState(seed)
+    positions[:, [0, 2]] += 0.05 * (rng.random_sample((number_of_particles, 2)) - 0.5)
+    # The same horizontal velocity field as the closed box sim, where each particle's speed is its distance from the
+    # centre line in metres per second.
+    velocities = positions * [1, 0, 1]
+
+    system = ParticleSystem(positions, velocities, DIAMETER)
+    cell_list = CellList(int(length / DIAMETER), length / 2, -length / 2)
+    wall_kernel = AAWallCollisionKernel(restitution=0.8, friction_coefficient=0.4, friction_stiffness=5e4)
+    return Simulation(system, cell_list, generate_closed_cube_box(length, [0, 0, 0]), wall_kernel=wall_kernel,
+                      threads=threads)
+
+
+def default_steps(number_of_particles):
+    """ Number of steps timed, chosen so that every size takes a similar time. """
+    return int(np.clip(200000 // number_of_particles, 5, 200))
+
+
+def bench_closed_box(number_of_particles, steps=None, warmup=5, threads=None):
+    """
+    Times the full step pipeline of the closed box scenario.
+
+    :param number_of_particles: Number of particles.
+    :param steps: Number of steps timed. Default: default_steps(number_of_particles).
+    :param warmup: Number of steps taken before timing, so that contacts have formed.
+    :param threads: Optional number of worker threads for the Simulation.
+    :return: Dictionary of the throughput in particle-steps per second and the time per step.
+    """
+    if steps is None:
+        steps = default_steps(number_of_particles)
+    with closed_box_simulation(number_of_particles, threads=threads) as sim:
+        for _ in range(warmup):
+            sim.step(TIMESTEP)
+        start = time.perf_counter()
+        for _ in range(steps):
+            sim.step(TIMESTEP)
+        elapsed = time.perf_counter() - start
+        contacts = len(sim.registry)
+
+    seconds = elapsed / steps
+    return {"particle_steps_per_second": number_of_particles / seconds,
+            "seconds_per_call": seconds,
+            "particles_per_call": number_of_particles,
+            "calls": steps,
+            "repeat": 1,
+            "contacts": contacts}
+
+
+def run_macro_benchmarks(sizes=None, steps=None, threads=None):
+    """
+    Runs the closed box macro-benchmark at each size.
+
+    :param sizes: Numbers of particles. Default: macro_sizes.
+    :param steps: Number of steps timed at every size. Default: default_steps for each size.
+    :param threads: Optional number of worker threads for the Simulation.
+    :return: Dictionary of results by benchmark name.
+    """
+    results = {}
+    for n in macro_sizes if sizes is None else sizes:
+        name = "closed_box.{0}".format(n) if threads is None else "closed_box.{0}.threads_{1}".format(n, threads)
+        results[name] = bench_closed_box(n, steps, threads=threads)
+    return results
@@ -0,0 +1,136 @@
+import itertools
+import os
+import tempfile
+from random import Random
+
+import numpy as np
+
+from dem_sim.bench.results import time_function
+from dem_sim.generators.box import generate_closed_cube_box
+from dem_sim.objects.collision import AAWallCollision
+from dem_sim.objects.cv import CVManager
+from dem_sim.objects.history import RecordingPolicy
+from dem_sim.objects.particle import Particle
+from dem_sim.util.file_io import Logger
+
+TIMESTEP = 0.0005
+
+
+def closed_box_particles(seed=0, recording=None):
+    """ Returns the 150 particles of the closed box sim, with the same layout and starting velocities. """
+    rand = Random(seed).random
+    particles = []
+    for y in [-0.18, -0.07, 0.1, 0.21, 0.32, 0.43]:
+        for x in np.arange(-0.4, 0.41, 0.2):
+            for z in np.arange(-0.4, 0.41, 0.2):
+                pos = np.array([x + 0.05 * (rand() - 0.5), y, z + 0.05 * (rand() - 0.5)])
+                particles.append(Particle(len(particles), pos, np.array([pos[0], 0, pos[2]]), diameter=0.1,
+                                          recording=recording))
+    return particles
+
+
+def packed_particles(seed=0):
+    """ Closed box particles moved into the bottom of the box so that every particle has neighbours in contact. """
+    particles = closed_box_particles(seed)
+    for p in particles:
+        p.pos = p.pos * [0.45, 0.45, 0.45] - [0, 0.25, 0]
+    return particles
+
+
+def bench_cv_manager_add_particles(min_time, repeat):
+    particles = closed_box_particles()
+    manager = CVManager(10, 0.5, -0.5)
+
+    def step():
+        manager.add_particles(particles)
+        manager.reset()
+
+    return time_function(step, len(particles), min_time, repeat)
+
+
+def bench_cv_manager_get_collisions(min_time, repeat):
+    particles = packed_particles()
+    manager = CVManager(10, 0.5, -0.5)
+    manager.add_particles(particles)
+    return time_function(manager.get_collisions, len(particles), min_time, repeat)
+
+
+def bench_collision_calculate(min_time, repeat):
+    particles = packed_particles()
+    manager = CVManager(10, 0.5, -0.5)
+    manager.add_particles(particles)
+    collisions = manager.get_collisions()
+
+    def step():
+        for collision in collisions:
+            collision.calculate(TIMESTEP)
+        for p in particles:
+            p.dem_forces.clear()
+
+    return time_function(step, len(particles), min_time, repeat)
+
+
+def bench_wall_collision_calculate(min_time, repeat):
+    particles = packed_particles()
+    walls = generate_closed_cube_box(1, [0, 0, 0])
+    collisions = [AAWallCollision(p, wall, restitution=0.8, friction_coefficient=0.4, friction_stiffness=5e4)
+                  for p in particles for wall in walls]
+
+    def step():
+        for collision in collisions:
+            collision.calculate(TIMESTEP)
+        for p in particles:
+            p.dem_forces.clear()
+
+    return time_function(step, len(particles), min_time, repeat)
+
+
+def bench_particle_iterate(min_time, repeat):
+    # Only the most recent states are kept, so that memory use does not depend on how many calls are timed.
+    particles = closed_box_particles(recording=RecordingPolicy(length=64))
+
+    def step():
+        for p in particles:
+            p.iterate(TIMESTEP, implicit=True)
+
+    return time_function(step, len(particles), min_time, repeat)
+
+
+def bench_logger_log(min_time, repeat):
+    particles = closed_box_particles()
+    with tempfile.TemporaryDirectory() as directory:
+        logger = Logger(particles, "bench", os.path.join(directory, "log") + os.sep, ignore_warnings=True)
+        frames = itertools.count()
+
+        # Every call writes a frame, with calls two frames apart so that rounding never skips one.
+        def step():
+            logger.log(2 * logger.log_step * next(frames))
+
+        result = time_function(step, len(particles), min_time, repeat)
+        logger.close()
+    return result
+
+
+# Micro-benchmarks of the per-object pipeline on the 150 particle closed box, each timing one step's worth of work.
+micro_benchmarks = {"cv_manager.add_particles": bench_cv_manager_add_particles,
+                    "cv_manager.get_collisions": bench_cv_manager_get_collisions,
+                    "collision.calculate": bench_collision_calculate,
+                    "aa_wall_collision.calculate": bench_wall_collision_calculate,
+                    "particle.iterate": bench_particle_iterate,
+                    "logger.log": bench_logger_log}
+
+
+def run_micro_benchmarks(names=None, min_time=0.2, repeat=3):
+    """
+    Runs micro-benchmarks.
+
+    :param names: Names of the benchmarks to run. Default: all of them.
+    :param min_time: Minimum duration of each measurement in seconds.
+    :param repeat: Number of measurements of each benchmark.
+    :return: Dictionary of results by benchmark name.
+    """
+    results = {}
+    for name, benchmark in micro_benchmarks.items():
+        if names is None or name in names:
+            results[name] = benchmark(min_time, repeat)
+    return results
@@ -0,0 +1,104 @@
+import datetime
+import json
+import platform
+import time
+
+import numpy as np
+
+RESULTS_VERSION = 1
+
+
+def time_function(function, particles_per_call, min_time=0.2, repeat=3):
+    """
+    Times a function the way timeit does, calling it enough times for each measurement to last at least min_time and
+    keeping the fastest of repeat measurements.
+
+    :param function: The function to time, called without arguments.
+    :param particles_per_call: Number of particle-steps of work done by one call.
+    :param min_time: Minimum duration of each measurement in seconds.
+    :param repeat: Number of measurements.
+    :return: Dictionary of the throughput in particle-steps per second and the time per call.
+    """
+    number = 1
+    while True:
+        elapsed = measure(function, number)
+        if elapsed >= min_time:
+            break
+        # Aim slightly past min_time, so the calibration usually only needs one more round.
+        number = max(number * 2, int(number * 1.2 * min_time / max(elapsed, 1e-9)))
+
+    times = [elapsed] + [measure(function, number) for _ in range(repeat - 1)]
+    seconds = min(times) / number
+    return {"particle_steps_per_second": particles_per_call / seconds,
+            "seconds_per_call": seconds,
+            "particles_per_call": particles_per_call,
+            "calls": number,
+            "repeat": repeat}
+
+
+def measure(function, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        function()
+    return time.perf_counter() - start
+
+
+def create_results(results):
+    """ Wraps benchmark results with a description of the machine they were measured on. """
+    return {"version": RESULTS_VERSION,
+            "created": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.platform(),
+            "processor": platform.processor(),
+            "results": results}
+
+
+def save_results(results, filename):
+    with open(filename, 'w') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+
+
+def load_results(filename):
+    with open(filename) as file:
+        return json.load(file)
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """
+    Compares the throughput of two sets of benchmark results.
+
+    :param baseline: Results, as saved by save_results, to compare against.
+    :param current: New results.
+    :param threshold: Fractional loss of throughput above which a benchmark counts as a regression.
+    :return: List of (name, baseline rate, current rate, ratio, regressed) for the benchmarks in both sets, and the
+             names of the benchmarks only in one of them.
+    """
+    baseline = baseline["results"]
+    current = current["results"]
+    rows = []
+    for name in sorted(set(baseline) & set(current)):
+        before = baseline[name]["particle_steps_per_second"]
+        after = current[name]["particle_steps_per_second"]
+        ratio = after / before
+        rows.append((name, before, after, ratio, ratio < 1 - threshold))
+    missing = sorted(set(baseline) ^ set(current))
+    return rows, missing
+
+
+def print_results(results):
+    print("{0:<40} {1:>20} {2:>15}".format("Benchmark", "Particle-steps/s", "Time/call (s)"))
+    for name, result in sorted(results["results"].items()):
+        print("{0:<40} {1:>20.4g} {2:>15.4g}".format(name, result["particle_steps_per_second"],
+                                                     result["seconds_per_call"]))
+
+
+def print_comparison(rows, missing, threshold):
+    print("{0:<40} {1:>15} {2:>15} {3:>8}".format("Benchmark", "Baseline", "Current", "Ratio"))
+    for name, before, after, ratio, regressed in rows:
+        print("{0:<40} {1:>15.4g} {2:>15.4g} {3:>8.3f}{4}".format(name, before, after, ratio,
+                                                                  "  REGRESSION" if regressed else ""))
+    for name in missing:
+        print("{0:<40} only in one set of results.".format(name))
+    regressions = sum(row[4] for row in rows)
+    print("{0} of {1} benchmarks regressed by more than {2:.0%}.".format(regressions, len(rows), threshold))
@@ -0,0 +1,227 @@
+import math
+import os
+import random
+import time
+
+import numpy as np
+
+from dem_sim.objects.walls import AAWall
+from dem_sim.util.exceptions import ParameterException
+
+CHECKPOINT_VERSION = 2
+
+# ParticleSystem arrays saved in every checkpoint.
+system_arrays = ["pos", "vel", "forces", "diameter", "density", "fluid_viscosity", "species"]
+registry_arrays = ["keys", "i", "j", "reduced_mass", "damping_coefficient", "tangential_displacement", "age"]
+
+
+def save_checkpoint(sim, filename, timestep=None):
+    """
+    Saves the full state of a simulation to a single binary file.
+
+    The checkpoint holds the particle state arrays and recorded history, the simulation time, the contact registry,
+    the Verlet list, the walls and wall contact counts, the held field samples, the sleep state, the timestep
+    controller state, and the state of the random and numpy.random generators. It is written to a temporary file that
+    then replaces filename, so an interrupted save never leaves a partial checkpoint behind.
+
+    :param sim: The Simulation to save.
+    :param filename: The checkpoint file name.
+    :param timestep: Optional TimestepController driving the simulation.
+    """
+    system = sim.system
+    arrays = {"version": np.array(CHECKPOINT_VERSION),
+              "time": np.array(system.time),
+              "record_history": np.array(system.record_history)}
+    arrays.update(get_random_arrays())
+    for name in system_arrays:
+        arrays["system_" + name] = getattr(system, name)
+    if system.history is not None:
+        arrays["history_times"] = system.times
+        arrays["history_pos"] = system.pos_history
+        arrays["history_vel"] = system.vel_history
+        arrays["history_calls"] = np.array(system.history.calls)
+        if system.history.last_time is not None:
+            arrays["history_last_time"] = np.array(system.history.last_time)
+
+    for name in registry_arrays:
+        arrays["registry_" + name] = getattr(sim.registry, name)
+    arrays["registry_counts"] = np.array([sim.registry.created, sim.registry.evicted])
+
+    arrays["wall_candidates"] = np.array(sim.wall_candidates, dtype=np.int64)
+    arrays["wall_contacts"] = np.array(sim.wall_contacts, dtype=np.int64)
+    walls = sim.cell_list.walls
+    arrays["walls_min"] = np.array([wall.min for wall in walls], dtype=float).reshape((-1, 3))
+    arrays["walls_max"] = np.array([wall.max for wall in walls], dtype=float).reshape((-1, 3))
+    arrays["walls_material"] = np.array([wall.material for wall in walls], dtype=np.int64)
+
+    if sim.verlet is not None and sim.verlet.reference_pos is not None:
+        arrays["verlet_i"] = sim.verlet.i
+        arrays["verlet_j"] = sim.verlet.j
+        arrays["verlet_reference_pos"] = sim.verlet.reference_pos
+
+    if system.field_samples is not None:
+        for k, (sample_time, gravity, vel_fluid) in enumerate(system.field_samples):
+            arrays["field_sample_{0}_time".format(k)] = np.array(sample_time)
+            arrays["field_sample_{0}_gravity".format(k)] = gravity
+            arrays["field_sample_{0}_vel_fluid".format(k)] = vel_fluid
+
+    if sim.sleep is not None:
+        arrays["sleep_asleep"] = sim.sleep.asleep
+        arrays["sleep_still_steps"] = sim.sleep.still_steps
+        if sim.sleep.gravity is not None:
+            arrays["sleep_gravity"] = sim.sleep.gravity
+
+    if timestep is not None and timestep.timestep is not None:
+        arrays["timestep"] = np.array(timestep.timestep)
+
+    temporary = filename + ".tmp"
+    with open(temporary, 'wb') as file:
+        np.savez(file, **arrays)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, filename)
+
+
+def resume(sim, checkpoint, timestep=None):
+    """
+    Restores a simulation from a checkpoint so that it continues exactly as the saved run would have.
+
+    The simulation must be set up as the saved one was, with the same number of particles, kernels, callbacks, and
+    options. Its state is then replaced by the saved state.
+
+    :param sim: The Simulation to restore into.
+    :param checkpoint: The checkpoint file name.
+    :param timestep: Optional TimestepController to restore.
+    :return: The restored simulation time.
+    """
+    with np.load(checkpoint) as data:
+        data = dict(data)
+    if int(data["version"]) != CHECKPOINT_VERSION:
+        raise ParameterException("Unsupported checkpoint version: {0}".format(int(data["version"])))
+
+    system = sim.system
+    if data["system_pos"].shape != system.pos.shape:
+        raise ParameterException("Checkpoint has {0} particles, the simulation has {1}.".format(
+            len(data["system_pos"]), len(system)))
+
+    for name in system_arrays:
+        # Copied in place, so that any views of the arrays stay valid.
+        getattr(system, name)[:] = data["system_" + name]
+    system.update_properties()
+    system.time = data["time"].item()
+    sim.pairs = None
+    system.record_history = bool(data["record_history"])
+    system.history = None
+    if "history_times" in data:
+        history = system.get_history()
+        history.extend(data["history_times"], data["history_pos"], data["history_vel"])
+        history.calls = int(data["history_calls"])
+        history.last_time = data["history_last_time"].item() if "history_last_time" in data else None
+
+    registry = sim.registry
+    for name in registry_arrays:
+        setattr(registry, name, data["registry_" + name])
+    registry.created, registry.evicted = (int(count) for count in data["registry_counts"])
+
+    sim.wall_candidates = data["wall_candidates"].tolist()
+    sim.wall_contacts = data["wall_contacts"].tolist()
+    sim.cell_list.walls = []
+    sim.cell_list.add_walls([AAWall(wall_min, wall_max, int(material)) for wall_min, wall_max, material in
+                             zip(data["walls_min"], data["walls_max"], data["walls_material"])])
+
+    if sim.verlet is not None:
+        sim.verlet.reference_pos = data.get("verlet_reference_pos")
+        sim.verlet.i = data.get("verlet_i")
+        sim.verlet.j = data.get("verlet_j")
+
+    samples = []
+    while "field_sample_{0}_time".format(len(samples)) in data:
+        prefix = "field_sample_{0}_".format(len(samples))
+        samples.append((data[prefix + "time"].item(), data[prefix + "gravity"], data[prefix + "vel_fluid"]))
+    system.field_samples = samples if len(samples) > 0 else None
+
+    if sim.sleep is not None:
+        sim.sleep.reset(len(system))
+        if "sleep_asleep" in data:
+            sim.sleep.asleep[:] = data["sleep_asleep"]
+            sim.sleep.still_steps[:] = data["sleep_still_steps"]
+            sim.sleep.gravity = data.get("sleep_gravity")
+
+    if timestep is not None:
+        timestep.timestep = data["timestep"].item() if "timestep" in data else None
+
+    set_random_arrays(data)
+    return system.time
+
+
+def get_random_arrays():
+    """ Returns the states of the random and numpy.random generators as plain arrays, so no pickling is needed. """
+    version, internal_state, gauss_next = random.getstate()
+    _, key, pos, has_gauss, cached_gaussian = np.random.get_state()
+    arrays = {"random_version": np.array(version),
+              "random_internal_state": np.array(internal_state, dtype=np.int64),
+              "numpy_random_key": key,
+              "numpy_random_pos": np.array(pos),
+              "numpy_random_has_gauss": np.array(has_gauss),
+              "numpy_random_cached_gaussian": np.array(cached_gaussian)}
+    if gauss_next is not None:
+        arrays["random_gauss_next"] = np.array(gauss_next)
+    return arrays
+
+
+def set_random_arrays(data):
+    """ Restores the states of the random and numpy.random generators saved by get_random_arrays. """
+    gauss_next = data["random_gauss_next"].item() if "random_gauss_next" in data else None
+    random.setstate((int(data["random_version"]), tuple(data["random_internal_state"].tolist()), gauss_next))
+    np.random.set_state(("MT19937", data["numpy_random_key"], int(data["numpy_random_pos"]),
+                         int(data["numpy_random_has_gauss"]), float(data["numpy_random_cached_gaussian"])))
+
+
+class Checkpointer:
+    """ Saves checkpoints of a running simulation every wall_interval seconds of real time and/or every sim_interval
+    seconds of simulation time. """
+    filename = None
+    wall_interval = None
+    sim_interval = None
+
+    last_wall_time = None
+    last_sim_interval = None
+    saves = None
+
+    def __init__(self, filename, wall_interval=None, sim_interval=None):
+        """
+        :param filename: The checkpoint file name, overwritten by every save.
+        :param wall_interval: Real time in seconds between checkpoints.
+        :param sim_interval: Simulation time between checkpoints.
+        """
+        if wall_interval is None and sim_interval is None:
+            raise ParameterException("A checkpoint wall_interval or sim_interval must be given.")
+        self.filename = filename
+        self.wall_interval = wall_interval
+        self.sim_interval = sim_interval
+        self.last_wall_time = time.monotonic()
+        self.saves = 0
+
+    def update(self, sim, timestep=None):
+        """
+        Saves a checkpoint if the real time interval has passed since the last one, or if the simulation time has
+        passed the next multiple of the simulation time interval.
+
+        :return: Whether a checkpoint was saved.
+        """
+        wall_due = self.wall_interval is not None and time.monotonic() - self.last_wall_time >= self.wall_interval
+        sim_due = False
+        if self.sim_interval is not None:
+            # Small tolerance so that accumulated timestep rounding does not delay a checkpoint by a step.
+            interval = math.floor(sim.system.time / self.sim_interval + 1e-9)
+            if self.last_sim_interval is None:
+                self.last_sim_interval = interval
+            sim_due = interval > self.last_sim_interval
+            self.last_sim_interval = interval
+        if not (wall_due or sim_due):
+            return False
+
+        save_checkpoint(sim, self.filename, timestep)
+        self.last_wall_time = time.monotonic()
+        self.saves += 1
+        return True
@@ -1,5 +1,6 @@
+from dem_sim.objects.materials import calculate_damping_factor
 from dem_sim.objects.particle import Particle
-from dem_sim.objects.walls import AAWall
+from dem_sim.objects.walls import AAWall, AAWallTable
 import dem_sim.util.vector_utils as vect
 import numpy as np
 import math
@@ -176,7 +177,7 @@ class AAWallCollision:
         return all(tang_dif_max >= 0) and all(tang_dif_min >= 0)
 
     def calculate(self, delta_t):
-
+        """ Applies the collision forces to the particle, returning whether the particle is in contact. """
         if self.get_overlap() > 0 and self.is_in_wall_bounds():
             force = self.calculate_collision_normal_force()
             self.p.dem_forces.append(force)
@@ -184,3 +185,297 @@ class AAWallCollision:
             if self.friction_stiffness is not None and self.friction_coefficient is not None:
                 friction = self.calculate_tangential_friction_force(force, self.p.vel, delta_t)
                 self.p.dem_forces.append(friction)
+            return True
+        return False
+
+
+class CollisionKernel:
+    """
+    Vectorized particle-particle collisions for a batch of candidate pairs in a ParticleSystem.
+
+    Uses the same force model as Collision, but evaluates every pair (i[n], j[n]) in one pass and accumulates the
+    results directly into the system force array.
+
+    With a MaterialTable the contact properties of each pair are gathered from its tables by the species ids of the
+    two particles, and the kernel's own properties are ignored.
+    """
+    stiffness = None
+    damping_coefficient = None
+    restitution = None
+    friction_coefficient = None
+    friction_stiffness = None
+    damping_factor = None
+    materials = None
+
+    def __init__(self, stiffness=1e5, damping_coefficient=None, restitution=0.8, friction_coefficient=0.6,
+                 friction_stiffness=1e5, materials=None):
+        """
+        :param materials: Optional MaterialTable holding the contact properties of every pair of species.
+        """
+        self.stiffness = stiffness
+        self.damping_coefficient = damping_coefficient
+        self.restitution = restitution
+        self.friction_coefficient = friction_coefficient
+        self.friction_stiffness = friction_stiffness
+        if damping_coefficient is None:
+            self.damping_factor = calculate_damping_factor(stiffness, restitution)
+        self.materials = materials
+
+    @property
+    def has_friction(self):
+        return self.materials is not None or (self.friction_stiffness is not None
+                                               and self.friction_coefficient is not None)
+
+    @property
+    def max_stiffness(self):
+        """ Largest normal or tangential stiffness of any contact. """
+        if self.materials is not None:
+            return self.materials.max_stiffness
+        return max(self.stiffness, self.friction_stiffness or 0)
+
+    def calculate_damping_coefficient(self, reduced_mass):
+        if self.damping_coefficient is not None:
+            return np.full(len(reduced_mass), self.damping_coefficient, dtype=float)
+        return self.damping_factor * np.sqrt(reduced_mass)
+
+    def get_damping_coefficient(self, system, i, j, reduced_mass):
+        """ Returns the damping coefficient of each pair, from the material tables if there are any. """
+        if self.materials is None:
+            return self.calculate_damping_coefficient(reduced_mass)
+        return self.materials.damping_factor[system.species[i], system.species[j]] * np.sqrt(reduced_mass)
+
+    def get_contact_properties(self, system, i, j):
+        """
+        Returns the stiffness, friction coefficient, and friction stiffness of the pairs, gathered from the material
+        tables as (M,) arrays, or the kernel's own properties as numbers when it has no materials.
+        """
+        if self.materials is None:
+            return self.stiffness, self.friction_coefficient, self.friction_stiffness
+        species_i = system.species[i]
+        species_j = system.species[j]
+        return (self.materials.stiffness[species_i, species_j],
+                self.materials.friction_coefficient[species_i, species_j],
+                self.materials.friction_stiffness[species_i, species_j])
+
+    @staticmethod
+    def get_gaps(system, i, j):
+        """ Returns the distance between the surfaces of each pair, which is negative for pairs that overlap. """
+        separation = system.pos[j] - system.pos[i]
+        return vect.mag_rows(separation) - (system.diameter[i] + system.diameter[j]) / 2
+
+    def get_contacts(self, system, i, j):
+        """ Filters candidate pairs down to those that overlap. """
+        i = np.asarray(i, dtype=np.intp)
+        j = np.asarray(j, dtype=np.intp)
+        contact = self.get_gaps(system, i, j) < 0
+        return i[contact], j[contact]
+
+    def get_pair_forces(self, system, i, j, delta_t, registry=None):
+        """
+        Calculates the collision forces for the given pairs.
+
+        :param system: The ParticleSystem the indices refer to.
+        :param i: (M,) array of first particle indices.
+        :param j: (M,) array of second particle indices.
+        :param delta_t: The timestep.
+        :param registry: Optional ContactRegistry holding persistent per-contact constants and state.
+        :return: i, j, and force arrays for the pairs in contact, with force being the force acting on j.
+        """
+        i, j = self.get_contacts(system, i, j)
+
+        if registry is None:
+            m_i = system.mass[i]
+            m_j = system.mass[j]
+            reduced_mass = m_i * m_j / (m_i + m_j)
+            damping_coefficient = self.get_damping_coefficient(system, i, j, reduced_mass)
+        else:
+            registry.update(system, i, j)
+            i = registry.i
+            j = registry.j
+            reduced_mass = registry.reduced_mass
+            damping_coefficient = registry.damping_coefficient
+
+        vel_tangential, force = self.get_contact_forces(system, i, j, reduced_mass, damping_coefficient)
+        if registry is not None:
+            registry.tangential_displacement += vel_tangential * delta_t
+        return i, j, force
+
+    def get_contact_forces(self, system, i, j, reduced_mass, damping_coefficient):
+        """
+        Calculates the collision forces for pairs already known to be in contact.
+
+        :return: The tangential relative velocity and the force acting on j for each pair.
+        """
+        stiffness, friction_coefficient, friction_stiffness = self.get_contact_properties(system, i, j)
+        separation = system.pos[j] - system.pos[i]
+        distance = vect.mag_rows(separation)
+        overlap = (system.diameter[i] + system.diameter[j]) / 2 - distance
+
+        normal = vect.normalize_rows(separation, distance)
+        vel_relative = system.vel[j] - system.vel[i]
+        vel_normal = np.einsum('ij,ij->i', vel_relative, normal)[:, np.newaxis] * normal
+
+        force = (stiffness * overlap)[:, np.newaxis] * normal - damping_coefficient[:, np.newaxis] * vel_normal
+
+        vel_tangential = vel_relative - vel_normal
+        if self.has_friction:
+            tangent = vect.normalize_rows(vel_tangential)
+            # TODO: Investigate more accurate methods of numerically integrating this.
+            tangential_displacement = vect.mag_rows(vel_tangential) * math.pi * np.sqrt(reduced_mass / stiffness)
+            force += self.calculate_tangential_friction_force(force, tangent, tangential_displacement,
+                                                              friction_coefficient, friction_stiffness)
+
+        return vel_tangential, force
+
+    def calculate_tangential_friction_force(self, normal_force, tangent, tangential_displacement,
+                                            friction_coefficient=None, friction_stiffness=None):
+        """ Coulomb-capped tangential force, choosing the smaller of the dynamic and static friction forces. """
+        if friction_coefficient is None:
+            friction_coefficient = self.friction_coefficient
+        if friction_stiffness is None:
+            friction_stiffness = self.friction_stiffness
+        f_dyn = - friction_coefficient * vect.mag_rows(normal_force)
+        f_static = - friction_stiffness * tangential_displacement
+        magnitude = np.where(f_dyn * f_dyn < f_static * f_static, f_dyn, f_static)
+        return magnitude[:, np.newaxis] * tangent
+
+    def calculate(self, system, i, j, delta_t, registry=None):
+        i, j, force = self.get_pair_forces(system, i, j, delta_t, registry)
+        system.add_forces(i, -force)
+        system.add_forces(j, force)
+
+
+class AAWallCollisionKernel:
+    """
+    Vectorized particle-axis-aligned wall collisions for a batch of particle-wall pairs.
+
+    Uses the same force model as AAWallCollision, evaluated for all pairs (particles[n], walls[n]) in one pass against
+    an AAWallTable, with the results accumulated into the system force array.
+
+    With a MaterialTable the contact properties of each pair are gathered from its wall tables by the species id of the
+    particle and the material id of the wall, and the kernel's own properties are ignored.
+    """
+    stiffness = None
+    damping_coefficient = None
+    restitution = None
+    friction_coefficient = None
+    friction_stiffness = None
+    damping_factor = None
+    materials = None
+
+    def __init__(self, stiffness=1e5, damping_coefficient=None, restitution=0.8, friction_coefficient=0.6,
+                 friction_stiffness=1e5, materials=None):
+        """
+        :param materials: Optional MaterialTable holding the contact properties of every species and wall material.
+        """
+        self.stiffness = stiffness
+        self.damping_coefficient = damping_coefficient
+        self.restitution = restitution
+        self.friction_coefficient = friction_coefficient
+        self.friction_stiffness = friction_stiffness
+        if damping_coefficient is None:
+            self.damping_factor = calculate_damping_factor(stiffness, restitution)
+        self.materials = materials
+
+    @property
+    def has_friction(self):
+        return self.materials is not None or (self.friction_stiffness is not None
+                                               and self.friction_coefficient is not None)
+
+    @property
+    def max_stiffness(self):
+        """ Largest normal or tangential stiffness of any wall contact. """
+        if self.materials is not None:
+            return self.materials.max_wall_stiffness
+        return max(self.stiffness, self.friction_stiffness or 0)
+
+    def calculate_damping_coefficient(self, mass):
+        if self.damping_coefficient is not None:
+            return np.full(len(mass), self.damping_coefficient, dtype=float)
+        return self.damping_factor * np.sqrt(mass)
+
+    def get_contact_properties(self, system, table, particles, walls, mass):
+        """
+        Returns the stiffness, damping coefficient, friction coefficient, and friction stiffness of the particle-wall
+        pairs, gathered from the material tables, or from the kernel's own properties when it has no materials.
+        """
+        if self.materials is None:
+            return self.stiffness, self.calculate_damping_coefficient(mass), self.friction_coefficient, \
+                self.friction_stiffness
+        species = system.species[particles]
+        wall_materials = table.material[walls]
+        return (self.materials.wall_stiffness[species, wall_materials],
+                self.materials.wall_damping_factor[species, wall_materials] * np.sqrt(mass),
+                self.materials.wall_friction_coefficient[species, wall_materials],
+                self.materials.wall_friction_stiffness[species, wall_materials])
+
+    @staticmethod
+    def get_overlaps(system, table, particles, walls):
+        """
+        Returns the overlap of each particle-wall pair, the collision normal pointing from the wall towards the
+        particle centre, and whether the particle centre lies within the bounds of the wall.
+        """
+        pos = system.pos[particles]
+        signed_distance = np.einsum('ij,ij->i', pos, table.normal[walls]) - table.offset[walls]
+        overlap = system.diameter[particles] / 2 - np.abs(signed_distance)
+        normal = np.sign(signed_distance)[:, np.newaxis] * table.normal[walls]
+
+        # Differences tangential to the wall, ignoring component normal to the wall.
+        dif_max = table.max[walls] - pos
+        dif_min = pos - table.min[walls]
+        tang_dif_max = dif_max - np.einsum('ij,ij->i', dif_max, normal)[:, np.newaxis] * normal
+        tang_dif_min = dif_min - np.einsum('ij,ij->i', dif_min, normal)[:, np.newaxis] * normal
+        in_bounds = np.all(tang_dif_max >= 0, axis=1) & np.all(tang_dif_min >= 0, axis=1)
+        return overlap, normal, in_bounds
+
+    def get_gaps(self, system, table, particles, walls):
+        """ Returns the distance between each particle surface and wall, or inf where the particle is out of the wall
+        bounds. """
+        overlap, _, in_bounds = self.get_overlaps(system, table, particles, walls)
+        return np.where(in_bounds, -overlap, np.inf)
+
+    def get_wall_forces(self, system, table, particles, walls, delta_t):
+        """
+        Calculates the collision forces for the given particle-wall pairs.
+
+        :param system: The ParticleSystem the particle indices refer to.
+        :param table: The AAWallTable the wall indices refer to.
+        :param particles: (M,) array of particle indices.
+        :param walls: (M,) array of wall indices.
+        :param delta_t: The timestep.
+        :return: particle, wall, and force arrays for the pairs in contact.
+        """
+        particles = np.asarray(particles, dtype=np.intp)
+        walls = np.asarray(walls, dtype=np.intp)
+        overlap, normal, in_bounds = self.get_overlaps(system, table, particles, walls)
+
+        contact = (overlap > 0) & in_bounds
+        particles = particles[contact]
+        walls = walls[contact]
+        overlap = overlap[contact]
+        normal = normal[contact]
+
+        vel = system.vel[particles]
+        mass = system.mass[particles]
+        vel_normal = np.einsum('ij,ij->i', vel, normal)[:, np.newaxis] * normal
+        stiffness, damping_coefficient, friction_coefficient, friction_stiffness = \
+            self.get_contact_properties(system, table, particles, walls, mass)
+
+        force = (stiffness * overlap)[:, np.newaxis] * normal - damping_coefficient[:, np.newaxis] * vel_normal
+
+        if self.has_friction:
+            vel_tangential = vel - vel_normal
+            tangent = vect.normalize_rows(vel_tangential)
+            # TODO: Investigate more accurate methods of numerically integrating this.
+            tangential_displacement = vect.mag_rows(vel_tangential) * math.pi * np.sqrt(mass / stiffness)
+            f_dyn = - friction_coefficient * vect.mag_rows(force)
+            f_static = - friction_stiffness * tangential_displacement
+            force += np.where(f_dyn * f_dyn < f_static * f_static, f_dyn, f_static)[:, np.newaxis] * tangent
+
+        return particles, walls, force
+
+    def calculate(self, system, table, particles, walls, delta_t):
+        """ Applies the wall collision forces to the system, returning the number of particle-wall contacts. """
+        particles, walls, force = self.get_wall_forces(system, table, particles, walls, delta_t)
+        system.add_forces(particles, force)
+        return len(particles)
@@ -0,0 +1,92 @@
+import numpy as np
+
+from dem_sim.util.hashing_utils import pair_keys
+
+
+class ContactRegistry:
+    """
+    Persistent table of particle-particle contacts keyed by integer pair id.
+
+    Entries are created when a pair first comes into contact and evicted when it separates. Per-pair constants are
+    calculated once on creation and per-contact state is carried between steps, all stored in arrays sorted by key.
+    """
+    kernel = None
+
+    keys = None
+    i = None
+    j = None
+    reduced_mass = None
+    damping_coefficient = None
+    tangential_displacement = None
+    age = None
+
+    created = None
+    evicted = None
+
+    def __init__(self, kernel):
+        """
+        :param kernel: The CollisionKernel whose contact properties are used to calculate the per-pair constants.
+        """
+        self.kernel = kernel
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.i = np.zeros(0, dtype=np.intp)
+        self.j = np.zeros(0, dtype=np.intp)
+        self.reduced_mass = np.zeros(0)
+        self.damping_coefficient = np.zeros(0)
+        self.tangential_displacement = np.zeros((0, 3))
+        self.age = np.zeros(0, dtype=np.int64)
+        self.created = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, system, i, j):
+        """
+        Replaces the table contents with the given set of contacting pairs, keeping the state of existing contacts.
+
+        :param system: The ParticleSystem the indices refer to.
+        :param i: (M,) array of first particle indices of the pairs currently in contact.
+        :param j: (M,) array of second particle indices of the pairs currently in contact.
+        """
+        keys = pair_keys(i, j)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        i = np.asarray(i, dtype=np.intp)[order]
+        j = np.asarray(j, dtype=np.intp)[order]
+
+        location = np.searchsorted(self.keys, keys)
+        np.clip(location, 0, max(len(self.keys) - 1, 0), out=location)
+        if len(self.keys) > 0:
+            existing = self.keys[location] == keys
+        else:
+            existing = np.zeros(len(keys), dtype=bool)
+        new = ~existing
+        number_existing = np.count_nonzero(existing)
+
+        reduced_mass = np.empty(len(keys))
+        damping_coefficient = np.empty(len(keys))
+        tangential_displacement = np.zeros((len(keys), 3))
+        age = np.zeros(len(keys), dtype=np.int64)
+
+        old = location[existing]
+        reduced_mass[existing] = self.reduced_mass[old]
+        damping_coefficient[existing] = self.damping_coefficient[old]
+        tangential_displacement[existing] = self.tangential_displacement[old]
+        age[existing] = self.age[old] + 1
+
+        m_i = system.mass[i[new]]
+        m_j = system.mass[j[new]]
+        reduced_mass[new] = m_i * m_j / (m_i + m_j)
+        damping_coefficient[new] = self.kernel.get_damping_coefficient(system, i[new], j[new], reduced_mass[new])
+
+        self.created += len(keys) - number_existing
+        self.evicted += len(self.keys) - number_existing
+
+        self.keys = keys
+        self.i = i
+        self.j = j
+        self.reduced_mass = reduced_mass
+        self.damping_coefficient = damping_coefficient
+        self.tangential_displacement = tangential_displacement
+        self.age = age
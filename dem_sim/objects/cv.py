@@ -1,26 +1,36 @@
 import numpy as np
 
 from dem_sim.objects.collision import Collision
+from dem_sim.objects.particle_system import ParticleSystem
+from dem_sim.objects.walls import AAWallTable
 import dem_sim.util.vector_utils as vect
 from dem_sim.util.hashing_utils import commutative_cantor
 
 
-# TODO: Add broad phase for wall collisions.
-
 class CVManager:
     cvs = None
+    collisions = None
     cv_length = None
     min_bound = None
     max_bound = None
     cvs_per_edge = None
+    materials = None
 
-    # TODO: Allow collision properties to be specified.
-    def __init__(self, cvs_per_edge, max_bound=0.5, min_bound=-0.5):
+    def __init__(self, cvs_per_edge, max_bound=0.5, min_bound=-0.5, materials=None):
+        """
+        :param cvs_per_edge: Number of control volumes along each edge of the domain.
+        :param max_bound: Maximum coordinate of the domain along each axis.
+        :param min_bound: Minimum coordinate of the domain along each axis.
+        :param materials: Optional MaterialTable, from which the properties of each Collision are taken by the species
+                          of its particles. Default: the Collision defaults for every pair.
+        """
+        self.materials = materials
         self.initialize_cvs(cvs_per_edge)
         self.cv_length = (max_bound - min_bound) / cvs_per_edge
         self.min_bound = min_bound
         self.max_bound = max_bound
         self.cvs_per_edge = cvs_per_edge
+        self.collisions = {}
 
     def initialize_cvs(self, cvs_per_edge):
         self.cvs = []
@@ -51,8 +61,7 @@ class CVManager:
                 continue
 
     def get_collisions(self):
-        collision_ids = []
-        collisions = []
+        collisions = {}
         for i in range(self.cvs_per_edge):
             for j in range(self.cvs_per_edge):
                 for k in range(self.cvs_per_edge):
@@ -60,11 +69,22 @@ class CVManager:
                     for p in cv:
                         col_ps = self.get_nearby_particles([i, j, k])
                         for p2 in col_ps:
+                            if p2.pid == p.pid:
+                                continue
                             collision_id = commutative_cantor(p.pid, p2.pid)
-                            if collision_id not in collision_ids:
-                                collisions.append(Collision(p, p2))
-                                collision_ids.append(collision_id)
-        return collisions
+                            if collision_id not in collisions:
+                                # Collision objects are kept between steps for as long as the pair stays nearby.
+                                collision = self.collisions.get(collision_id)
+                                if collision is None:
+                                    collision = self.create_collision(p, p2)
+                                collisions[collision_id] = collision
+        self.collisions = collisions
+        return list(collisions.values())
+
+    def create_collision(self, p1, p2):
+        if self.materials is None:
+            return Collision(p1, p2)
+        return Collision(p1, p2, **self.materials.get_collision_properties(p1.species, p2.species))
 
     def reset(self):
         for i in range(self.cvs_per_edge):
@@ -89,3 +109,259 @@ class CVManager:
         j = int((y - y % cv_length) / cv_length)
         k = int((z - z % cv_length) / cv_length)
         return [i, j, k]
+
+
+class CellList:
+    """
+    Sort-based linear cell list.
+
+    Array-based alternative to CVManager. Particles are assigned linear cell ids in one vectorized pass and
+    counting-sorted by cell, so each cell is a contiguous slice of the sorted particle order. The grid is padded with an
+    empty layer of cells on every side so that the 27 cell neighbour stencil is a fixed table of linear offsets. Pairs
+    are enumerated with the 13 cell half of that stencil plus the pairs within each cell, so every unordered pair is
+    produced exactly once without any deduplication.
+
+    Walls can be registered with add_walls, after which each cell knows which walls pass near it and only particles in
+    those cells are returned as wall collision candidates.
+    """
+    cv_length = None
+    min_bound = None
+    max_bound = None
+    cvs_per_edge = None
+
+    particles = None
+    cell_ids = None
+    order = None
+    cell_start = None
+    cell_end = None
+    stencil = None
+    half_stencil = None
+
+    walls = None
+    wall_table = None
+    cell_walls = None
+
+    def __init__(self, cvs_per_edge, max_bound=0.5, min_bound=-0.5):
+        self.cv_length = (max_bound - min_bound) / cvs_per_edge
+        self.min_bound = min_bound
+        self.max_bound = max_bound
+        self.cvs_per_edge = cvs_per_edge
+
+        n = cvs_per_edge + 2
+        offsets = np.arange(-1, 2)
+        self.stencil = (offsets[:, None, None] * n * n + offsets[None, :, None] * n + offsets[None, None, :]).ravel()
+        # Linear offsets are ordered the same way as the (i, j, k) offsets, so the positive half is after the centre.
+        self.half_stencil = self.stencil[len(self.stencil) // 2 + 1:]
+        self.walls = []
+        self.reset()
+
+    @property
+    def number_of_cells(self):
+        return (self.cvs_per_edge + 2) ** 3
+
+    def get_cell_ids(self, positions):
+        """ Returns the padded linear cell id for each row of an (N, 3) position array. """
+        idx = np.floor((positions - self.min_bound) / self.cv_length).astype(np.intp)
+        np.clip(idx, 0, self.cvs_per_edge - 1, out=idx)
+        idx += 1
+        n = self.cvs_per_edge + 2
+        return (idx[:, 0] * n + idx[:, 1]) * n + idx[:, 2]
+
+    def add_particles(self, particles):
+        """
+        Sorts particles into cells.
+
+        :param particles: A ParticleSystem, a list of Particle objects, or an (N, 3) array of positions.
+        """
+        if isinstance(particles, ParticleSystem):
+            positions = particles.pos
+        elif isinstance(particles, np.ndarray):
+            positions = particles
+        else:
+            positions = np.array([p.pos for p in particles], dtype=float).reshape((-1, 3))
+        self.particles = particles
+
+        self.cell_ids = self.get_cell_ids(positions)
+        counts = np.bincount(self.cell_ids, minlength=self.number_of_cells)
+        self.cell_end = np.cumsum(counts)
+        self.cell_start = self.cell_end - counts
+        self.order = self.sort_by_cell(self.cell_ids)
+
+    def sort_by_cell(self, cell_ids):
+        """
+        Returns the order that sorts the particles by cell, keeping their order within each cell.
+
+        NumPy sorts 16-bit integer keys with a stable radix sort, so the ids are counting-sorted in O(N) in one 16-bit
+        pass, or two for grids of more than 65536 cells, low half first.
+        """
+        if self.number_of_cells <= 1 << 16:
+            return np.argsort(cell_ids.astype(np.uint16), kind='stable')
+        order = np.argsort((cell_ids & 0xFFFF).astype(np.uint16), kind='stable')
+        return order[np.argsort((cell_ids[order] >> 16).astype(np.uint16), kind='stable')]
+
+    def add_walls(self, walls, margin=None):
+        """
+        Registers axis-aligned walls, recording which walls pass within margin of each cell.
+
+        :param walls: A list of AAWall objects.
+        :param margin: Largest particle radius. Default: half the cell length, the largest radius the cells support.
+        """
+        if margin is None:
+            margin = self.cv_length / 2
+        self.walls = self.walls + list(walls)
+        self.wall_table = AAWallTable(self.walls)
+
+        # Cell bounds along one axis, with the boundary cells extended to hold any particles outside the domain.
+        n = self.cvs_per_edge + 2
+        lower = self.min_bound + (np.arange(n) - 1) * self.cv_length
+        upper = lower + self.cv_length
+        lower[1] = -np.inf
+        upper[n - 2] = np.inf
+
+        cell_walls = np.zeros((n, n, n, len(self.walls)), dtype=bool)
+        for w in range(len(self.walls)):
+            near = [(lower <= self.wall_table.max[w, axis] + margin) & (upper >= self.wall_table.min[w, axis] - margin)
+                    for axis in range(3)]
+            cell_walls[:, :, :, w] = near[0][:, None, None] & near[1][None, :, None] & near[2][None, None, :]
+        self.cell_walls = cell_walls.reshape((self.number_of_cells, len(self.walls)))
+
+    def get_wall_pairs(self, positions):
+        """
+        Returns candidate particle-wall pairs for the particles in cells near registered walls.
+
+        :param positions: (N, 3) array of particle positions.
+        :return: Index arrays of particles and walls.
+        """
+        if len(self.walls) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        return np.nonzero(self.cell_walls[self.get_cell_ids(positions)])
+
+    def get_cell_particles(self, cell_id):
+        """ Returns the indices of the particles in the given linear cell. """
+        return self.order[self.cell_start[cell_id]:self.cell_end[cell_id]]
+
+    def get_nearby_particles(self, idx):
+        """ Returns the indices of the particles in the 27 cells around the given [i, j, k] cell index. """
+        n = self.cvs_per_edge + 2
+        cell_id = ((idx[0] + 1) * n + idx[1] + 1) * n + idx[2] + 1
+        return np.concatenate([self.get_cell_particles(c) for c in cell_id + self.stencil])
+
+    def get_pairs(self):
+        """
+        Enumerates candidate pairs in neighbouring cells.
+
+        :return: Index arrays i, j with i < j, each unordered pair appearing exactly once.
+        """
+        if self.cell_ids is None or len(self.cell_ids) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+
+        # Pairs within a cell: each particle pairs with the particles after it in the sorted order.
+        sorted_cells = self.cell_ids[self.order]
+        sorted_positions = np.arange(len(self.order))
+        counts = self.cell_end[sorted_cells] - sorted_positions - 1
+        i_intra, j_intra = self.expand_groups(self.order, sorted_positions + 1, counts)
+
+        # Pairs between cells: each particle pairs with every particle in its half stencil of neighbouring cells.
+        neighbours = (self.cell_ids[:, np.newaxis] + self.half_stencil[np.newaxis, :]).ravel()
+        starts = self.cell_start[neighbours]
+        counts = self.cell_end[neighbours] - starts
+        i_inter, j_inter = self.expand_groups(np.repeat(np.arange(len(self.cell_ids)), len(self.half_stencil)),
+                                              starts, counts)
+
+        i = np.concatenate([i_intra, i_inter])
+        j = np.concatenate([j_intra, j_inter])
+        return np.minimum(i, j), np.maximum(i, j)
+
+    def expand_groups(self, particles, starts, counts):
+        """
+        Pairs each particle with a slice of the sorted order.
+
+        :param particles: (G,) particle index for each group.
+        :param starts: (G,) start of each group's slice in the sorted order.
+        :param counts: (G,) length of each group's slice.
+        :return: Index arrays i, j of the expanded pairs.
+        """
+        i = np.repeat(particles, counts)
+        group_offsets = np.cumsum(counts) - counts
+        j = self.order[np.repeat(starts - group_offsets, counts) + np.arange(len(i))]
+        return i, j
+
+    def get_collisions(self):
+        """ Returns Collision objects for the candidate pairs. Only available when Particle objects were added. """
+        particles = self.particles
+        if isinstance(particles, ParticleSystem):
+            particles = particles.particles
+        i, j = self.get_pairs()
+        return [Collision(particles[a], particles[b]) for a, b in zip(i, j)]
+
+    def reset(self):
+        self.particles = None
+        self.cell_ids = None
+        self.order = None
+        self.cell_start = None
+        self.cell_end = None
+
+
+class VerletList:
+    """
+    Verlet neighbour list built on top of a CellList.
+
+    Candidate pairs closer than their contact distance plus a skin distance are stored and reused until some particle
+    has moved more than half the skin since the last rebuild, at which point no pair outside the list can have come into
+    contact.
+    """
+    cell_list = None
+    skin = None
+
+    i = None
+    j = None
+    reference_pos = None
+
+    rebuild_count = None
+    steps = None
+
+    def __init__(self, cell_list, skin):
+        """
+        :param cell_list: CellList used for rebuilds. Its cells must be at least the largest diameter plus the skin.
+        :param skin: Extra distance beyond contact within which pairs are kept.
+        """
+        self.cell_list = cell_list
+        self.skin = skin
+        self.rebuild_count = 0
+        self.steps = 0
+
+    @property
+    def average_steps_between_rebuilds(self):
+        if self.rebuild_count == 0:
+            return 0
+        return self.steps / self.rebuild_count
+
+    def needs_rebuild(self, system):
+        if self.reference_pos is None or self.reference_pos.shape != system.pos.shape:
+            return True
+        displacement = system.pos - self.reference_pos
+        max_displacement_squared = np.max(np.einsum('ij,ij->i', displacement, displacement), initial=0)
+        return max_displacement_squared > (self.skin / 2) ** 2
+
+    def rebuild(self, system):
+        if len(system) > 0 and self.cell_list.cv_length < np.max(system.diameter) + self.skin:
+            print("Warning: Cell length is smaller than the largest diameter plus the skin, contacts may be missed.")
+
+        self.cell_list.add_particles(system)
+        i, j = self.cell_list.get_pairs()
+        self.cell_list.reset()
+
+        separation = system.pos[j] - system.pos[i]
+        cutoff = (system.diameter[i] + system.diameter[j]) / 2 + self.skin
+        close = np.einsum('ij,ij->i', separation, separation) < cutoff * cutoff
+        self.i = i[close]
+        self.j = j[close]
+        self.reference_pos = system.pos.copy()
+        self.rebuild_count += 1
+
+    def get_pairs(self, system):
+        """ Returns the candidate pair index arrays i, j for the current step, rebuilding the list if required. """
+        if self.needs_rebuild(system):
+            self.rebuild(system)
+        self.steps += 1
+        return self.i, self.j
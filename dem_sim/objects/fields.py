@@ -0,0 +1,371 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from dem_sim.util import vector_utils as vect
+from dem_sim.util.exceptions import ParameterException
+
+
+class Field:
+    """
+    Vector field, such as a fluid velocity, evaluated for a whole batch of positions in one call.
+
+    Subclasses implement evaluate, which takes an (N, 3) array of positions and the time and returns an (N, 3) array of
+    values. A Field can be used anywhere a get_vel_fluid callback is accepted. Given a ParticleSystem it is evaluated
+    once for every particle, and given a single Particle it returns that particle's (3,) value.
+    """
+
+    def evaluate(self, positions, time):
+        """
+        :param positions: (N, 3) array of positions.
+        :param time: The simulation time.
+        :return: (N, 3) array of field values.
+        """
+        raise NotImplementedError
+
+    def __call__(self, obj):
+        positions = np.asarray(obj.pos, dtype=float)
+        if positions.ndim == 1:
+            return self.evaluate(positions[np.newaxis], obj.time)[0]
+        return self.evaluate(positions, obj.time)
+
+
+class FunctionField(Field):
+    """ Field defined by a vectorized function of an (N, 3) position array, and optionally time. """
+    function = None
+    time_dependent = None
+
+    def __init__(self, function, time_dependent=False):
+        """
+        :param function: A function taking (N, 3) positions, and the time if time_dependent, and returning (N, 3)
+                         values.
+        :param time_dependent: Whether the function takes the time as a second argument.
+        """
+        self.function = function
+        self.time_dependent = time_dependent
+
+    def evaluate(self, positions, time):
+        if self.time_dependent:
+            return np.asarray(self.function(positions, time), dtype=float)
+        return np.asarray(self.function(positions), dtype=float)
+
+
+class UniformField(Field):
+    """
+    Field that is the same everywhere and only depends on time, such as gravity or another uniform body force.
+
+    It is evaluated once per time and returns a single (3,) value, which is broadcast across every particle. The last
+    value is cached, so particles stepped one at a time also only evaluate it once per step.
+    """
+    function = None
+    last_time = None
+    last_value = None
+
+    def __init__(self, function):
+        """
+        :param function: A function taking the time and returning a (3,) value.
+        """
+        self.function = function
+
+    def evaluate(self, positions, time):
+        if self.last_time is None or time != self.last_time:
+            self.last_value = np.array(self.function(time), dtype=float)
+            self.last_time = time
+        return self.last_value
+
+    def __call__(self, obj):
+        return self.evaluate(None, obj.time)
+
+
+class ParticleCallbackField(Field):
+    """ Adapter that evaluates a per-particle callback, taking a Particle and returning a (3,) value, as a Field. """
+    callback = None
+    particles = None
+
+    def __init__(self, callback, particles):
+        """
+        :param callback: A function, or a list of one function per particle, taking a Particle and returning (3,).
+        :param particles: The particles, in system order, that the callback is evaluated for.
+        """
+        self.callback = callback
+        self.particles = particles
+
+    def evaluate(self, positions, time):
+        if callable(self.callback):
+            return np.array([self.callback(p) for p in self.particles], dtype=float)
+        return np.array([callback(p) for callback, p in zip(self.callback, self.particles)], dtype=float)
+
+
+# Node offsets of the eight corners of a lattice cell.
+cell_corners = [(dx, dy, dz) for dx in (0, 1) for dy in (0, 1) for dz in (0, 1)]
+
+
+def trilinear(values, cells, fractions):
+    """
+    Trilinearly interpolates values held on the nodes of a regular lattice.
+
+    :param values: (3, nx, ny, nz) array of node values, each component stored contiguously.
+    :param cells: (N, 3) integer array of the lower corner node of the cell containing each point.
+    :param fractions: (N, 3) array of the position of each point within its cell, from 0 to 1 along each axis.
+    :return: (N, 3) array of interpolated values.
+    """
+    _, _, ny, nz = values.shape
+    flat = values.reshape((3, -1))
+    base = (cells[:, 0] * ny + cells[:, 1]) * nz + cells[:, 2]
+    weights = [(1 - fractions[:, d], fractions[:, d]) for d in range(3)]
+    result = np.zeros((len(cells), 3))
+    # Gathering one component at a time from flat arrays is much faster than indexing the 4D array directly.
+    for dx, dy, dz in cell_corners:
+        index = base + (dx * ny + dy) * nz + dz
+        weight = weights[0][dx] * weights[1][dy] * weights[2][dz]
+        for d in range(3):
+            result[:, d] += np.take(flat[d], index) * weight
+    return result
+
+
+def trilinear_nodes(values, cells, fractions):
+    """
+    Trilinearly interpolates values held on the nodes of a regular lattice, gathering only the corner nodes of the cells
+    containing the points, so that only those parts of a memory-mapped array are read.
+
+    :param values: (nx, ny, nz, 3) array of node values, e.g. memory-mapped from a .npy file.
+    :param cells: (N, 3) integer array of the lower corner node of the cell containing each point.
+    :param fractions: (N, 3) array of the position of each point within its cell, from 0 to 1 along each axis.
+    :return: (N, 3) array of interpolated values.
+    """
+    weights = [(1 - fractions[:, d], fractions[:, d]) for d in range(3)]
+    result = np.zeros((len(cells), 3))
+    for dx, dy, dz in cell_corners:
+        weight = weights[0][dx] * weights[1][dy] * weights[2][dz]
+        result += values[cells[:, 0] + dx, cells[:, 1] + dy, cells[:, 2] + dz] * weight[:, np.newaxis]
+    return result
+
+
+class GriddedField(Field):
+    """
+    Time independent field sampled once onto a regular lattice, and served by trilinear interpolation.
+
+    This trades a little accuracy for speed with flows that are expensive to evaluate, such as analytical flows with
+    many transcendental functions. The lattice is either sampled in full when the GriddedField is created, or, with a
+    block_size, lazily in cubic blocks of cells the first time a point falls in them. At most max_blocks blocks are
+    then kept, and the least recently used block is evicted to make room for a new one. Points outside the lattice are
+    evaluated with the source directly.
+
+    estimate_error() reports the largest interpolation error against the source.
+    """
+    source = None
+    min = None
+    max = None
+    resolution = None
+    spacing = None
+
+    values = None
+    block_size = None
+    max_blocks = None
+    blocks = None
+
+    evaluations = None
+    hits = None
+    misses = None
+    max_error = None
+
+    def __init__(self, source, bounds_min, bounds_max, resolution=32, block_size=None, max_blocks=64):
+        """
+        :param source: A Field, or a function taking an (N, 3) position array and returning (N, 3) values.
+        :param bounds_min: Minimum corner of the lattice.
+        :param bounds_max: Maximum corner of the lattice.
+        :param resolution: Number of cells along each axis, a single number or one per axis.
+        :param block_size: If given, number of cells along each side of a lazily sampled block.
+        :param max_blocks: Maximum number of lazily sampled blocks kept.
+        """
+        if isinstance(source, Field):
+            if getattr(source, "time_dependent", False):
+                raise ParameterException("A GriddedField cannot cache a time dependent field.")
+            self.source = lambda positions: source.evaluate(positions, 0)
+        else:
+            self.source = source
+        self.min = np.array(bounds_min, dtype=float)
+        self.max = np.array(bounds_max, dtype=float)
+        self.resolution = np.broadcast_to(np.array(resolution, dtype=np.int64), (3,)).copy()
+        if np.any(self.max <= self.min):
+            raise ParameterException("GriddedField bounds_max must be greater than bounds_min on every axis.")
+        if np.any(self.resolution < 1):
+            raise ParameterException("GriddedField resolution must be at least 1.")
+        self.spacing = (self.max - self.min) / self.resolution
+
+        self.evaluations = 0
+        self.hits = 0
+        self.misses = 0
+        if block_size is None:
+            self.values = self.sample(np.zeros(3, dtype=np.int64), self.resolution + 1)
+        else:
+            if block_size < 1 or max_blocks < 1:
+                raise ParameterException("GriddedField block_size and max_blocks must be at least 1.")
+            self.block_size = int(block_size)
+            self.max_blocks = int(max_blocks)
+            self.blocks = OrderedDict()
+
+    def sample(self, start, nodes):
+        """ Evaluates the source on the box of lattice nodes starting at node start, nodes long along each axis. """
+        axes = [self.min[d] + (start[d] + np.arange(nodes[d])) * self.spacing[d] for d in range(3)]
+        points = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape((-1, 3))
+        self.evaluations += len(points)
+        values = np.asarray(self.source(points), dtype=float).reshape(tuple(nodes) + (3,))
+        return np.ascontiguousarray(np.moveaxis(values, -1, 0))
+
+    def get_block(self, key):
+        """ Returns the node values of a block, sampling it, and evicting the least recently used block, if needed. """
+        block = self.blocks.get(key)
+        if block is not None:
+            self.hits += 1
+            self.blocks.move_to_end(key)
+            return block
+        self.misses += 1
+        start = np.array(key, dtype=np.int64) * self.block_size
+        # Each block holds the nodes on both of its faces, so that every one of its cells can be interpolated alone.
+        nodes = np.minimum(self.block_size, self.resolution - start) + 1
+        block = self.sample(start, nodes)
+        self.blocks[key] = block
+        if len(self.blocks) > self.max_blocks:
+            self.blocks.popitem(last=False)
+        return block
+
+    def evaluate(self, positions, time):
+        positions = np.asarray(positions, dtype=float)
+        scaled = (positions - self.min) / self.spacing
+        inside = np.all((scaled >= 0) & (scaled <= self.resolution), axis=1)
+        result = np.empty(positions.shape)
+        if not np.all(inside):
+            result[~inside] = self.source(positions[~inside])
+            scaled = scaled[inside]
+
+        # Points on the maximum faces belong to the last cell.
+        cells = np.minimum(scaled.astype(np.int64), self.resolution - 1)
+        fractions = scaled - cells
+        if self.blocks is None:
+            result[inside] = trilinear(self.values, cells, fractions)
+            return result
+
+        inside_result = np.empty((len(cells), 3))
+        block_cells = cells // self.block_size
+        keys, inverse = np.unique(block_cells, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        for n, key in enumerate(keys):
+            rows = np.nonzero(inverse == n)[0]
+            block = self.get_block(tuple(key.tolist()))
+            inside_result[rows] = trilinear(block, cells[rows] - key * self.block_size, fractions[rows])
+        result[inside] = inside_result
+        return result
+
+    def estimate_error(self, samples=10000, seed=0):
+        """
+        Estimates the largest interpolation error by comparing against the source at random points in the lattice.
+
+        A separate random generator is used, so the random state of the simulation is not affected.
+
+        :param samples: Number of random points.
+        :param seed: Seed of the random points.
+        :return: The largest error magnitude found, also stored as max_error.
+        """
+        rng = np.random.default_rng(seed)
+        points = self.min + rng.random((samples, 3)) * (self.max - self.min)
+        exact = np.asarray(self.source(points), dtype=float)
+        self.max_error = np.max(vect.mag_rows(self.evaluate(points, 0) - exact))
+        return self.max_error
+
+    def report(self):
+        print("Gridded field, resolution: {0}, source evaluations: {1}.".format(
+            " x ".join(str(r) for r in self.resolution), self.evaluations))
+        if self.blocks is not None:
+            print("Blocks, kept: {0}, hits: {1}, misses: {2}.".format(len(self.blocks), self.hits, self.misses))
+        if self.max_error is not None:
+            print("Max interpolation error: {0:.3g}.".format(self.max_error))
+
+
+class SnapshotField(Field):
+    """
+    Time dependent field streamed from a sequence of snapshots on disk, such as the output of a CFD run.
+
+    Each snapshot is a .npy file holding an (nx + 1, ny + 1, nz + 1, 3) array of values on the nodes of the same
+    regular lattice, e.g. written with numpy.save. Snapshots are memory-mapped, and only the nodes of the cells holding
+    the queried points are read from them. Only the two snapshots bracketing the time being queried are kept mapped,
+    the others are closed as time moves on, so datasets much larger than the available memory can be used. Queries are
+    interpolated trilinearly in space and linearly in time. Before the first and after the last snapshot the nearest
+    one is held, and points outside the lattice take the value at the nearest point on its boundary.
+    """
+    filenames = None
+    times = None
+    min = None
+    max = None
+    resolution = None
+    spacing = None
+
+    resident = None
+    loads = None
+
+    def __init__(self, filenames, times, bounds_min, bounds_max):
+        """
+        :param filenames: The snapshot .npy file names, in time order.
+        :param times: The time of each snapshot.
+        :param bounds_min: Minimum corner of the lattice.
+        :param bounds_max: Maximum corner of the lattice.
+        """
+        self.filenames = list(filenames)
+        self.times = np.array(times, dtype=float)
+        if len(self.filenames) == 0 or len(self.filenames) != len(self.times):
+            raise ParameterException("A SnapshotField needs one time for each of at least one snapshot.")
+        if np.any(np.diff(self.times) <= 0):
+            raise ParameterException("SnapshotField times must be increasing.")
+        self.min = np.array(bounds_min, dtype=float)
+        self.max = np.array(bounds_max, dtype=float)
+        if np.any(self.max <= self.min):
+            raise ParameterException("SnapshotField bounds_max must be greater than bounds_min on every axis.")
+
+        shape = np.load(self.filenames[0], mmap_mode='r').shape
+        if len(shape) != 4 or shape[3] != 3 or min(shape[:3]) < 2:
+            raise ParameterException("Snapshots must be (nx + 1, ny + 1, nz + 1, 3) arrays with at least 2 nodes along "
+                                     "each axis, not {0}.".format(shape))
+        self.resolution = np.array(shape[:3], dtype=np.int64) - 1
+        self.spacing = (self.max - self.min) / self.resolution
+        self.resident = {}
+        self.loads = 0
+
+    def get_snapshot(self, index):
+        """ Returns the memory-mapped (nx + 1, ny + 1, nz + 1, 3) node values of a snapshot, mapping it if needed. """
+        snapshot = self.resident.get(index)
+        if snapshot is None:
+            snapshot = np.load(self.filenames[index], mmap_mode='r')
+            if snapshot.shape != tuple(self.resolution + 1) + (3,):
+                raise ParameterException("Snapshot {0} has shape {1}, not {2}.".format(
+                    self.filenames[index], snapshot.shape, tuple(self.resolution + 1) + (3,)))
+            self.resident[index] = snapshot
+            self.loads += 1
+        return snapshot
+
+    def get_bracket(self, time):
+        """ Returns the indices of the snapshots before and after time, and the weight of the one after. """
+        after = int(np.searchsorted(self.times, time, side='right'))
+        if after == 0:
+            return 0, 0, 0
+        if after == len(self.times):
+            return after - 1, after - 1, 0
+        weight = (time - self.times[after - 1]) / (self.times[after] - self.times[after - 1])
+        return after - 1, after, weight
+
+    def evaluate(self, positions, time):
+        before, after, weight = self.get_bracket(time)
+        for index in list(self.resident):
+            if index != before and index != after:
+                del self.resident[index]
+
+        scaled = np.clip((np.asarray(positions, dtype=float) - self.min) / self.spacing, 0, self.resolution)
+        cells = np.minimum(scaled.astype(np.int64), self.resolution - 1)
+        fractions = scaled - cells
+        result = trilinear_nodes(self.get_snapshot(before), cells, fractions)
+        if weight > 0:
+            result = (1 - weight) * result + weight * trilinear_nodes(self.get_snapshot(after), cells, fractions)
+        return result
+
+    def report(self):
+        print("Snapshot field, snapshots: {0}, loads: {1}, resident: {2}.".format(len(self.filenames), self.loads,
+                                                                                 len(self.resident)))
@@ -0,0 +1,203 @@
+import numpy as np
+
+
+class History:
+    """
+    Record of times, positions, and velocities held in preallocated arrays.
+
+    States of any shape can be recorded, (3,) for a single particle or (N, 3) for a whole ParticleSystem. The arrays
+    double in capacity whenever they fill up, so recording is amortised O(1) without creating an object per state.
+    times, pos_history, and vel_history are views of the recorded part of the arrays, and are only valid until the next
+    time the arrays grow.
+
+    record() only keeps every stride-th state offered to it, and, with an interval, only states at least interval
+    apart in time.
+    """
+    count = None
+    _times = None
+    _pos = None
+    _vel = None
+
+    stride = None
+    interval = None
+    calls = None
+    last_time = None
+
+    def __init__(self, shape=(3,), capacity=64, stride=1, interval=None):
+        """
+        :param shape: Shape of a single position or velocity state.
+        :param capacity: Number of states to allocate space for initially.
+        :param stride: Record every stride-th state offered.
+        :param interval: If given, minimum time between recorded states.
+        """
+        capacity = max(int(capacity), 1)
+        self.count = 0
+        self.stride = stride
+        self.interval = interval
+        self.calls = 0
+        self._times = np.empty(capacity)
+        self._pos = np.empty((capacity,) + tuple(shape))
+        self._vel = np.empty((capacity,) + tuple(shape))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self):
+        return len(self._times)
+
+    @property
+    def times(self):
+        return self._times[:self.count]
+
+    @property
+    def pos_history(self):
+        return self._pos[:self.count]
+
+    @property
+    def vel_history(self):
+        return self._vel[:self.count]
+
+    def reserve(self, capacity):
+        """ Grows the arrays so that at least capacity states fit without further allocation. """
+        if capacity <= self.capacity:
+            return
+        times = np.empty(capacity)
+        pos = np.empty((capacity,) + self._pos.shape[1:])
+        vel = np.empty((capacity,) + self._vel.shape[1:])
+        times[:self.count] = self.times
+        pos[:self.count] = self.pos_history
+        vel[:self.count] = self.vel_history
+        self._times = times
+        self._pos = pos
+        self._vel = vel
+
+    def record(self, time, pos, vel):
+        """
+        Offers a state for recording, which is recorded if the stride and interval allow it.
+
+        :return: Whether the state was recorded.
+        """
+        self.calls += 1
+        if (self.calls - 1) % self.stride != 0:
+            return False
+        # Small tolerance so that accumulated timestep rounding does not skip a state.
+        if self.interval is not None and self.last_time is not None and \
+                time - self.last_time < self.interval * (1 - 1e-9):
+            return False
+        self.last_time = time
+        self.append(time, pos, vel)
+        return True
+
+    def clear(self):
+        """ Removes every recorded state and restarts the stride and interval counting. """
+        self.count = 0
+        self.calls = 0
+        self.last_time = None
+
+    def append(self, time, pos, vel):
+        if self.count == self.capacity:
+            self.reserve(2 * self.capacity)
+        self._times[self.count] = time
+        self._pos[self.count] = pos
+        self._vel[self.count] = vel
+        self.count += 1
+
+    def extend(self, times, pos, vel):
+        """ Records a sequence of states at once from (steps,) times and (steps, ...) positions and velocities. """
+        count = self.count + len(times)
+        if count > self.capacity:
+            self.reserve(max(count, 2 * self.capacity))
+        self._times[self.count:count] = times
+        self._pos[self.count:count] = pos
+        self._vel[self.count:count] = vel
+        self.count = count
+
+
+class RingHistory(History):
+    """
+    History that only keeps the most recent length states.
+
+    Every state is written twice, length apart, into arrays of twice the length. The most recent states then always
+    form one contiguous block, so times, pos_history, and vel_history remain views in chronological order.
+    """
+    length = None
+    position = None
+
+    def __init__(self, length, shape=(3,), stride=1, interval=None):
+        """
+        :param length: Number of most recent states kept.
+        :param shape: Shape of a single position or velocity state.
+        :param stride: Record every stride-th state offered.
+        :param interval: If given, minimum time between recorded states.
+        """
+        super().__init__(shape, 2 * length, stride, interval)
+        self.length = length
+        self.position = 0
+
+    @property
+    def window(self):
+        end = self.position + self.length if self.position > 0 else 2 * self.length
+        return slice(end - self.count, end)
+
+    @property
+    def times(self):
+        return self._times[self.window]
+
+    @property
+    def pos_history(self):
+        return self._pos[self.window]
+
+    @property
+    def vel_history(self):
+        return self._vel[self.window]
+
+    def reserve(self, capacity):
+        pass
+
+    def clear(self):
+        super().clear()
+        self.position = 0
+
+    def append(self, time, pos, vel):
+        for index in [self.position, self.position + self.length]:
+            self._times[index] = time
+            self._pos[index] = pos
+            self._vel[index] = vel
+        self.position = (self.position + 1) % self.length
+        self.count = min(self.count + 1, self.length)
+
+    def extend(self, times, pos, vel):
+        start = max(len(times) - self.length, 0)
+        for time, p, v in zip(times[start:], pos[start:], vel[start:]):
+            self.append(time, p, v)
+
+
+class RecordingPolicy:
+    """
+    Describes which states a particle or system records, and how many it keeps.
+
+    By default every step is recorded. stride records every stride-th step, interval records states at least interval
+    apart in simulation time, and length keeps only the most recent length states in a ring buffer. They can be
+    combined, e.g. RecordingPolicy(interval=1 / 60) for 60 fps output, or RecordingPolicy(length=15) for a trail of
+    the last 15 steps.
+    """
+    stride = None
+    interval = None
+    length = None
+
+    def __init__(self, stride=1, interval=None, length=None):
+        """
+        :param stride: Record every stride-th step.
+        :param interval: If given, minimum simulation time between recorded states.
+        :param length: If given, number of most recent states kept.
+        """
+        self.stride = stride
+        self.interval = interval
+        self.length = length
+
+    def create_history(self, shape=(3,)):
+        """ Creates an empty History that follows this policy for states of the given shape. """
+        if self.length is not None:
+            return RingHistory(self.length, shape, self.stride, self.interval)
+        return History(shape, stride=self.stride, interval=self.interval)
@@ -0,0 +1,194 @@
+import math
+
+import numpy as np
+
+from dem_sim.util.exceptions import ParameterException
+
+# Contact properties held for every pair of materials.
+pair_properties = ["stiffness", "restitution", "friction_coefficient", "friction_stiffness"]
+
+
+class Material:
+    """ Contact properties of one particle species or wall material. """
+    name = None
+    stiffness = None
+    restitution = None
+    friction_coefficient = None
+    friction_stiffness = None
+
+    def __init__(self, name=None, stiffness=1e5, restitution=0.8, friction_coefficient=0.6, friction_stiffness=1e5):
+        """
+        :param name: Optional name, used when printing the table.
+        :param stiffness: Normal contact stiffness.
+        :param restitution: Coefficient of restitution.
+        :param friction_coefficient: Coulomb friction coefficient, or None for frictionless contacts.
+        :param friction_stiffness: Tangential contact stiffness, or None for frictionless contacts.
+        """
+        if not 0 < restitution <= 1:
+            raise ParameterException("Restitution must be in (0, 1].")
+        self.name = name
+        self.stiffness = stiffness
+        self.restitution = restitution
+        self.friction_coefficient = friction_coefficient
+        self.friction_stiffness = friction_stiffness
+
+
+def calculate_damping_factor(stiffness, restitution):
+    """
+    Returns the factor that gives the damping coefficient of a contact when multiplied by the square root of its
+    reduced mass.
+    """
+    ln_rest = np.log(restitution)
+    return -2 * ln_rest * np.sqrt(stiffness / (math.pi ** 2 + ln_rest ** 2))
+
+
+class MaterialTable:
+    """
+    Registry of materials, with the contact coefficients of every pair of materials precomputed into tables.
+
+    Every particle of a ParticleSystem has an integer species id indexing the particle materials, and every wall has an
+    integer material id indexing the wall materials. The particle-particle coefficients are held in (S, S) arrays and
+    the particle-wall coefficients in (S, W) arrays, so the collision kernels gather them by index for each contact.
+    Damping is held as a factor that is multiplied by the square root of the reduced mass of the contact.
+
+    The coefficients of two different materials are mixed: stiffnesses as springs in series, scaled so that a material
+    in contact with itself keeps its own stiffness, and the restitution and friction coefficients by their geometric
+    mean. Mixed values can be replaced with set_pair and set_wall_pair. Wall material 0 is always present and makes
+    each species collide with walls using its own properties.
+    """
+    materials = None
+    wall_materials = None
+
+    stiffness = None
+    restitution = None
+    friction_coefficient = None
+    friction_stiffness = None
+    damping_factor = None
+
+    wall_stiffness = None
+    wall_restitution = None
+    wall_friction_coefficient = None
+    wall_friction_stiffness = None
+    wall_damping_factor = None
+
+    def __init__(self, materials=None):
+        """
+        :param materials: Optional list of particle Materials, given species ids in order.
+        """
+        self.materials = []
+        self.wall_materials = [None]
+        for name in pair_properties:
+            setattr(self, name, np.zeros((0, 0)))
+            setattr(self, "wall_" + name, np.zeros((0, 1)))
+        self.damping_factor = np.zeros((0, 0))
+        self.wall_damping_factor = np.zeros((0, 1))
+        for material in materials or []:
+            self.add(material)
+
+    def __len__(self):
+        return len(self.materials)
+
+    @staticmethod
+    def get_values(material):
+        """ Returns the contact properties of a material as an array, with no friction stored as 0. """
+        return np.array([getattr(material, name) or 0 for name in pair_properties], dtype=float)
+
+    @staticmethod
+    def mix(values_a, values_b):
+        """ Mixes the contact property arrays of two materials, or rows of materials. """
+        stiffness_a, restitution_a, friction_a, friction_stiffness_a = values_a
+        stiffness_b, restitution_b, friction_b, friction_stiffness_b = values_b
+        with np.errstate(divide='ignore', invalid='ignore'):
+            friction_stiffness = np.nan_to_num(2 * friction_stiffness_a * friction_stiffness_b /
+                                               (friction_stiffness_a + friction_stiffness_b))
+        return np.array([2 * stiffness_a * stiffness_b / (stiffness_a + stiffness_b),
+                         np.sqrt(restitution_a * restitution_b),
+                         np.sqrt(friction_a * friction_b),
+                         friction_stiffness])
+
+    def add(self, material):
+        """
+        Registers a particle material.
+
+        :param material: The Material.
+        :return: The species id of the material.
+        """
+        species = len(self.materials)
+        self.materials.append(material)
+        values = self.get_values(material)
+        existing = np.array([self.get_values(m) for m in self.materials]).T
+
+        for name, column in zip(pair_properties, self.mix(values[:, np.newaxis], existing)):
+            table = np.zeros((species + 1, species + 1))
+            table[:species, :species] = getattr(self, name)
+            table[species, :] = column
+            table[:, species] = column
+            setattr(self, name, table)
+
+        wall_values = np.array([values if m is None else self.get_values(m) for m in self.wall_materials]).T
+        for name, row in zip(pair_properties, self.mix(values[:, np.newaxis], wall_values)):
+            setattr(self, "wall_" + name, np.vstack([getattr(self, "wall_" + name), row]))
+        self.update_damping()
+        return species
+
+    def add_wall(self, material):
+        """
+        Registers a wall material.
+
+        :param material: The Material.
+        :return: The wall material id, to be given to AAWall.
+        """
+        wall = len(self.wall_materials)
+        self.wall_materials.append(material)
+        values = self.get_values(material)
+        species_values = np.array([self.get_values(m) for m in self.materials]).T.reshape((len(pair_properties), -1))
+        for name, column in zip(pair_properties, self.mix(species_values, values[:, np.newaxis])):
+            setattr(self, "wall_" + name, np.column_stack([getattr(self, "wall_" + name), column]))
+        self.update_damping()
+        return wall
+
+    def set_pair(self, species_a, species_b, **properties):
+        """ Replaces mixed contact properties, e.g. restitution=0.5, between two particle species. """
+        for name, value in properties.items():
+            self.check_property(name, value)
+        for name, value in properties.items():
+            getattr(self, name)[species_a, species_b] = value or 0
+            getattr(self, name)[species_b, species_a] = value or 0
+        self.update_damping()
+
+    def set_wall_pair(self, species, wall, **properties):
+        """ Replaces mixed contact properties, e.g. friction_coefficient=0.2, between a species and a wall material. """
+        for name, value in properties.items():
+            self.check_property(name, value)
+        for name, value in properties.items():
+            getattr(self, "wall_" + name)[species, wall] = value or 0
+        self.update_damping()
+
+    @staticmethod
+    def check_property(name, value):
+        if name not in pair_properties:
+            raise ParameterException("Unknown contact property: {0}.".format(name))
+        if name == "restitution" and (value is None or not 0 < value <= 1):
+            raise ParameterException("Restitution must be in (0, 1].")
+
+    def update_damping(self):
+        self.damping_factor = calculate_damping_factor(self.stiffness, self.restitution)
+        self.wall_damping_factor = calculate_damping_factor(self.wall_stiffness, self.wall_restitution)
+
+    def get_collision_properties(self, species_a, species_b):
+        """ Returns the contact properties of a pair of species as keyword arguments for a Collision. """
+        return {name: getattr(self, name)[species_a, species_b] for name in pair_properties}
+
+    def get_wall_collision_properties(self, species, wall):
+        """ Returns the contact properties of a species and a wall material as keyword arguments for an
+        AAWallCollision. """
+        return {name: getattr(self, "wall_" + name)[species, wall] for name in pair_properties}
+
+    @property
+    def max_stiffness(self):
+        """ Largest normal or tangential stiffness of any contact, which limits the stable timestep. """
+        return max(np.max(self.stiffness, initial=0), np.max(self.friction_stiffness, initial=0))
+
+    @property
+    def max_wall_stiffness(self):
+        return max(np.max(self.wall_stiffness, initial=0), np.max(self.wall_friction_stiffness, initial=0))
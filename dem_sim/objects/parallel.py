@@ -0,0 +1,267 @@
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from dem_sim.objects.timestep import TimestepController
+from dem_sim.util.exceptions import ParameterException
+
+
+class ParallelSimulation:
+    """
+    Runs a Simulation with its domain split into slabs along x, one slab per worker process.
+
+    The particle state arrays are moved into shared memory, so every worker sees the current state of every particle.
+    Each step a worker takes ownership of the particles whose cell lies in its slab, reads the particles in one layer
+    of halo cells either side, calculates the collision forces on the particles it owns, and then integrates them.
+    Particles that cross a slab boundary are owned by the neighbouring worker from the next step on. Forces for pairs
+    straddling a boundary are calculated by both workers. Each worker accumulates its forces into a private buffer and
+    only copies the rows of the particles it owns into the shared force array, so no two workers ever write to the same
+    row.
+
+    Contacts are calculated without the Simulation's ContactRegistry, which holds no state the forces depend on. The
+    workers report their contact counts and smallest contact reduced mass back every step, so that the Simulation's
+    wall contact counts are kept. A TimestepController can drive run(), with the contacts that could form within each
+    step found in this process before the step. Verlet lists, sleeping particles, and threads are not supported.
+
+    The fields are evaluated in this process before the workers move any particle, and handed to the workers through
+    shared memory, so the held field samples stay in this process and are saved with every checkpoint.
+
+    The Simulation must be resumed from a checkpoint before it is wrapped, as resuming replaces some system arrays.
+
+    Workers are forked from the current process, so this is only available on platforms that support fork.
+    """
+    sim = None
+    workers = None
+    slab_bounds = None
+
+    shared = None
+    processes = None
+    barrier = None
+    worker_barrier = None
+    delta_t = None
+    running = None
+
+    # Gravity and fluid velocity of every particle for the current step.
+    gravity = None
+    vel_fluid = None
+
+    # Per-worker pair contacts, wall candidates, and wall contacts, and smallest contact reduced mass, of the last step.
+    counts = None
+    min_masses = None
+    pair_contacts = None
+
+    # Arrays moved into shared memory.
+    shared_arrays = ["pos", "vel", "forces", "diameter", "density", "fluid_viscosity", "species", "mass", "tau"]
+
+    def __init__(self, sim, workers=2):
+        """
+        :param sim: The Simulation to run. Its system arrays are replaced by shared memory arrays with the same values.
+        :param workers: Number of worker processes. Must not be more than the number of cells along x.
+        """
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise ParameterException("ParallelSimulation requires the fork start method.")
+        for option, name in [(sim.verlet, "Verlet lists"), (sim.sleep, "sleeping particles"), (sim.threads, "threads")]:
+            if option is not None:
+                raise ParameterException("ParallelSimulation does not support {0}.".format(name))
+        if workers > sim.cell_list.cvs_per_edge:
+            raise ParameterException("Cannot split {0} cells between {1} workers.".format(sim.cell_list.cvs_per_edge,
+                                                                                          workers))
+
+        self.sim = sim
+        self.workers = workers
+        self.slab_bounds = np.round(np.linspace(0, sim.cell_list.cvs_per_edge, workers + 1)).astype(np.intp)
+
+        self.shared = []
+        for name in self.shared_arrays:
+            setattr(sim.system, name, self.create_shared(getattr(sim.system, name)))
+        self.counts = self.create_shared(np.zeros((workers, 3), dtype=np.int64))
+        self.min_masses = self.create_shared(np.full(workers, np.inf))
+        self.pair_contacts = 0
+        self.gravity = self.create_shared(np.zeros_like(sim.system.pos))
+        self.vel_fluid = self.create_shared(np.zeros_like(sim.system.pos))
+
+        context = multiprocessing.get_context("fork")
+        self.barrier = context.Barrier(workers + 1)
+        self.worker_barrier = context.Barrier(workers)
+        self.delta_t = context.Value('d', 0, lock=False)
+        self.running = context.Value('b', 1, lock=False)
+        self.processes = [context.Process(target=self.run_worker, args=(w,), daemon=True) for w in range(workers)]
+        for process in self.processes:
+            process.start()
+
+    def create_shared(self, array):
+        """ Returns a copy of an array in shared memory. """
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+        shared_array[:] = array
+        self.shared.append(shm)
+        return shared_array
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_slabs(self, positions):
+        """ Returns the x cell index and owning worker of each particle. """
+        cell_list = self.sim.cell_list
+        x_cells = np.floor((positions[:, 0] - cell_list.min_bound) / cell_list.cv_length).astype(np.intp)
+        np.clip(x_cells, 0, cell_list.cvs_per_edge - 1, out=x_cells)
+        return x_cells, np.searchsorted(self.slab_bounds, x_cells, side='right') - 1
+
+    def run_worker(self, worker):
+        sim = self.sim
+        system = sim.system
+        # History is recorded by the parent process.
+        system.record_history = False
+        lower = self.slab_bounds[worker]
+        upper = self.slab_bounds[worker + 1]
+        forces = np.zeros_like(system.forces)
+
+        try:
+            while True:
+                self.barrier.wait()
+                if not self.running.value:
+                    return
+                delta_t = self.delta_t.value
+
+                x_cells, owners = self.get_slabs(system.pos)
+                owned = np.nonzero(owners == worker)[0]
+                local = np.nonzero((x_cells >= lower - 1) & (x_cells <= upper))[0]
+                is_owned = owners == worker
+
+                # Forces are accumulated over whole columns, so they are collected privately and only the owned rows
+                # are added to the shared array.
+                forces[:] = 0
+
+                # Particle-particle collisions between owned and halo particles.
+                sim.cell_list.add_particles(system.pos[local])
+                i, j = sim.cell_list.get_pairs()
+                sim.cell_list.reset()
+                i, j, force = sim.kernel.get_pair_forces(system, local[i], local[j], delta_t)
+                system.add_forces(i, -force, out=forces)
+                system.add_forces(j, force, out=forces)
+
+                # Pairs straddling two slabs are counted by the worker owning their first particle.
+                counted = is_owned[i]
+                m_i = system.mass[i[counted]]
+                m_j = system.mass[j[counted]]
+                self.min_masses[worker] = np.min(m_i * m_j / (m_i + m_j), initial=np.inf)
+
+                # Particle-wall collisions for owned particles.
+                particles, walls = sim.cell_list.get_wall_pairs(system.pos[owned])
+                wall_contacts = 0
+                if len(particles) > 0:
+                    contact_particles, _, force = sim.wall_kernel.get_wall_forces(system, sim.cell_list.wall_table,
+                                                                                  owned[particles], walls, delta_t)
+                    system.add_forces(contact_particles, force, out=forces)
+                    wall_contacts = len(contact_particles)
+                self.counts[worker] = [np.count_nonzero(counted), len(particles), wall_contacts]
+                system.forces[owned] += forces[owned]
+
+                # No particle may move until every worker has finished reading positions.
+                self.worker_barrier.wait()
+                system.integrate(delta_t, sim.implicit, owned, self.gravity, self.vel_fluid)
+                self.barrier.wait()
+        except Exception:
+            self.barrier.abort()
+            self.worker_barrier.abort()
+            raise
+
+    def step(self, delta_t):
+        # The fields are evaluated at the end of the step with the positions at its start, as in Simulation.iterate.
+        system = self.sim.system
+        system.time += delta_t
+        self.gravity[:], self.vel_fluid[:] = system.get_fields()
+
+        self.delta_t.value = delta_t
+        self.barrier.wait()
+        self.barrier.wait()
+        self.sim.pairs = None
+
+        if system.record_history:
+            system.record_state()
+
+        pair_contacts, wall_candidates, wall_contacts = np.sum(self.counts, axis=0).tolist()
+        self.pair_contacts = pair_contacts
+        self.sim.wall_candidates.append(wall_candidates)
+        self.sim.wall_contacts.append(wall_contacts)
+
+    def run(self, end_time, timestep, callback=None, checkpointer=None):
+        """
+        Steps the simulation until the system time reaches end_time, the same way as Simulation.run.
+
+        :param end_time: The time to stop at.
+        :param timestep: A fixed timestep, or a TimestepController to choose the timestep for every step.
+        :param callback: Optional function called with this ParallelSimulation after every step.
+        :param checkpointer: Optional Checkpointer given the chance to save the wrapped Simulation after every step.
+        """
+        tolerance = 1e-12 * max(abs(end_time), 1)
+        while end_time - self.system.time > tolerance:
+            remaining = end_time - self.system.time
+            if isinstance(timestep, TimestepController):
+                delta_t = timestep.get_timestep(self, remaining)
+            else:
+                delta_t = min(timestep, remaining)
+            self.step(delta_t)
+            if callback is not None:
+                callback(self)
+            if checkpointer is not None:
+                checkpointer.update(self.sim, timestep if isinstance(timestep, TimestepController) else None)
+
+    # The parts of the wrapped Simulation a TimestepController reads.
+
+    @property
+    def system(self):
+        return self.sim.system
+
+    @property
+    def kernel(self):
+        return self.sim.kernel
+
+    @property
+    def wall_kernel(self):
+        return self.sim.wall_kernel
+
+    @property
+    def wall_contacts(self):
+        return self.sim.wall_contacts
+
+    def get_near_masses(self, pair_reach, wall_reach):
+        """ Finds the particles that could come into contact within the next step, as Simulation.get_near_masses, in
+        this process while the workers wait. """
+        return self.sim.get_near_masses(pair_reach, wall_reach)
+
+    @property
+    def min_contact_mass(self):
+        """ Smallest reduced mass of the particle-particle contacts of the last step, or None when there were none. """
+        if self.pair_contacts == 0:
+            return None
+        return float(np.min(self.min_masses))
+
+    def close(self):
+        """ Stops the workers and copies the system state back out of shared memory. """
+        if self.processes is None:
+            return
+        self.running.value = 0
+        try:
+            self.barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        for process in self.processes:
+            process.join()
+        self.processes = None
+
+        for name in self.shared_arrays:
+            setattr(self.sim.system, name, getattr(self.sim.system, name).copy())
+        self.counts = self.counts.copy()
+        self.min_masses = self.min_masses.copy()
+        self.gravity = self.gravity.copy()
+        self.vel_fluid = self.vel_fluid.copy()
+        for shm in self.shared:
+            shm.close()
+            shm.unlink()
+        self.shared = None
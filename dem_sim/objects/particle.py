@@ -1,57 +1,197 @@
 import numpy as np
 import math
 import dem_sim.util.vector_utils as vect
+from dem_sim.objects.history import RecordingPolicy
+from dem_sim.objects.particle_system import ForceView
+from dem_sim.util.exceptions import ParameterException
+
+
+def default_vel_fluid(particle):
+    return [0, 0, 0]
+
+
+def default_gravity(particle):
+    return [0, -9.81, 0]
 
 
 class Particle:
     pid = None
-    pos = None
     next_pos = None
-    vel = None
     next_vel = None
-    diameter = None
-    fluid_viscosity = None
-    density = None
-
-    time = None
-    times = None
-    pos_history = None
-    vel_history = None
 
     dem_forces = None
+    recording = None
+    history = None
+
+    # ParticleSystem this particle is a view into, if any.
+    system = None
+    index = None
 
     def __init__(self, pid, position, velocity, diameter=0.1, density=2000, fluid_viscosity=1.93e-5, get_vel_fluid=None,
-                 get_gravity=None):
+                 get_gravity=None, recording=None, species=0):
         self.pos = np.array(position)
         self.vel = np.array(velocity)
         self.diameter = diameter
         self.density = density
         self.fluid_viscosity = fluid_viscosity
+        self.species = species
 
         self.pid = pid
 
         self.time = 0
-        self.times = []
-        self.pos_history = []
-        self.vel_history = []
+        self.recording = RecordingPolicy() if recording is None else recording
 
         self.dem_forces = []
 
-        if callable(get_vel_fluid) and len(get_vel_fluid(self)) == 3:
+        # The callbacks are not evaluated here, a Field shared between particles is evaluated once per step for all.
+        if callable(get_vel_fluid):
             self.get_vel_fluid = get_vel_fluid
         elif get_vel_fluid is not None:
             print("get_vel_fluid is not a valid function.")
         else:
-            self.get_vel_fluid = lambda dummy: [0, 0, 0]
+            self.get_vel_fluid = default_vel_fluid
 
-        if callable(get_gravity) and len(get_gravity(self)) == 3:
+        if callable(get_gravity):
             self.get_gravity = get_gravity
         elif get_gravity is not None:
             print("get_gravity is not a valid function.")
         else:
-            self.get_gravity = lambda delta_t: [0, -9.81, 0]
+            self.get_gravity = default_gravity
+
+    def attach(self, system, index):
+        """ Makes this particle a view into row index of the given ParticleSystem. """
+        self.system = system
+        self.index = index
+        self.dem_forces = ForceView(system, index)
+        self.history = None
+
+    # State is stored on the particle itself unless it has been attached to a ParticleSystem.
+
+    @property
+    def pos(self):
+        if self.system is None:
+            return self._pos
+        return self.system.pos[self.index]
+
+    @pos.setter
+    def pos(self, value):
+        if self.system is None:
+            self._pos = value
+        else:
+            self.system.pos[self.index] = value
+
+    @property
+    def vel(self):
+        if self.system is None:
+            return self._vel
+        return self.system.vel[self.index]
+
+    @vel.setter
+    def vel(self, value):
+        if self.system is None:
+            self._vel = value
+        else:
+            self.system.vel[self.index] = value
+
+    @property
+    def diameter(self):
+        if self.system is None:
+            return self._diameter
+        return self.system.diameter[self.index]
+
+    @diameter.setter
+    def diameter(self, value):
+        if self.system is None:
+            self._diameter = value
+        else:
+            self.system.diameter[self.index] = value
+            self.system.update_properties()
+
+    @property
+    def density(self):
+        if self.system is None:
+            return self._density
+        return self.system.density[self.index]
+
+    @density.setter
+    def density(self, value):
+        if self.system is None:
+            self._density = value
+        else:
+            self.system.density[self.index] = value
+            self.system.update_properties()
+
+    @property
+    def fluid_viscosity(self):
+        if self.system is None:
+            return self._fluid_viscosity
+        return self.system.fluid_viscosity[self.index]
+
+    @fluid_viscosity.setter
+    def fluid_viscosity(self, value):
+        if self.system is None:
+            self._fluid_viscosity = value
+        else:
+            self.system.fluid_viscosity[self.index] = value
+            self.system.update_properties()
+
+    @property
+    def species(self):
+        if self.system is None:
+            return self._species
+        return self.system.species[self.index]
+
+    @species.setter
+    def species(self, value):
+        if self.system is None:
+            self._species = value
+        else:
+            self.system.species[self.index] = value
+
+    @property
+    def time(self):
+        if self.system is None:
+            return self._time
+        return self.system.time
+
+    @time.setter
+    def time(self, value):
+        if self.system is None:
+            self._time = value
+        else:
+            self.system.time = value
+
+    # Histories are views into the particle's own History, or into the system's one when attached.
+
+    def get_history(self):
+        """ Returns the particle's own History, created on first use, or None if it does not record history. """
+        if self.history is None and self.recording is not None:
+            self.history = self.recording.create_history()
+        return self.history
+
+    @property
+    def times(self):
+        if self.system is None:
+            history = self.get_history()
+            return None if history is None else history.times
+        return self.system.times if self.system.record_history else None
+
+    @property
+    def pos_history(self):
+        if self.system is None:
+            history = self.get_history()
+            return None if history is None else history.pos_history
+        return self.system.pos_history[:, self.index] if self.system.record_history else None
+
+    @property
+    def vel_history(self):
+        if self.system is None:
+            history = self.get_history()
+            return None if history is None else history.vel_history
+        return self.system.vel_history[:, self.index] if self.system.record_history else None
 
     def iterate(self, delta_t, implicit=True):
+        self.check_detached()
         self.time += delta_t
 
         self.iterate_velocity(delta_t, implicit)
@@ -84,9 +224,16 @@ class Particle:
         return -(self.vel - np.array(self.get_vel_fluid(self))) / self.get_tau()
 
     def get_dem_accel(self):
+        if self.system is not None:
+            return self.system.forces[self.index] / self.get_mass()
         total_dem_force = np.sum(self.dem_forces, 0)
         return total_dem_force / self.get_mass()
 
+    def check_detached(self):
+        if self.system is not None:
+            raise ParameterException("Particle {0} is part of a ParticleSystem, iterate the system instead.".format(
+                self.pid))
+
     # Useful values.
 
     def get_tau(self):
@@ -96,11 +243,10 @@ class Particle:
         return vect.mag(self.vel)
 
     def get_speed_at_time(self, time):
-        try:
-            index = self.times.index(time)
-            return vect.mag(self.vel_history[index])
-        except ValueError:
+        index = np.nonzero(self.times == time)[0]
+        if len(index) == 0:
             return 0
+        return vect.mag(self.vel_history[index[0]])
 
     def get_speed_at_index(self, index):
         return vect.mag(self.vel_history[index])
@@ -112,10 +258,8 @@ class Particle:
         return 0.5 * self.get_mass() + self.get_speed() ** 2
 
     def record_state(self):
-        """ Records current position, velocity, and time. """
-        self.vel_history.append(self.vel.copy())
-        self.pos_history.append(self.pos.copy())
-        self.times.append(self.time)
+        """ Records current position, velocity, and time, as allowed by the recording policy. """
+        self.get_history().record(self.time, self.pos, self.vel)
 
     def __str__(self):
         return "{0:.5f},{1:.5f},{2:.5f},{3:.5f}\n".format(self.pos[0], self.pos[1], self.pos[2], self.get_speed())
@@ -125,13 +269,14 @@ class LowMemParticle(Particle):
     """ Same as Particle but without full history tracking. """
 
     def __init__(self, pid, position, velocity, diameter=0.1, density=2000, fluid_viscosity=1.93e-5, get_vel_fluid=None,
-                 get_gravity=None):
-        super().__init__(pid, position, velocity, diameter, density, fluid_viscosity, get_vel_fluid, get_gravity)
-        self.times = None
-        self.pos_history = None
-        self.vel_history = None
+                 get_gravity=None, species=0):
+        super().__init__(pid, position, velocity, diameter, density, fluid_viscosity, get_vel_fluid, get_gravity,
+                         species=species)
+        self.recording = None
+        self.history = None
 
     def iterate(self, delta_t, implicit=False):
+        self.check_detached()
         self.time += delta_t
 
         self.iterate_velocity(delta_t, implicit)
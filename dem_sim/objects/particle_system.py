@@ -0,0 +1,301 @@
+import numpy as np
+import math
+
+from dem_sim.objects.fields import Field, ParticleCallbackField
+from dem_sim.objects.history import RecordingPolicy
+from dem_sim.util.exceptions import ParameterException
+
+
+class ParticleSystem:
+    """
+    Structure-of-arrays particle container.
+
+    Holds the state of a whole population of particles as contiguous (N, 3) and (N,) arrays and advances all of them
+    with a single vectorized update. Particle objects can be attached to a system, after which they act as views into
+    its arrays.
+    """
+    particles = None
+    pos = None
+    vel = None
+    diameter = None
+    density = None
+    fluid_viscosity = None
+    species = None
+    forces = None
+
+    mass = None
+    tau = None
+
+    time = None
+    record_history = None
+    recording = None
+    history = None
+
+    field_step = None
+    interpolate_fields = None
+    field_samples = None
+
+    def __init__(self, positions, velocities, diameters=0.1, densities=2000, fluid_viscosity=1.93e-5,
+                 get_vel_fluid=None, get_gravity=None, record_history=False, field_step=None, interpolate_fields=False,
+                 species=0):
+        """
+        :param positions: (N, 3) array of particle positions.
+        :param velocities: (N, 3) array of particle velocities.
+        :param diameters: (N,) array or a single diameter for all particles.
+        :param densities: (N,) array or a single density for all particles.
+        :param fluid_viscosity: (N,) array or a single fluid viscosity for all particles.
+        :param get_vel_fluid: A Field, or a function that takes the system and returns a (3,) or (N, 3) fluid velocity
+                              array.
+        :param get_gravity: A Field, such as a UniformField for gravity that only depends on time, or a function that
+                            takes the system and returns a (3,) or (N, 3) gravity array.
+        :param record_history: Whether to record position, velocity, and time at every step, in a (steps, N, 3)
+                               History block, or a RecordingPolicy describing which steps to record.
+        :param field_step: If given, gravity and fluid velocity are only evaluated once every field_step seconds.
+        :param interpolate_fields: Whether to interpolate the fields linearly between evaluations instead of holding
+                                   them fixed.
+        :param species: (N,) array or a single species id for all particles, indexing the MaterialTable of the
+                        collision kernels.
+        """
+        self.pos = np.array(positions, dtype=float).reshape((-1, 3))
+        self.vel = np.array(velocities, dtype=float).reshape((-1, 3))
+        if self.pos.shape != self.vel.shape:
+            raise ParameterException("Position and velocity arrays must have the same shape.")
+
+        n = len(self.pos)
+        self.diameter = np.broadcast_to(np.array(diameters, dtype=float), (n,)).copy()
+        self.density = np.broadcast_to(np.array(densities, dtype=float), (n,)).copy()
+        self.fluid_viscosity = np.broadcast_to(np.array(fluid_viscosity, dtype=float), (n,)).copy()
+        self.species = np.broadcast_to(np.array(species, dtype=np.intp), (n,)).copy()
+        self.forces = np.zeros((n, 3))
+
+        if get_vel_fluid is None:
+            self.get_vel_fluid = lambda system: np.zeros(3)
+        else:
+            self.get_vel_fluid = get_vel_fluid
+
+        if get_gravity is None:
+            self.get_gravity = lambda system: np.array([0, -9.81, 0])
+        else:
+            self.get_gravity = get_gravity
+
+        self.time = 0
+        if isinstance(record_history, RecordingPolicy):
+            self.recording = record_history
+            self.record_history = True
+        else:
+            self.recording = RecordingPolicy()
+            self.record_history = record_history
+
+        self.field_step = field_step
+        self.interpolate_fields = interpolate_fields
+
+        self.update_properties()
+
+    @classmethod
+    def from_particles(cls, particles, record_history=None, field_step=None, interpolate_fields=False):
+        """
+        Creates a system from existing Particle objects and attaches them so that they become views into it.
+
+        :param particles: A list of Particle objects.
+        :param record_history: Whether to record history, or a RecordingPolicy. Default: record with the policy of the
+                               first particle, unless any particle is a LowMemParticle.
+        :param field_step: See ParticleSystem.
+        :param interpolate_fields: See ParticleSystem.
+        :return: The new ParticleSystem.
+        """
+        from dem_sim.objects.particle import default_vel_fluid, default_gravity
+
+        if record_history is None:
+            record_history = all(p.recording is not None for p in particles)
+            if record_history and len(particles) > 0 and particles[0].recording is not None:
+                record_history = particles[0].recording
+
+        system = cls([p.pos for p in particles],
+                     [p.vel for p in particles],
+                     [p.diameter for p in particles],
+                     [p.density for p in particles],
+                     [p.fluid_viscosity for p in particles],
+                     record_history=record_history,
+                     field_step=field_step,
+                     interpolate_fields=interpolate_fields,
+                     species=[p.species for p in particles])
+        system.particles = list(particles)
+        system.time = particles[0].time if len(particles) > 0 else 0
+
+        # A Field shared by every particle is evaluated for all of them at once. Other per-particle callbacks are only
+        # evaluated, one particle at a time, when at least one particle has a non-default one.
+        for name, default in [("get_vel_fluid", default_vel_fluid), ("get_gravity", default_gravity)]:
+            callbacks = [getattr(p, name) for p in particles]
+            if len(particles) > 0 and isinstance(callbacks[0], Field) and all(c is callbacks[0] for c in callbacks):
+                setattr(system, name, callbacks[0])
+            elif any(c is not default for c in callbacks):
+                setattr(system, name, ParticleCallbackField(callbacks, system.particles))
+
+        for i, p in enumerate(particles):
+            p.attach(system, i)
+        return system
+
+    def __len__(self):
+        return len(self.pos)
+
+    def update_properties(self):
+        """ Recalculates cached mass and relaxation time. Must be called after changing diameters or densities. """
+        self.mass = self.density * math.pi * self.diameter ** 3 / 6
+        self.tau = self.density * self.diameter ** 2 / (18 * self.fluid_viscosity)
+
+    def iterate(self, delta_t, implicit=True, indices=None):
+        """
+        Advances the particles by one timestep.
+
+        :param delta_t: The timestep.
+        :param implicit: Whether to use implicit drag integration.
+        :param indices: If given, only these particles are advanced.
+        """
+        self.time += delta_t
+        rows = slice(None) if indices is None else indices
+        self.integrate(delta_t, implicit, rows, *self.get_fields())
+
+        if self.record_history:
+            self.record_state()
+
+    def get_fields(self):
+        """
+        Returns the gravity and fluid velocity for the current time.
+
+        Without a field_step the fields are evaluated every call. With one, they are evaluated at the start of each
+        field_step interval and then either held fixed or, when interpolating, linearly interpolated towards a second
+        evaluation at the end of the interval, made with the positions at its start.
+        """
+        if self.field_step is None:
+            return self.get_gravity(self), self.get_vel_fluid(self)
+
+        # Small tolerance so that accumulated timestep rounding does not trigger an extra evaluation.
+        tolerance = 1e-9 * self.field_step
+        samples = self.field_samples
+        if samples is None or not self.in_field_interval(samples[0][0], tolerance):
+            if self.interpolate_fields and samples is not None and self.in_field_interval(samples[-1][0], tolerance):
+                # Continue from the end of the last interval, reusing its evaluation.
+                samples = [samples[-1]]
+            else:
+                samples = [self.sample_fields(self.time)]
+            if self.interpolate_fields:
+                samples.append(self.sample_fields(samples[0][0] + self.field_step))
+            self.field_samples = samples
+
+        if not self.interpolate_fields:
+            return samples[0][1], samples[0][2]
+        (start, gravity_start, vel_fluid_start), (end, gravity_end, vel_fluid_end) = samples
+        weight = min(max((self.time - start) / (end - start), 0), 1)
+        return (gravity_start + weight * (gravity_end - gravity_start),
+                vel_fluid_start + weight * (vel_fluid_end - vel_fluid_start))
+
+    def in_field_interval(self, start, tolerance):
+        """ Whether the current time lies in the field_step interval beginning at start. """
+        if self.interpolate_fields:
+            return start - tolerance <= self.time <= start + self.field_step + tolerance
+        return start - tolerance <= self.time < start + self.field_step - tolerance
+
+    def sample_fields(self, time):
+        """ Evaluates the gravity and fluid velocity at the given time and the current positions. """
+        current_time = self.time
+        self.time = time
+        try:
+            return (time, np.array(self.get_gravity(self), dtype=float),
+                    np.array(self.get_vel_fluid(self), dtype=float))
+        finally:
+            self.time = current_time
+
+    def integrate(self, delta_t, implicit, rows, gravity, vel_fluid):
+        """
+        Advances the selected rows of the state arrays without changing the time.
+
+        :param rows: Slice or index array of the particles to advance.
+        :param gravity: (3,) or (N, 3) gravity for all particles.
+        :param vel_fluid: (3,) or (N, 3) fluid velocity for all particles.
+        """
+        vel = self.vel[rows]
+        gravity = self.select(gravity, rows)
+        vel_fluid = self.select(vel_fluid, rows)
+        next_vel = vel + delta_t * self.get_accel(delta_t, implicit, rows, gravity, vel_fluid)
+        self.pos[rows] += (next_vel + vel) * (delta_t / 2)
+        self.vel[rows] = next_vel
+        self.forces[rows] = 0
+
+    def get_accel(self, delta_t, implicit, rows, gravity, vel_fluid):
+        if not implicit:
+            return self.get_drag_accel(rows, vel_fluid) + self.get_dem_accel(rows) + gravity
+        else:
+            return self.get_accel_implicit_drag(delta_t, rows, gravity, vel_fluid)
+
+    def get_accel_implicit_drag(self, delta_t, rows, gravity, vel_fluid):
+        tau = self.tau[rows, np.newaxis]
+        non_drag_a = self.get_dem_accel(rows) + gravity
+        return (vel_fluid - self.vel[rows] + tau * non_drag_a) / (tau + delta_t)
+
+    def get_drag_accel(self, rows, vel_fluid):
+        return -(self.vel[rows] - vel_fluid) / self.tau[rows, np.newaxis]
+
+    def get_dem_accel(self, rows=slice(None)):
+        return self.forces[rows] / self.mass[rows, np.newaxis]
+
+    @staticmethod
+    def select(values, rows):
+        """ Selects rows of a per-particle (N, 3) array, leaving uniform (3,) values unchanged. """
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 2:
+            return values[rows]
+        return values
+
+    def add_forces(self, indices, forces, out=None):
+        """
+        Accumulates an (M, 3) array of forces onto the particles at the given (possibly repeated) indices.
+
+        :param out: (N, 3) array to accumulate into instead of the system force array.
+        """
+        if out is None:
+            out = self.forces
+        n = len(self.pos)
+        for k in range(3):
+            out[:, k] += np.bincount(indices, forces[:, k], minlength=n)
+
+    def get_speed(self):
+        return np.sqrt(np.einsum('ij,ij->i', self.vel, self.vel))
+
+    def get_history(self):
+        """ Returns the History, created on first use so that systems that never record history do not allocate one. """
+        if self.history is None:
+            self.history = self.recording.create_history(self.pos.shape)
+        return self.history
+
+    @property
+    def times(self):
+        return self.get_history().times
+
+    @property
+    def pos_history(self):
+        """ (steps, N, 3) view of the recorded positions. """
+        return self.get_history().pos_history
+
+    @property
+    def vel_history(self):
+        """ (steps, N, 3) view of the recorded velocities. """
+        return self.get_history().vel_history
+
+    def record_state(self):
+        """ Records current positions, velocities, and time of all particles, as allowed by the recording policy. """
+        self.get_history().record(self.time, self.pos, self.vel)
+
+
+class ForceView:
+    """ List-like accumulator that adds forces appended to it into a single row of a ParticleSystem force array. """
+
+    def __init__(self, system, index):
+        self.system = system
+        self.index = index
+
+    def append(self, force):
+        self.system.forces[self.index] += force
+
+    def clear(self):
+        self.system.forces[self.index] = 0
+
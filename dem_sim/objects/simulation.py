@@ -0,0 +1,283 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from dem_sim.objects.collision import AAWallCollisionKernel, CollisionKernel
+from dem_sim.objects.contacts import ContactRegistry
+from dem_sim.objects.cv import VerletList
+from dem_sim.objects.timestep import TimestepController
+
+
+class Simulation:
+    """
+    Step pipeline for a ParticleSystem: broad phase, particle and wall collisions, then integration.
+
+    Wall collisions are only calculated for the particles in cells near each wall, with per-step candidate and contact
+    counts kept for reporting.
+
+    With threads set, the contact force and integration stages are split into chunks that run on a thread pool. Each
+    chunk is a set of large NumPy operations, which release the GIL, and accumulates its contact forces into its own
+    force buffer, with the buffers summed once all chunks are done.
+
+    With a SleepTracker, particles that have come to rest are frozen and skipped until they are disturbed.
+    """
+    system = None
+    cell_list = None
+    verlet = None
+    kernel = None
+    registry = None
+    wall_kernel = None
+    implicit = None
+
+    threads = None
+    executor = None
+    sleep = None
+
+    wall_candidates = None
+    wall_contacts = None
+
+    # Pairs found by get_near_masses for the current positions, used by the next step instead of finding them again.
+    pairs = None
+
+    def __init__(self, system, cell_list, walls=None, kernel=None, wall_kernel=None, skin=None, implicit=True,
+                 threads=None, sleep=None):
+        """
+        :param system: The ParticleSystem to advance.
+        :param cell_list: CellList used for the particle and wall broad phases.
+        :param walls: A list of AAWall objects.
+        :param kernel: CollisionKernel for particle-particle collisions. Default: CollisionKernel().
+        :param wall_kernel: AAWallCollisionKernel for particle-wall collisions. Default: AAWallCollisionKernel().
+        :param skin: If given, particle pairs come from a VerletList with this skin distance.
+        :param implicit: Whether to use implicit drag integration.
+        :param threads: If given, the number of worker threads used for the contact and integration stages.
+        :param sleep: Optional SleepTracker used to freeze resting particles.
+        """
+        self.system = system
+        self.cell_list = cell_list
+        self.kernel = CollisionKernel() if kernel is None else kernel
+        self.registry = ContactRegistry(self.kernel)
+        self.wall_kernel = AAWallCollisionKernel() if wall_kernel is None else wall_kernel
+        if skin is not None:
+            self.verlet = VerletList(cell_list, skin)
+        self.implicit = implicit
+
+        self.threads = threads
+        if threads is not None:
+            self.executor = ThreadPoolExecutor(max_workers=threads)
+
+        self.sleep = sleep
+        if sleep is not None:
+            sleep.reset(len(system))
+
+        if walls is not None:
+            self.cell_list.add_walls(walls)
+
+        self.wall_candidates = []
+        self.wall_contacts = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_pairs(self):
+        if self.verlet is not None:
+            i, j = self.verlet.get_pairs(self.system)
+        else:
+            self.cell_list.add_particles(self.system)
+            i, j = self.cell_list.get_pairs()
+            self.cell_list.reset()
+        if self.sleep is not None:
+            return self.sleep.filter_pairs(i, j)
+        return i, j
+
+    def get_wall_pairs(self):
+        particles, walls = self.cell_list.get_wall_pairs(self.system.pos)
+        if self.sleep is not None:
+            return self.sleep.filter_wall_pairs(particles, walls)
+        return particles, walls
+
+    def calculate_wall_collisions(self, delta_t):
+        particles, walls = self.get_wall_pairs()
+        contacts = 0
+        if len(particles) > 0:
+            contacts = self.wall_kernel.calculate(self.system, self.cell_list.wall_table, particles, walls, delta_t)
+        self.wall_candidates.append(len(particles))
+        self.wall_contacts.append(contacts)
+
+    @property
+    def min_contact_mass(self):
+        """ Smallest reduced mass of the current particle-particle contacts, or None when there are none. """
+        if len(self.registry) == 0:
+            return None
+        return np.min(self.registry.reduced_mass)
+
+    def get_near_masses(self, pair_reach, wall_reach):
+        """
+        Finds the particles that are in contact or could come into contact within the next step.
+
+        Pairs are only found if the broad phase finds them, which the CellList guarantees for gaps smaller than its cell
+        length less the largest diameter, and for particle-wall gaps smaller than its wall margin less the largest
+        radius.
+
+        :param pair_reach: Largest gap between two particles that could close within the step.
+        :param wall_reach: Largest gap between a particle and a wall that could close within the step.
+        :return: Smallest reduced mass of the pairs within pair_reach, and smallest mass of the particles within
+                 wall_reach of a wall, each None when there are none.
+        """
+        system = self.system
+        i, j = self.pairs = self.get_pairs()
+        near = self.kernel.get_gaps(system, i, j) < pair_reach
+        pair_mass = None
+        if np.any(near):
+            m_i = system.mass[i[near]]
+            m_j = system.mass[j[near]]
+            pair_mass = np.min(m_i * m_j / (m_i + m_j))
+
+        particles, walls = self.get_wall_pairs()
+        wall_mass = None
+        if len(particles) > 0:
+            gaps = self.wall_kernel.get_gaps(system, self.cell_list.wall_table, particles, walls)
+            wall_mass = np.min(system.mass[particles[gaps < wall_reach]], initial=math.inf)
+            if wall_mass == math.inf:
+                wall_mass = None
+        return pair_mass, wall_mass
+
+    def step(self, delta_t):
+        i, j = self.get_pairs() if self.pairs is None else self.pairs
+        self.pairs = None
+        if self.executor is None:
+            self.kernel.calculate(self.system, i, j, delta_t, self.registry)
+            self.calculate_wall_collisions(delta_t)
+        else:
+            self.calculate_collisions_threaded(i, j, delta_t)
+        self.iterate(delta_t)
+
+    def run(self, end_time, timestep, callback=None, checkpointer=None):
+        """
+        Steps the simulation until the system time reaches end_time.
+
+        :param end_time: The time to stop at.
+        :param timestep: A fixed timestep, or a TimestepController to choose the timestep for every step.
+        :param callback: Optional function called with the simulation after every step.
+        :param checkpointer: Optional Checkpointer given the chance to save a checkpoint after every step.
+        """
+        tolerance = 1e-12 * max(abs(end_time), 1)
+        while end_time - self.system.time > tolerance:
+            remaining = end_time - self.system.time
+            if isinstance(timestep, TimestepController):
+                delta_t = timestep.get_timestep(self, remaining)
+            else:
+                delta_t = min(timestep, remaining)
+            self.step(delta_t)
+            if callback is not None:
+                callback(self)
+            if checkpointer is not None:
+                checkpointer.update(self, timestep if isinstance(timestep, TimestepController) else None)
+
+    @staticmethod
+    def get_chunks(length, chunks):
+        bounds = np.linspace(0, length, chunks + 1).astype(np.intp)
+        return [slice(bounds[n], bounds[n + 1]) for n in range(chunks)]
+
+    def calculate_collisions_threaded(self, i, j, delta_t):
+        system = self.system
+        registry = self.registry
+        table = self.cell_list.wall_table
+
+        # The narrow phase and registry update need every contact at once, the force calculations do not.
+        registry.update(system, *self.kernel.get_contacts(system, i, j))
+        particles, walls = self.get_wall_pairs()
+
+        pair_chunks = self.get_chunks(len(registry), self.threads)
+        wall_chunks = self.get_chunks(len(particles), self.threads)
+        buffers = [np.zeros_like(system.forces) for _ in range(self.threads)]
+
+        def calculate_chunk(n):
+            pairs = pair_chunks[n]
+            i_chunk = registry.i[pairs]
+            j_chunk = registry.j[pairs]
+            vel_tangential, force = self.kernel.get_contact_forces(system, i_chunk, j_chunk,
+                                                                   registry.reduced_mass[pairs],
+                                                                   registry.damping_coefficient[pairs])
+            registry.tangential_displacement[pairs] += vel_tangential * delta_t
+            system.add_forces(i_chunk, -force, buffers[n])
+            system.add_forces(j_chunk, force, buffers[n])
+
+            if table is None:
+                return 0
+            contact_particles, _, force = self.wall_kernel.get_wall_forces(system, table, particles[wall_chunks[n]],
+                                                                          walls[wall_chunks[n]], delta_t)
+            system.add_forces(contact_particles, force, buffers[n])
+            return len(contact_particles)
+
+        contacts = sum(self.executor.map(calculate_chunk, range(self.threads)))
+        system.forces += np.sum(buffers, axis=0)
+
+        self.wall_candidates.append(len(particles))
+        self.wall_contacts.append(contacts)
+
+    def iterate(self, delta_t):
+        system = self.system
+        system.time += delta_t
+        gravity, vel_fluid = system.get_fields()
+        rows = slice(None)
+        if self.sleep is not None:
+            rows = self.sleep.update(system, self.registry, gravity, vel_fluid)
+
+        if self.executor is None:
+            system.integrate(delta_t, self.implicit, rows, gravity, vel_fluid)
+        else:
+            def integrate_chunk(chunk):
+                system.integrate(delta_t, self.implicit, chunk, gravity, vel_fluid)
+
+            if isinstance(rows, slice):
+                chunks = self.get_chunks(len(system), self.threads)
+            else:
+                chunks = [rows[chunk] for chunk in self.get_chunks(len(rows), self.threads)]
+            list(self.executor.map(integrate_chunk, chunks))
+
+        if system.record_history:
+            system.record_state()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def report(self):
+        """ Prints a summary of the broad phase performance. """
+        if len(self.wall_candidates) > 0:
+            print("Wall collision candidates per step: {0:.1f}, wall contacts per step: {1:.1f}.".format(
+                np.mean(self.wall_candidates), np.mean(self.wall_contacts)))
+        if self.verlet is not None:
+            print("Verlet list rebuilds: {0}, average steps between rebuilds: {1:.1f}.".format(
+                self.verlet.rebuild_count, self.verlet.average_steps_between_rebuilds))
+        if self.sleep is not None:
+            self.sleep.report()
+
+
+def thread_speedup(make_simulation, threads, steps=100, delta_t=0.0005):
+    """
+    Measures the speedup of the threaded step pipeline over the single-threaded one.
+
+    :param make_simulation: A function that takes a threads argument and returns a new Simulation.
+    :param threads: Number of worker threads to compare against a single thread.
+    :param steps: Number of steps to time.
+    :param delta_t: The timestep.
+    :return: Single-threaded run time divided by threaded run time.
+    """
+    run_times = []
+    for thread_count in [None, threads]:
+        with make_simulation(thread_count) as sim:
+            start = time.perf_counter()
+            for _ in range(steps):
+                sim.step(delta_t)
+            run_times.append(time.perf_counter() - start)
+    speedup = run_times[0] / run_times[1]
+    print("Single-threaded: {0:.3f} s, {1} threads: {2:.3f} s, speedup: {3:.2f}x.".format(run_times[0], threads,
+                                                                                       run_times[1], speedup))
+    return speedup
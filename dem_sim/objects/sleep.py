@@ -0,0 +1,102 @@
+import numpy as np
+
+from dem_sim.util import vector_utils as vect
+
+
+class SleepTracker:
+    """
+    Freezes particles that have come to rest so that they can be skipped by the simulation.
+
+    A particle falls asleep once its speed and net acceleration have both stayed below their thresholds for
+    sleep_steps consecutive steps. Sleeping particles have their velocity set to zero, are not integrated, and are left
+    out of wall collisions and of particle pairs in which both particles are asleep. They still act as obstacles for
+    awake particles, and wake up when a moving particle touches them or when gravity changes.
+    """
+    speed_threshold = None
+    acceleration_threshold = None
+    sleep_steps = None
+    gravity_tolerance = None
+
+    asleep = None
+    still_steps = None
+    gravity = None
+    active_fractions = None
+
+    def __init__(self, speed_threshold=0.01, acceleration_threshold=0.1, sleep_steps=100, gravity_tolerance=1e-3):
+        """
+        :param speed_threshold: Speed below which a particle counts as still, and above which it wakes neighbours.
+        :param acceleration_threshold: Net acceleration below which a particle counts as still.
+        :param sleep_steps: Number of consecutive still steps before a particle falls asleep.
+        :param gravity_tolerance: Change in gravity, relative to its magnitude, that wakes every particle.
+        """
+        self.speed_threshold = speed_threshold
+        self.acceleration_threshold = acceleration_threshold
+        self.sleep_steps = sleep_steps
+        self.gravity_tolerance = gravity_tolerance
+        self.active_fractions = []
+
+    def reset(self, number_of_particles):
+        """ Wakes every particle of a system with the given number of particles. """
+        self.asleep = np.zeros(number_of_particles, dtype=bool)
+        self.still_steps = np.zeros(number_of_particles, dtype=np.int64)
+        self.gravity = None
+
+    def filter_pairs(self, i, j):
+        """ Removes candidate pairs in which both particles are asleep. """
+        keep = ~(self.asleep[i] & self.asleep[j])
+        return i[keep], j[keep]
+
+    def filter_wall_pairs(self, particles, walls):
+        """ Removes candidate particle-wall pairs with sleeping particles. """
+        keep = ~self.asleep[particles]
+        return particles[keep], walls[keep]
+
+    def wake(self, indices):
+        self.asleep[indices] = False
+        self.still_steps[indices] = 0
+
+    def update(self, system, registry, gravity, vel_fluid):
+        """
+        Updates which particles are asleep, based on the forces accumulated for the current step.
+
+        :param system: The ParticleSystem.
+        :param registry: ContactRegistry holding the current particle-particle contacts.
+        :param gravity: (3,) or (N, 3) gravity for the current step.
+        :param vel_fluid: (3,) or (N, 3) fluid velocity for the current step.
+        :return: Indices of the particles that are awake and must be integrated.
+        """
+        gravity = np.asarray(gravity, dtype=float)
+        if self.gravity is None or np.max(np.abs(gravity - self.gravity)) > \
+                self.gravity_tolerance * np.max(np.abs(gravity)):
+            self.gravity = gravity.copy()
+            self.wake(slice(None))
+
+        speed = system.get_speed()
+        moving = ~self.asleep & (speed > self.speed_threshold)
+        self.wake(registry.i[self.asleep[registry.i] & moving[registry.j]])
+        self.wake(registry.j[self.asleep[registry.j] & moving[registry.i]])
+
+        awake = np.nonzero(~self.asleep)[0]
+        acceleration = system.get_dem_accel(awake) + system.select(gravity, awake) \
+            + system.get_drag_accel(awake, system.select(vel_fluid, awake))
+        still = (speed[awake] < self.speed_threshold) \
+            & (vect.mag_rows(acceleration) < self.acceleration_threshold)
+        self.still_steps[awake] = np.where(still, self.still_steps[awake] + 1, 0)
+
+        sleeping = awake[self.still_steps[awake] >= self.sleep_steps]
+        self.asleep[sleeping] = True
+        system.vel[sleeping] = 0
+        system.forces[self.asleep] = 0
+
+        self.active_fractions.append(self.active_fraction)
+        return np.nonzero(~self.asleep)[0]
+
+    @property
+    def active_fraction(self):
+        """ Fraction of particles currently awake. """
+        return 1 - np.count_nonzero(self.asleep) / len(self.asleep)
+
+    def report(self):
+        if len(self.active_fractions) > 0:
+            print("Active particle fraction, mean: {0:.3f}, final: {1:.3f}.".format(np.mean(self.active_fractions),
+                                                                                     self.active_fractions[-1]))
@@ -0,0 +1,117 @@
+import math
+
+import numpy as np
+
+from dem_sim.util.exceptions import ParameterException
+
+
+class TimestepController:
+    """
+    Chooses a stable global timestep for each step of a Simulation.
+
+    The timestep is limited by three constraints:
+        - the duration of the stiffest contact, pi * sqrt(m / k), which must be resolved in contact_steps steps,
+        - the distance travelled by the fastest particle in one step, as a fraction of the smallest diameter,
+        - the drag relaxation time of the particles, tau.
+    The contact limit applies to the contacts that could form within the step as well as the active ones, so that the
+    first step of a new impact is resolved too. The timestep is reduced to the limit immediately, but only grows by a
+    factor of growth per step, and is always kept between min_timestep and max_timestep. Every timestep chosen is
+    logged along with the time it started at.
+    """
+    min_timestep = None
+    max_timestep = None
+    contact_steps = None
+    travel_fraction = None
+    drag_fraction = None
+    growth = None
+
+    timestep = None
+    timesteps = None
+    times = None
+
+    def __init__(self, max_timestep=0.01, min_timestep=1e-6, contact_steps=20, travel_fraction=0.05,
+                 drag_fraction=0.5, growth=1.2):
+        """
+        :param max_timestep: Largest timestep allowed.
+        :param min_timestep: Smallest timestep allowed.
+        :param contact_steps: Minimum number of steps per contact duration.
+        :param travel_fraction: Maximum fraction of the smallest diameter that any particle can travel in one step.
+        :param drag_fraction: Maximum fraction of the smallest relaxation time, or None to ignore drag.
+        :param growth: Maximum factor by which the timestep can grow from one step to the next.
+        """
+        if not 0 < min_timestep <= max_timestep:
+            raise ParameterException("Timestep bounds must satisfy 0 < min_timestep <= max_timestep.")
+        if growth < 1:
+            raise ParameterException("Timestep growth factor must be at least 1.")
+        self.min_timestep = min_timestep
+        self.max_timestep = max_timestep
+        self.contact_steps = contact_steps
+        self.travel_fraction = travel_fraction
+        self.drag_fraction = drag_fraction
+        self.growth = growth
+
+        self.timesteps = []
+        self.times = []
+
+    def get_contact_limit(self, sim):
+        """
+        Returns the timestep needed to resolve the shortest contact that is active or could form within the step, or
+        inf when there are none.
+
+        No particle travels more than travel_fraction of the smallest diameter in a step, so only gaps smaller than
+        that, or twice that between two moving particles, can close. Both reaches are doubled to allow for velocities
+        changing during the step.
+        """
+        system = sim.system
+        if len(system) == 0:
+            return math.inf
+        reach = 2 * self.travel_fraction * np.min(system.diameter)
+        pair_mass, wall_mass = sim.get_near_masses(2 * reach, reach)
+        durations = [math.inf]
+        if pair_mass is not None:
+            durations.append(math.pi * math.sqrt(pair_mass / sim.kernel.max_stiffness))
+        if wall_mass is not None:
+            durations.append(math.pi * math.sqrt(wall_mass / sim.wall_kernel.max_stiffness))
+        return min(durations) / self.contact_steps
+
+    def get_travel_limit(self, system):
+        """ Returns the timestep in which the fastest particle travels travel_fraction of the smallest diameter. """
+        max_speed = np.max(system.get_speed(), initial=0)
+        if max_speed == 0:
+            return math.inf
+        return self.travel_fraction * np.min(system.diameter) / max_speed
+
+    def get_drag_limit(self, system):
+        if self.drag_fraction is None or len(system) == 0:
+            return math.inf
+        return self.drag_fraction * np.min(system.tau)
+
+    def get_timestep(self, sim, max_timestep=None):
+        """
+        Calculates and logs the timestep for the next step of a simulation.
+
+        :param sim: The Simulation about to be stepped.
+        :param max_timestep: Optional extra upper bound, e.g. the time remaining in the run.
+        :return: The timestep.
+        """
+        system = sim.system
+        timestep = min(self.max_timestep,
+                       self.get_contact_limit(sim),
+                       self.get_travel_limit(system),
+                       self.get_drag_limit(system))
+        if self.timestep is not None:
+            timestep = min(timestep, self.timestep * self.growth)
+        timestep = max(timestep, self.min_timestep)
+        self.timestep = timestep
+
+        if max_timestep is not None:
+            timestep = min(timestep, max_timestep)
+        self.timesteps.append(timestep)
+        self.times.append(system.time)
+        return timestep
+
+    def report(self):
+        """ Prints a summary of the timesteps used. """
+        if len(self.timesteps) > 0:
+            print("Steps: {0}, timestep min: {1:.3g}, mean: {2:.3g}, max: {3:.3g}.".format(
+                len(self.timesteps), np.min(self.timesteps), np.mean(self.timesteps), np.max(self.timesteps)))
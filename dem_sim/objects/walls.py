@@ -9,18 +9,49 @@ class AAWall:
     normal = None
     max = None
     min = None
+    material = None
 
-    def __init__(self, pos1, pos2):
+    def __init__(self, pos1, pos2, material=0):
+        """
+        :param pos1: One corner of the wall.
+        :param pos2: The opposite corner of the wall, in the same axis-aligned plane.
+        :param material: Wall material id in the MaterialTable of the wall collision kernel.
+        """
+        self.material = material
         pos1 = np.array(pos1)
         pos2 = np.array(pos2)
         if 0 in (pos1 - pos2):
             n = normalize(pos1 - pos2)
-            self.normal = np.array([1, 1, 1]) - np.divide(n, n, where=n!= 0)
+            self.normal = np.array([1, 1, 1]) - np.divide(n, n, out=np.zeros_like(n), where=n != 0)
 
             self.max = np.maximum(pos1, pos2)
             self.min = np.minimum(pos1, pos2)
         else:
             raise ParameterException("Points not in the same axis-aligned plane.")
 
+
+class AAWallTable:
+    """ Axis-aligned walls stored as arrays of plane normals, plane offsets, and bounds. """
+
+    normal = None
+    offset = None
+    max = None
+    min = None
+    material = None
+
+    def __init__(self, walls):
+        """
+        :param walls: A list of AAWall objects, such as those produced by the box generators.
+        """
+        self.normal = np.array([wall.normal for wall in walls], dtype=float).reshape((-1, 3))
+        self.max = np.array([wall.max for wall in walls], dtype=float).reshape((-1, 3))
+        self.min = np.array([wall.min for wall in walls], dtype=float).reshape((-1, 3))
+        self.offset = np.einsum('ij,ij->i', self.max, self.normal)
+        self.material = np.array([wall.material for wall in walls], dtype=np.intp)
+
+    def __len__(self):
+        return len(self.normal)
+
+
 # TODO: Add non-axis-aligned wall.
 # TODO: Add periodic wall.
@@ -1,50 +1,48 @@
 from dem_sim.generators.box import generate_closed_cube_box
 import numpy as np
 
-from dem_sim.objects.collision import AAWallCollision, Collision
-from dem_sim.objects.cv import CVManager
+from dem_sim.objects.collision import AAWallCollisionKernel
+from dem_sim.objects.cv import CellList
+from dem_sim.objects.history import RecordingPolicy
 from dem_sim.objects.particle import Particle
-from dem_sim.objects.walls import AAWall
-from dem_sim.util.file_io import particles_to_paraview
+from dem_sim.objects.particle_system import ParticleSystem
+from dem_sim.objects.simulation import Simulation
+from dem_sim.objects.sleep import SleepTracker
+from dem_sim.objects.timestep import TimestepController
+from dem_sim.util.file_io import particles_to_binary
 from random import random as rand
 
 import progressbar
 
 
 def simple_closed_box():
-    manager = CVManager(10, 0.5, -0.5)
     particles = []
     walls = generate_closed_cube_box(1, [0, 0, 0])
+    # Only the frames written out at 60 fps are recorded.
+    recording = RecordingPolicy(interval=1 / 60)
 
     for y in [-0.18, -0.07, 0.1, 0.21, 0.32, 0.43]:
         for x in np.arange(-0.4, 0.41, 0.2):
             for z in np.arange(-0.4, 0.41, 0.2):
                 pos = np.array([x + 0.05 * (rand() - 0.5), y, z + 0.05 * (rand() - 0.5)])
-                particles.append(Particle(len(particles), pos, np.array([pos[0], 0, pos[2]]), diameter=0.1))
+                particles.append(Particle(len(particles), pos, np.array([pos[0], 0, pos[2]]), diameter=0.1,
+                                          recording=recording))
 
-    wall_cols = []
-    for p in particles:
-        for wall in walls:
-            wall_cols.append(
-                AAWallCollision(p, wall, restitution=0.8, friction_coefficient=0.4, friction_stiffness=5e4))
+    system = ParticleSystem.from_particles(particles)
+    wall_kernel = AAWallCollisionKernel(restitution=0.8, friction_coefficient=0.4, friction_stiffness=5e4)
+    sim = Simulation(system, CellList(8, 0.5, -0.5), walls, wall_kernel=wall_kernel, sleep=SleepTracker())
 
-    timestep = 0.0005
-    last_time = 0
+    # Particle contacts last 7.2e-3 s, so 15 steps per contact keeps them, including the step in which each impact
+    # starts, at least as finely resolved as the fixed 5e-4 s timestep this sim was validated with. The 0.125 m cells
+    # leave room for the broad phase to find the particles that could come into contact within a step.
+    timestep = TimestepController(max_timestep=0.005, contact_steps=15)
     max_time = 15
     bar = progressbar.ProgressBar(redirect_stdout=True, max_value=max_time)
-    for t in np.arange(0, max_time, timestep):
-        bar.update(t)
-        manager.add_particles(particles)
-        p_cols = manager.get_collisions()
-        delta_t = t - last_time
-        for col in p_cols + wall_cols:
-            col.calculate(delta_t)
-        for p in particles:
-            p.iterate(delta_t, implicit=True)
-        last_time = t
-        manager.reset()
+    sim.run(max_time, timestep, lambda s: bar.update(s.system.time))
     bar.finish()
-    particles_to_paraview(particles, "simple_closed_box", "../../run/simple_closed_box/", ignore_warnings=True)
+    sim.report()
+    timestep.report()
+    particles_to_binary(particles, "simple_closed_box", "../../run/simple_closed_box/", ignore_warnings=True, fps=60)
 
 
 simple_closed_box()
@@ -4,11 +4,18 @@ from random import random
 import matplotlib.pyplot as plt
 import numpy as np
 
+from dem_sim.objects.fields import FunctionField, GriddedField, UniformField
 from dem_sim.objects.particle import Particle
+from dem_sim.objects.particle_system import ParticleSystem
 
 
 def taylor_green_vortex(x, y, z):
-    """ Calculates Taylor Green vortex flow velocities. """
+    """
+    Calculates Taylor Green vortex flow velocities.
+
+    x, y, and z can be numbers or arrays of the same shape, in which case the result has an extra leading axis of
+    length 3.
+    """
 
     A = 0.14
     B = A
@@ -22,20 +29,33 @@ def taylor_green_vortex(x, y, z):
     y_p = y + (math.pi / (a * 2))
     z_p = z + (math.pi / (a * 2))
 
-    u = A * math.cos(a * x_p) * math.sin(b * y_p) * math.sin(c * z_p)
-    v = B * math.sin(a * x_p) * math.cos(b * y_p) * math.sin(c * z_p)
-    w = C * math.sin(a * x_p) * math.sin(b * y_p) * math.cos(c * z_p)
+    sin_x = np.sin(a * x_p)
+    sin_y = np.sin(b * y_p)
+    sin_z = np.sin(c * z_p)
+    u = A * np.cos(a * x_p) * sin_y * sin_z
+    v = B * sin_x * np.cos(b * y_p) * sin_z
+    w = C * sin_x * sin_y * np.cos(c * z_p)
 
     return np.array([u, v, w])
 
 
-def taylor_green_vortex_sim(number_of_particles=50):
-    def get_vel_fluid(self):
-        x = self.pos[0]
-        y = self.pos[1]
-        z = self.pos[2]
+# No gravity, shared by every particle.
+no_gravity = UniformField(lambda time: [0, 0, 0])
+
+# Taylor Green vortex flow for an (N, 3) array of positions.
+taylor_green_vortex_field = FunctionField(lambda positions: taylor_green_vortex(*positions.T).T)
+
 
-        return taylor_green_vortex(x, y, z)
+def taylor_green_vortex_sim(number_of_particles=50, resolution=None):
+    """
+    :param number_of_particles: Number of particles, started at random positions in the vortex.
+    :param resolution: If given, the flow is sampled onto a lattice with this many cells along each axis, and
+                       interpolated.
+    """
+    vel_fluid = taylor_green_vortex_field
+    if resolution is not None:
+        vel_fluid = GriddedField(taylor_green_vortex_field, [-math.pi] * 3, [math.pi] * 3, resolution)
+        print("Taylor Green vortex max interpolation error: {0:.3g}".format(vel_fluid.estimate_error()))
 
     particles = []
     for i in range(number_of_particles):
@@ -49,15 +69,17 @@ def taylor_green_vortex_sim(number_of_particles=50):
                      pos, 
                      [0, 0, 0], 
                      diameter=0.001, 
-                     get_vel_fluid=get_vel_fluid, 
-                     get_gravity=lambda _: [0, 0, 0])
+                     get_vel_fluid=vel_fluid,
+                     get_gravity=no_gravity)
 
         particles.append(p)
 
+    # The flow is evaluated for every particle in a single call per step.
+    system = ParticleSystem.from_particles(particles)
     last_time = 0
     for t in range(500):
         time = t / 10
-        [p.iterate(time - last_time) for p in particles]
+        system.iterate(time - last_time)
         last_time = time
 
     return particles
@@ -3,6 +3,8 @@ from random import random as rand
 from dem_sim.generators.box import generate_closed_cube_box
 from dem_sim.objects.cv import *
 from dem_sim.objects.particle import *
+from dem_sim.objects.particle_system import ParticleSystem
+from dem_sim.util.hashing_utils import pair_keys, commutative_cantor
 from dem_sim.objects.collision import *
 import progressbar
 import time
@@ -151,3 +153,92 @@ class TestCV(TestCase):
             print(run_time)
         plt.plot(ns, times)
         plt.show()
+
+
+class TestCellList(TestCase):
+    def test_pairs_match_cv_manager(self):
+        rng = np.random.RandomState(1)
+        particles = [Particle(i, rng.uniform(-0.5, 0.5, 3), [0, 0, 0], diameter=0.1) for i in range(300)]
+
+        manager = CVManager(10, 0.5, -0.5)
+        manager.add_particles(particles)
+        expected = set()
+        for col in manager.get_collisions():
+            if col.p1.pid != col.p2.pid:
+                expected.add(tuple(sorted([col.p1.pid, col.p2.pid])))
+
+        cells = CellList(10, 0.5, -0.5)
+        cells.add_particles(ParticleSystem.from_particles(particles))
+        i, j = cells.get_pairs()
+        self.assertTrue(np.all(i < j))
+        self.assertEqual(len(i), len(expected))
+        self.assertEqual(set(zip(i.tolist(), j.tolist())), expected)
+
+    def test_cell_slices(self):
+        positions = np.array([[0.01, 0.01, 0.01], [-0.45, 0.2, 0.3], [0.02, 0.03, 0.04], [2, 2, 2]])
+        cells = CellList(10, 0.5, -0.5)
+        cells.add_particles(ParticleSystem(positions, np.zeros((4, 3))))
+        self.assertEqual(sorted(cells.get_nearby_particles([5, 5, 5]).tolist()), [0, 2])
+        # Out of bounds particles are kept in the boundary cells.
+        self.assertEqual(cells.get_nearby_particles([9, 9, 9]).tolist(), [3])
+
+    def test_sort_by_cell(self):
+        rng = np.random.RandomState(0)
+        positions = rng.uniform(-0.5, 0.5, (20000, 3))
+        # 12 ** 3 cells take one 16-bit sorting pass and 52 ** 3 cells take two.
+        for cvs_per_edge in [10, 50]:
+            cells = CellList(cvs_per_edge, 0.5, -0.5)
+            cells.add_particles(positions)
+            np.testing.assert_array_equal(cells.order, np.argsort(cells.cell_ids, kind='stable'))
+
+
+class TestVerletList(TestCase):
+    def test_verlet_pairs_contain_contacts(self):
+        rng = np.random.RandomState(2)
+        system = ParticleSystem(rng.uniform(-0.45, 0.45, (200, 3)), rng.uniform(-0.5, 0.5, (200, 3)), diameters=0.08)
+        verlet = VerletList(CellList(8, 0.5, -0.5), skin=0.02)
+        cells = CellList(8, 0.5, -0.5)
+        for _ in range(50):
+            i, j = verlet.get_pairs(system)
+            cells.add_particles(system)
+            i_all, j_all = cells.get_pairs()
+            separation = system.pos[j_all] - system.pos[i_all]
+            contact = np.einsum('ij,ij->i', separation, separation) < 0.08 ** 2
+            self.assertTrue(set(zip(i_all[contact], j_all[contact])) <= set(zip(i, j)))
+            system.pos += system.vel * 0.005
+
+        self.assertEqual(verlet.steps, 50)
+        self.assertGreater(verlet.rebuild_count, 1)
+        self.assertLess(verlet.rebuild_count, 50)
+        self.assertAlmostEqual(verlet.average_steps_between_rebuilds, 50 / verlet.rebuild_count)
+
+    def test_pairs_unique(self):
+        rng = np.random.RandomState(3)
+        # Dense packing so that many pairs share a cell.
+        system = ParticleSystem(rng.uniform(-0.5, 0.5, (2000, 3)), np.zeros((2000, 3)))
+        cells = CellList(5, 0.5, -0.5)
+        cells.add_particles(system)
+        i, j = cells.get_pairs()
+        self.assertTrue(np.all(i < j))
+        self.assertEqual(len(np.unique(pair_keys(i, j))), len(i))
+
+        # Every pair within a cell length must be found.
+        separation = system.pos[:, np.newaxis, :] - system.pos[np.newaxis, :, :]
+        close = np.einsum('ijk,ijk->ij', separation, separation) < cells.cv_length ** 2
+        expected = np.count_nonzero(np.triu(close, 1))
+        found = np.count_nonzero(np.einsum('ij,ij->i', system.pos[j] - system.pos[i],
+                                           system.pos[j] - system.pos[i]) < cells.cv_length ** 2)
+        self.assertEqual(found, expected)
+
+
+class TestHashing(TestCase):
+    def test_pair_keys_exact(self):
+        i = np.array([0, 3, 1500000, 2 ** 31 - 1])
+        j = np.array([1, 2, 1500001, 2 ** 31 - 2])
+        keys = pair_keys(i, j)
+        self.assertEqual(keys.dtype, np.int64)
+        np.testing.assert_array_equal(keys, pair_keys(j, i))
+        self.assertEqual(len(np.unique(keys)), 4)
+        self.assertEqual(keys[2] >> 32, 1500000)
+        self.assertEqual(keys[2] & 0xFFFFFFFF, 1500001)
+        self.assertEqual(commutative_cantor(1500000, 1500001), 4500004500001 + 1500001)
@@ -0,0 +1,58 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from dem_sim.bench.__main__ import main
+from dem_sim.bench.macro import closed_box_simulation, run_macro_benchmarks
+from dem_sim.bench.micro import micro_benchmarks, run_micro_benchmarks
+from dem_sim.bench.results import create_results, save_results, load_results, compare_results
+
+
+class TestBench(TestCase):
+    def test_micro_benchmarks(self):
+        results = run_micro_benchmarks(min_time=0.01, repeat=1)
+        self.assertEqual(set(results), set(micro_benchmarks))
+        for result in results.values():
+            self.assertGreater(result["particle_steps_per_second"], 0)
+            self.assertEqual(result["particles_per_call"], 150)
+
+    def test_closed_box(self):
+        sim = closed_box_simulation(150)
+        self.assertEqual(len(sim.system), 150)
+        self.assertAlmostEqual(sim.cell_list.max_bound, 0.5)
+        # Particles move outwards with the velocities of the closed box sim.
+        np.testing.assert_allclose(sim.system.vel, sim.system.pos * [1, 0, 1])
+
+        sim = closed_box_simulation(1000)
+        self.assertEqual(len(sim.system), 1000)
+        # Every particle starts inside the box.
+        self.assertLess(abs(sim.system.pos).max() + 0.05, sim.cell_list.max_bound)
+
+        results = run_macro_benchmarks([50], steps=2)
+        self.assertGreater(results["closed_box.50"]["particle_steps_per_second"], 0)
+
+    def test_compare(self):
+        baseline = create_results({"a": {"particle_steps_per_second": 100, "seconds_per_call": 1},
+                                   "b": {"particle_steps_per_second": 100, "seconds_per_call": 1},
+                                   "c": {"particle_steps_per_second": 100, "seconds_per_call": 1}})
+        current = create_results({"a": {"particle_steps_per_second": 95, "seconds_per_call": 1},
+                                  "b": {"particle_steps_per_second": 80, "seconds_per_call": 1},
+                                  "d": {"particle_steps_per_second": 100, "seconds_per_call": 1}})
+        rows, missing = compare_results(baseline, current, threshold=0.1)
+        self.assertEqual([(row[0], row[4]) for row in rows], [("a", False), ("b", True)])
+        self.assertEqual(missing, ["c", "d"])
+
+        with tempfile.TemporaryDirectory() as directory:
+            baseline_file = os.path.join(directory, "baseline.json")
+            current_file = os.path.join(directory, "current.json")
+            save_results(baseline, baseline_file)
+            save_results(current, current_file)
+            self.assertEqual(load_results(baseline_file), baseline)
+            self.assertEqual(main(["compare", baseline_file, current_file]), 1)
+            self.assertEqual(main(["compare", baseline_file, current_file, "--threshold", "0.25"]), 0)
+
+            output = os.path.join(directory, "results.json")
+            self.assertEqual(main(["run", "--macro", "--sizes", "20", "--steps", "1", "-o", output]), 0)
+            self.assertIn("closed_box.20", load_results(output)["results"])
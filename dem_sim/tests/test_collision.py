@@ -1,8 +1,15 @@
 from unittest import TestCase
 from dem_sim.objects.collision import *
 from dem_sim.objects.particle import Particle
+from dem_sim.objects.particle_system import ParticleSystem
+from dem_sim.objects.contacts import ContactRegistry
+from dem_sim.objects.materials import Material, MaterialTable
+from dem_sim.objects.walls import AAWall
+from dem_sim.util.hashing_utils import pair_keys
+from dem_sim.generators.box import generate_open_cube_box
 from dem_sim.util.file_io import particles_to_paraview
 import numpy as np
+import math
 import matplotlib.pyplot as plt
 import dem_sim.util.vector_utils as vect
 
@@ -271,3 +278,171 @@ class TestCollision(TestCase):
             last_time = time
         print("Final offset = {0}".format(p.pos[1]))
         particles_to_paraview([p], "side_wall_col", "../../run/side_wall_collision/")
+
+
+class TestCollisionKernel(TestCase):
+    def test_kernel_matches_collision(self):
+        """ Tests that the batch kernel reproduces the forces of individual Collision objects. """
+        rng = np.random.RandomState(0)
+        n = 40
+        positions = rng.uniform(-0.2, 0.2, (n, 3))
+        velocities = rng.uniform(-1, 1, (n, 3))
+        diameters = rng.uniform(0.05, 0.15, n)
+        densities = rng.uniform(1000, 3000, n)
+
+        reference = [Particle(k, positions[k], velocities[k], diameters[k], densities[k]) for k in range(n)]
+        system = ParticleSystem(positions, velocities, diameters, densities)
+
+        i, j = np.triu_indices(n, 1)
+        for k in range(len(i)):
+            Collision(reference[i[k]], reference[j[k]], restitution=0.7, friction_coefficient=0.4,
+                      friction_stiffness=5e4).calculate(0.0005)
+        kernel = CollisionKernel(restitution=0.7, friction_coefficient=0.4, friction_stiffness=5e4)
+        kernel.calculate(system, i, j, 0.0005)
+
+        expected = np.array([np.sum(p.dem_forces, 0) if len(p.dem_forces) > 0 else np.zeros(3) for p in reference])
+        self.assertTrue(np.any(expected != 0))
+        np.testing.assert_allclose(system.forces, expected, rtol=1e-9, atol=1e-9)
+
+    def test_kernel_normal_collision(self):
+        """ Tests the kernel against a head-on Collision over a full collision duration. """
+        p1 = Particle(1, [0, 0, 0], [0, 0, 0], 0.1, density=1e99, get_gravity=lambda dummy: [0, 0, 0])
+        p2 = Particle(2, [0.1, 0, 0], [-2, 0, 0], 0.1, density=2000, get_gravity=lambda dummy: [0, 0, 0])
+        col = Collision(p1, p2, 1e5, restitution=0.8)
+        system = ParticleSystem([[0, 0, 0], [0.1, 0, 0]], [[0, 0, 0], [-2, 0, 0]], 0.1, [1e99, 2000],
+                                get_gravity=lambda s: np.zeros(3))
+        kernel = CollisionKernel(1e5, restitution=0.8)
+
+        timestep = math.pi * math.sqrt(p2.get_mass() / 1e5) / 32
+        for _ in range(40):
+            col.calculate(timestep)
+            p1.iterate(timestep)
+            p2.iterate(timestep)
+            kernel.calculate(system, [0], [1], timestep)
+            system.iterate(timestep)
+        np.testing.assert_allclose(system.pos[1], p2.pos, rtol=1e-9)
+        np.testing.assert_allclose(system.vel[1], p2.vel, rtol=1e-9)
+        self.assertGreater(system.vel[1][0], 0)
+
+    def test_kernel_with_registry(self):
+        """ Tests that a persistent contact registry gives the same forces and tracks contact lifetimes. """
+        positions = np.array([[0, 0, 0], [0.09, 0, 0], [0.5, 0, 0], [0.58, 0.01, 0]])
+        velocities = np.array([[0, 0, 0], [-0.1, 0.2, 0], [0, 0, 0], [0.5, 0, 0]])
+        system = ParticleSystem(positions, velocities, 0.1, get_gravity=lambda s: np.zeros(3))
+        reference = ParticleSystem(positions, velocities, 0.1, get_gravity=lambda s: np.zeros(3))
+        kernel = CollisionKernel()
+        registry = ContactRegistry(kernel)
+        i, j = np.triu_indices(4, 1)
+
+        kernel.calculate(system, i, j, 0.001, registry)
+        kernel.calculate(reference, i, j, 0.001)
+        np.testing.assert_allclose(system.forces, reference.forces)
+        self.assertEqual(len(registry), 2)
+        self.assertEqual(registry.created, 2)
+
+        system.forces[:] = 0
+        kernel.calculate(system, i, j, 0.001, registry)
+        np.testing.assert_array_equal(registry.age, [1, 1])
+        np.testing.assert_allclose(registry.tangential_displacement[0], [0, 0.2 * 0.002, 0])
+
+        # Separate the second pair.
+        system.pos[3] = [2, 0, 0]
+        kernel.calculate(system, i, j, 0.001, registry)
+        self.assertEqual(len(registry), 1)
+        self.assertEqual(registry.evicted, 1)
+        np.testing.assert_array_equal(registry.keys, pair_keys([0], [1]))
+
+    def test_wall_kernel_matches_wall_collision(self):
+        """ Tests the wall kernel against AAWallCollision objects, including particles outside the wall bounds. """
+        rng = np.random.RandomState(4)
+        n = 200
+        positions = rng.uniform(-0.6, 0.6, (n, 3))
+        velocities = rng.uniform(-1, 1, (n, 3))
+        diameters = rng.uniform(0.1, 0.3, n)
+        walls = generate_open_cube_box(1, [0, 0, 0])
+
+        reference = [Particle(k, positions[k], velocities[k], diameters[k]) for k in range(n)]
+        for p in reference:
+            for wall in walls:
+                AAWallCollision(p, wall, restitution=0.7, friction_coefficient=0.4, friction_stiffness=5e4).calculate(
+                    0.0005)
+        expected = np.array([np.sum(p.dem_forces, 0) if len(p.dem_forces) > 0 else np.zeros(3) for p in reference])
+
+        system = ParticleSystem(positions, velocities, diameters)
+        kernel = AAWallCollisionKernel(restitution=0.7, friction_coefficient=0.4, friction_stiffness=5e4)
+        particles, wall_idx = np.divmod(np.arange(n * len(walls)), len(walls))
+        contacts = kernel.calculate(system, AAWallTable(walls), particles, wall_idx, 0.0005)
+
+        self.assertGreater(contacts, 0)
+        np.testing.assert_allclose(system.forces, expected, rtol=1e-9, atol=1e-9)
+
+    def test_kernel_materials(self):
+        """ Tests that a kernel gathering multi-material properties matches Collision objects given the same ones. """
+        rng = np.random.RandomState(1)
+        n = 40
+        positions = rng.uniform(-0.2, 0.2, (n, 3))
+        velocities = rng.uniform(-1, 1, (n, 3))
+        diameters = rng.uniform(0.05, 0.15, n)
+        species = rng.randint(0, 3, n)
+        materials = MaterialTable([Material(stiffness=1e5, restitution=0.7, friction_coefficient=0.4),
+                                   Material(stiffness=4e5, restitution=0.5, friction_stiffness=2e5),
+                                   Material(stiffness=2e4, restitution=0.9, friction_coefficient=None)])
+        materials.set_pair(0, 1, restitution=0.3)
+
+        reference = [Particle(k, positions[k], velocities[k], diameters[k], species=species[k]) for k in range(n)]
+        i, j = np.triu_indices(n, 1)
+        for k in range(len(i)):
+            p1 = reference[i[k]]
+            p2 = reference[j[k]]
+            Collision(p1, p2, **materials.get_collision_properties(p1.species, p2.species)).calculate(0.0005)
+        expected = np.array([np.sum(p.dem_forces, 0) if len(p.dem_forces) > 0 else np.zeros(3) for p in reference])
+
+        system = ParticleSystem(positions, velocities, diameters, species=species)
+        kernel = CollisionKernel(materials=materials)
+        kernel.calculate(system, i, j, 0.0005)
+        np.testing.assert_allclose(system.forces, expected, rtol=1e-9, atol=1e-9)
+
+        # The registry stores the same damping coefficients.
+        registry_system = ParticleSystem(positions, velocities, diameters, species=species)
+        kernel.calculate(registry_system, i, j, 0.0005, ContactRegistry(kernel))
+        np.testing.assert_allclose(registry_system.forces, expected, rtol=1e-9, atol=1e-9)
+
+    def test_single_material_matches_kernel(self):
+        """ Tests that a table with one material gives the same forces as a kernel with that material's properties. """
+        rng = np.random.RandomState(2)
+        positions = rng.uniform(-0.2, 0.2, (40, 3))
+        velocities = rng.uniform(-1, 1, (40, 3))
+        i, j = np.triu_indices(40, 1)
+        system = ParticleSystem(positions, velocities, 0.1)
+        reference = ParticleSystem(positions, velocities, 0.1)
+        materials = MaterialTable([Material(restitution=0.7, friction_coefficient=0.4, friction_stiffness=5e4)])
+        CollisionKernel(materials=materials).calculate(system, i, j, 0.0005)
+        CollisionKernel(restitution=0.7, friction_coefficient=0.4, friction_stiffness=5e4).calculate(reference, i, j,
+                                                                                                    0.0005)
+        np.testing.assert_allclose(system.forces, reference.forces, rtol=1e-12, atol=1e-12)
+
+    def test_wall_kernel_materials(self):
+        """ Tests the wall kernel with wall materials against AAWallCollision objects given the same properties. """
+        rng = np.random.RandomState(5)
+        n = 200
+        positions = rng.uniform(-0.6, 0.6, (n, 3))
+        velocities = rng.uniform(-1, 1, (n, 3))
+        diameters = rng.uniform(0.1, 0.3, n)
+        species = rng.randint(0, 2, n)
+        materials = MaterialTable([Material(restitution=0.7, friction_coefficient=0.4, friction_stiffness=5e4),
+                                   Material(stiffness=3e5, restitution=0.4)])
+        steel = materials.add_wall(Material(stiffness=1e6, restitution=0.9, friction_coefficient=0.2))
+        walls = [AAWall(wall.min, wall.max, steel if k % 2 == 0 else 0)
+                 for k, wall in enumerate(generate_open_cube_box(1, [0, 0, 0]))]
+
+        reference = [Particle(k, positions[k], velocities[k], diameters[k]) for k in range(n)]
+        for p, s in zip(reference, species):
+            for wall in walls:
+                AAWallCollision(p, wall, **materials.get_wall_collision_properties(s, wall.material)).calculate(0.0005)
+        expected = np.array([np.sum(p.dem_forces, 0) if len(p.dem_forces) > 0 else np.zeros(3) for p in reference])
+
+        system = ParticleSystem(positions, velocities, diameters, species=species)
+        kernel = AAWallCollisionKernel(materials=materials)
+        particles, wall_idx = np.divmod(np.arange(n * len(walls)), len(walls))
+        self.assertGreater(kernel.calculate(system, AAWallTable(walls), particles, wall_idx, 0.0005), 0)
+        np.testing.assert_allclose(system.forces, expected, rtol=1e-9, atol=1e-9)
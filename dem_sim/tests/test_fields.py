@@ -0,0 +1,154 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from dem_sim.objects.fields import FunctionField, GriddedField, ParticleCallbackField, SnapshotField, UniformField
+from dem_sim.objects.particle import Particle
+from dem_sim.objects.particle_system import ParticleSystem
+from dem_sim.sims.taylor_green_vortex import taylor_green_vortex, taylor_green_vortex_field
+
+
+class TestFields(TestCase):
+    @staticmethod
+    def make_particles(get_vel_fluid):
+        return [Particle(i, [0.3 * i, 0.2 - 0.1 * i, 0.05 * i], [0, 0, 0], 0.001, get_vel_fluid=get_vel_fluid,
+                         get_gravity=lambda _: [0, 0, 0]) for i in range(5)]
+
+    def test_function_field(self):
+        positions = np.random.rand(20, 3)
+        expected = np.array([taylor_green_vortex(*pos) for pos in positions])
+        np.testing.assert_allclose(taylor_green_vortex_field.evaluate(positions, 0), expected, rtol=1e-12)
+
+        field = FunctionField(lambda pos, t: t * pos, time_dependent=True)
+        np.testing.assert_allclose(field.evaluate(positions, 2), 2 * positions)
+
+    def test_single_particle(self):
+        """ Tests that a Field gives a (3,) value for a single particle, as a per-particle callback does. """
+        p = self.make_particles(taylor_green_vortex_field)[3]
+        value = p.get_vel_fluid(p)
+        self.assertEqual(value.shape, (3,))
+        np.testing.assert_allclose(value, taylor_green_vortex(*p.pos), rtol=1e-12)
+
+    def test_batched_matches_callbacks(self):
+        """ Tests that a system with a shared Field matches per-particle callbacks evaluated one at a time. """
+        reference = self.make_particles(lambda p: taylor_green_vortex(*p.pos))
+        particles = self.make_particles(taylor_green_vortex_field)
+        system = ParticleSystem.from_particles(particles)
+        self.assertIs(system.get_vel_fluid, taylor_green_vortex_field)
+        for _ in range(100):
+            for p in reference:
+                p.iterate(0.01)
+            system.iterate(0.01)
+        for p_ref, p in zip(reference, particles):
+            np.testing.assert_allclose(p.pos, p_ref.pos, rtol=1e-12)
+            np.testing.assert_allclose(p.vel, p_ref.vel, rtol=1e-12)
+
+    def test_particle_callback_field(self):
+        particles = self.make_particles(lambda p: [p.pid, 0, 0])
+        system = ParticleSystem.from_particles(particles)
+        self.assertIsInstance(system.get_vel_fluid, ParticleCallbackField)
+        np.testing.assert_array_equal(system.get_vel_fluid(system)[:, 0], np.arange(5))
+
+    def test_uniform_field(self):
+        """ Tests that a uniform body force is evaluated once per step, and matches a per-particle callback. """
+        calls = []
+
+        def gravity(time):
+            calls.append(time)
+            return [9.81 * np.sin(0.25 * time ** 2), -9.81 * np.cos(0.25 * time ** 2), 0]
+
+        field = UniformField(gravity)
+        reference = self.make_particles(lambda p: [0.1, 0, 0])
+        for p in reference:
+            p.get_gravity = lambda particle: gravity(particle.time)
+        particles = self.make_particles(lambda p: [0.1, 0, 0])
+        for p in particles:
+            p.get_gravity = field
+        system = ParticleSystem.from_particles(particles)
+        self.assertIs(system.get_gravity, field)
+        self.assertEqual(field(system).shape, (3,))
+
+        for _ in range(100):
+            for p in reference:
+                p.iterate(0.01)
+        calls.clear()
+        for _ in range(100):
+            system.iterate(0.01)
+        self.assertEqual(len(calls), 100)
+        for p_ref, p in zip(reference, particles):
+            np.testing.assert_allclose(p.vel, p_ref.vel, rtol=1e-12)
+
+        # Particles stepped one at a time share the cached value.
+        calls.clear()
+        single = self.make_particles(lambda p: [0, 0, 0])
+        for p in single:
+            p.get_gravity = field
+            p.iterate(0.01)
+        self.assertEqual(len(calls), 1)
+
+    def test_gridded_field(self):
+        bounds = ([-1, -2, 0], [1, 0, 3])
+        # Trilinear interpolation is exact for a linear field.
+        linear = GriddedField(lambda pos: pos @ [[1, 2, 0], [0, -1, 3], [0.5, 0, 1]], *bounds, resolution=(4, 5, 6))
+        positions = np.random.rand(200, 3) * [2, 2, 3] + bounds[0]
+        np.testing.assert_allclose(linear.evaluate(positions, 0), positions @ [[1, 2, 0], [0, -1, 3], [0.5, 0, 1]],
+                                   atol=1e-12)
+        self.assertLess(linear.estimate_error(), 1e-12)
+
+        # The error against an analytic flow falls with the square of the lattice spacing.
+        errors = [GriddedField(taylor_green_vortex_field, *bounds, resolution=r).estimate_error() for r in [10, 20]]
+        self.assertLess(errors[1], errors[0] / 3)
+
+        # Points outside the lattice are evaluated exactly.
+        outside = np.array([[5, 5, 5], [-1, -2, -0.1]])
+        np.testing.assert_allclose(GriddedField(taylor_green_vortex_field, *bounds, resolution=4).evaluate(outside, 0),
+                                   taylor_green_vortex_field.evaluate(outside, 0))
+
+    def test_lazy_gridded_field(self):
+        """ Tests that lazily sampled blocks match the eager lattice, and that only max_blocks blocks are kept. """
+        bounds = ([-np.pi] * 3, [np.pi] * 3)
+        eager = GriddedField(taylor_green_vortex_field, *bounds, resolution=20)
+        lazy = GriddedField(taylor_green_vortex_field, *bounds, resolution=20, block_size=6, max_blocks=5)
+        positions = (2 * np.random.rand(500, 3) - 1) * np.pi
+        np.testing.assert_allclose(lazy.evaluate(positions, 0), eager.evaluate(positions, 0), rtol=1e-12, atol=1e-15)
+        self.assertEqual(len(lazy.blocks), 5)
+        self.assertEqual(lazy.misses, len(np.unique((positions + np.pi) // (2 * np.pi / 20) // 6, axis=0)))
+
+        # Points in one block only sample it once.
+        misses = lazy.misses
+        lazy.evaluate(np.zeros((10, 3)), 0)
+        lazy.evaluate(np.zeros((10, 3)), 0)
+        self.assertLessEqual(lazy.misses, misses + 1)
+        self.assertEqual(lazy.hits, 1)
+        np.testing.assert_allclose(lazy.evaluate(positions[:1], 0), eager.evaluate(positions[:1], 0))
+
+    def test_snapshot_field(self):
+        """ Tests space-time interpolation of snapshots, and that only the two bracketing snapshots are kept. """
+        def linear(positions, time):
+            return positions @ [[1, 0, 2], [0, 3, 0], [-1, 0, 1]] + [time, 2 * time, 0]
+
+        bounds = (np.array([0, 0, 0]), np.array([1, 2, 1]))
+        axes = [np.linspace(bounds[0][d], bounds[1][d], n) for d, n in enumerate([3, 5, 4])]
+        nodes = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1)
+        times = [0, 0.5, 1.5, 2]
+        with tempfile.TemporaryDirectory() as directory:
+            filenames = [os.path.join(directory, "snapshot_{0}.npy".format(k)) for k in range(len(times))]
+            for filename, time in zip(filenames, times):
+                np.save(filename, linear(nodes.reshape((-1, 3)), time).reshape(nodes.shape))
+
+            field = SnapshotField(filenames, times, *bounds)
+            positions = np.random.rand(50, 3) * bounds[1]
+            for time in [0, 0.2, 0.5, 1, 1.9, 2]:
+                np.testing.assert_allclose(field.evaluate(positions, time), linear(positions, time), atol=1e-12)
+                self.assertLessEqual(len(field.resident), 2)
+            self.assertEqual(field.loads, 4)
+            self.assertEqual(set(field.resident), {3})
+            # Snapshots are read through their memory maps rather than copied into memory.
+            self.assertIsInstance(field.resident[3], np.memmap)
+
+            # Outside the snapshot times and lattice the nearest values are held.
+            np.testing.assert_allclose(field.evaluate(np.array([[-1, 1, 3]]), -1), linear(np.array([[0, 1, 1]]), 0),
+                                       atol=1e-12)
+            np.testing.assert_allclose(field.evaluate(positions, 5), linear(positions, 2), atol=1e-12)
@@ -0,0 +1,109 @@
+import base64
+import gzip
+import os
+import tempfile
+from unittest import TestCase
+from xml.etree import ElementTree
+
+import numpy as np
+
+from dem_sim.objects.particle import Particle
+from dem_sim.objects.particle_system import ParticleSystem
+from dem_sim.util.file_io import particles_to_binary, Logger, TimeSeriesWriter, load_time_series
+from dem_sim.util.exceptions import ParameterException
+
+
+def read_vtp(filename):
+    """ Reads the appended data arrays of a .vtp file written by VTKWriter. """
+    with open(filename, 'rb') as file:
+        content = file.read()
+    start = content.index(b'_', content.index(b'<AppendedData')) + 1
+    xml = content[:start - 1] + b'</AppendedData></VTKFile>'
+    root = ElementTree.fromstring(xml)
+    encoding = root.find("AppendedData").get("encoding")
+
+    arrays = {}
+    for element in root.iter("DataArray"):
+        offset = int(element.get("offset"))
+        dtype = '<f8' if element.get("type") == "Float64" else '<i8'
+        if encoding == "raw":
+            size = int(np.frombuffer(content, '<u8', 1, start + offset)[0])
+            data = content[start + offset + 8:start + offset + 8 + size]
+        else:
+            size = int(np.frombuffer(base64.b64decode(content[start + offset:start + offset + 12]), '<u8', 1)[0])
+            data = base64.b64decode(content[start + offset:start + offset + 4 * ((8 + size + 2) // 3)])[8:]
+        arrays[element.get("Name")] = np.frombuffer(data, dtype).reshape((-1, int(element.get("NumberOfComponents"))))
+    return arrays
+
+
+class TestFileIO(TestCase):
+    def test_particles_to_binary(self):
+        particles = [Particle(i, [0.1 * i, 0, 0], [0, 0.2 * i, 0], diameter=0.05 + 0.01 * i) for i in range(4)]
+        system = ParticleSystem.from_particles(particles)
+        for _ in range(10):
+            system.iterate(0.01)
+
+        for encoding in ["raw", "base64"]:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "out") + os.sep
+                particles_to_binary(particles, "box", path, ignore_warnings=True, encoding=encoding)
+
+                collection = ElementTree.parse(path + "box.pvd").getroot()
+                datasets = collection.find("Collection").findall("DataSet")
+                self.assertEqual(len(datasets), 10)
+                for dataset in datasets:
+                    index = np.argmin(np.abs(system.times - float(dataset.get("timestep"))))
+                    arrays = read_vtp(path + dataset.get("file"))
+                    np.testing.assert_array_equal(arrays["position"], system.pos_history[index])
+                    np.testing.assert_array_equal(arrays["velocity"], system.vel_history[index])
+                    np.testing.assert_allclose(arrays["speed"][:, 0], np.linalg.norm(system.vel_history[index], axis=1))
+                    np.testing.assert_array_equal(arrays["diameter"][:, 0], system.diameter)
+                    np.testing.assert_array_equal(arrays["connectivity"][:, 0], np.arange(4))
+
+    def test_async_logger(self):
+        """ Tests that asynchronous and compressed logging write the same frames as synchronous logging. """
+        particles = [Particle(i, [0.1 * i, 0, 0], [0, 0.2 * i, 0]) for i in range(5)]
+        system = ParticleSystem.from_particles(particles)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "{0}") + os.sep
+            loggers = [Logger(particles, "log", path.format("sync"), ignore_warnings=True, fps=20),
+                       Logger(particles, "log", path.format("async"), ignore_warnings=True, fps=20,
+                              asynchronous=True, queue_size=1),
+                       Logger(particles, "log", path.format("gzip"), ignore_warnings=True, fps=20,
+                              asynchronous=True, compress=True)]
+            for _ in range(100):
+                system.iterate(0.01)
+                for logger in loggers:
+                    logger.log(system.time)
+            loggers[1].flush()
+            for logger in loggers:
+                logger.close()
+                logger.close()
+                with self.assertRaises(ParameterException):
+                    logger.log(system.time + 1)
+
+            filenames = sorted(os.listdir(path.format("sync")))
+            self.assertEqual(len(filenames), 20)
+            self.assertEqual(filenames, sorted(os.listdir(path.format("async"))))
+            for filename in filenames:
+                with open(path.format("sync") + filename) as file:
+                    expected = file.read()
+                with open(path.format("async") + filename) as file:
+                    self.assertEqual(file.read(), expected)
+                with gzip.open(path.format("gzip") + filename + ".gz", 'rt') as file:
+                    self.assertEqual(file.read(), expected)
+            self.assertEqual(expected.count("\n\n"), 5)
+
+    def test_time_series(self):
+        particles = [Particle(i, [0.1 * i, 0, 0], [0, 0.2 * i, 0]) for i in range(3)]
+        system = ParticleSystem.from_particles(particles)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "series.dat")
+            with TimeSeriesWriter(filename, 3) as writer:
+                for _ in range(20):
+                    system.iterate(0.01)
+                    writer.write(system.time, particles)
+            times, pos, vel = load_time_series(filename)
+        np.testing.assert_array_equal(times, system.times)
+        np.testing.assert_array_equal(pos, system.pos_history)
+        np.testing.assert_array_equal(vel, system.vel_history)
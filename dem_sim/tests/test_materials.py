@@ -0,0 +1,59 @@
+from unittest import TestCase
+
+import numpy as np
+
+from dem_sim.objects.cv import CVManager
+from dem_sim.objects.materials import Material, MaterialTable, calculate_damping_factor
+from dem_sim.objects.particle import Particle
+from dem_sim.util.exceptions import ParameterException
+
+
+class TestMaterials(TestCase):
+    def test_tables(self):
+        glass = Material("glass", stiffness=1e5, restitution=0.8, friction_coefficient=0.6)
+        rubber = Material("rubber", stiffness=3e4, restitution=0.5, friction_coefficient=None)
+        materials = MaterialTable([glass])
+        self.assertEqual(materials.add(rubber), 1)
+        self.assertEqual(materials.stiffness.shape, (2, 2))
+
+        # A material in contact with itself keeps its own properties, and different materials are mixed.
+        self.assertEqual(materials.stiffness[0, 0], 1e5)
+        self.assertEqual(materials.restitution[1, 1], 0.5)
+        self.assertAlmostEqual(materials.stiffness[0, 1], 2 * 1e5 * 3e4 / (1e5 + 3e4))
+        self.assertAlmostEqual(materials.restitution[1, 0], np.sqrt(0.4))
+        self.assertEqual(materials.friction_coefficient[0, 1], 0)
+        np.testing.assert_array_equal(materials.stiffness, materials.stiffness.T)
+
+        materials.set_pair(0, 1, restitution=0.3)
+        self.assertEqual(materials.restitution[1, 0], 0.3)
+        self.assertAlmostEqual(materials.damping_factor[0, 1], calculate_damping_factor(materials.stiffness[0, 1], 0.3))
+        with self.assertRaises(ParameterException):
+            materials.set_pair(0, 1, damping=0.3)
+        for restitution in [None, 0, 1.5]:
+            with self.assertRaises(ParameterException):
+                materials.set_pair(0, 1, stiffness=1, restitution=restitution)
+            with self.assertRaises(ParameterException):
+                materials.set_wall_pair(0, 0, restitution=restitution)
+        # Nothing is changed by a rejected pair.
+        self.assertEqual(materials.restitution[1, 0], 0.3)
+        self.assertNotEqual(materials.stiffness[1, 0], 1)
+
+        # Wall material 0 uses each species' own properties.
+        steel = materials.add_wall(Material("steel", stiffness=1e6))
+        self.assertEqual(materials.wall_stiffness.shape, (2, 2))
+        self.assertEqual(materials.wall_stiffness[1, 0], 3e4)
+        self.assertAlmostEqual(materials.wall_stiffness[0, steel], 2 * 1e5 * 1e6 / (1e5 + 1e6))
+        self.assertEqual(materials.add(Material()), 2)
+        self.assertEqual(materials.wall_stiffness.shape, (3, 2))
+        self.assertAlmostEqual(materials.max_wall_stiffness, materials.wall_stiffness[0, steel])
+
+    def test_cv_manager_materials(self):
+        """ Tests that CVManager collisions take their properties from the species of their particles. """
+        materials = MaterialTable([Material(stiffness=1e5), Material(stiffness=2e4, restitution=0.5)])
+        particles = [Particle(0, [0, 0, 0], [0, 0, 0], species=0), Particle(1, [0.05, 0, 0], [0, 0, 0], species=1)]
+        manager = CVManager(10, materials=materials)
+        manager.add_particles(particles)
+        collision = manager.get_collisions()[0]
+        self.assertAlmostEqual(collision.stiffness, materials.stiffness[0, 1])
+        self.assertAlmostEqual(collision.damping_coefficient,
+                               materials.damping_factor[0, 1] * np.sqrt(collision.get_reduced_particle_mass()))
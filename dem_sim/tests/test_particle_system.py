@@ -0,0 +1,144 @@
+from unittest import TestCase
+
+import numpy as np
+
+from dem_sim.objects.collision import Collision
+from dem_sim.objects.history import RecordingPolicy
+from dem_sim.objects.particle import Particle, LowMemParticle
+from dem_sim.objects.particle_system import ParticleSystem
+from dem_sim.util.exceptions import ParameterException
+
+
+class TestParticleSystem(TestCase):
+    @staticmethod
+    def make_particles(cls=Particle, **kwargs):
+        return [cls(0, [0, 0, 0], [0.1, 0, 0], 0.1, **kwargs),
+                cls(1, [0.09, 0.01, 0], [-0.1, 0, 0], 0.1, **kwargs),
+                cls(2, [1, 1, 1], [0, 0.5, 0], 0.2, density=1000, **kwargs)]
+
+    def test_iterate_matches_particles(self):
+        """ Tests that a vectorized system step reproduces per-particle stepping. """
+        for implicit in [True, False]:
+            reference = self.make_particles()
+            particles = self.make_particles()
+            system = ParticleSystem.from_particles(particles)
+            for _ in range(200):
+                Collision(reference[0], reference[1]).calculate(0.0005)
+                Collision(particles[0], particles[1]).calculate(0.0005)
+                for p in reference:
+                    p.iterate(0.0005, implicit=implicit)
+                system.iterate(0.0005, implicit=implicit)
+
+            for p_ref, p in zip(reference, particles):
+                np.testing.assert_allclose(p.pos, p_ref.pos, rtol=1e-12, atol=1e-15)
+                np.testing.assert_allclose(p.vel, p_ref.vel, rtol=1e-12, atol=1e-15)
+                np.testing.assert_allclose(np.array(p.pos_history), np.array(p_ref.pos_history), rtol=1e-12, atol=1e-15)
+            self.assertEqual(len(particles[0].times), 200)
+            self.assertAlmostEqual(particles[0].time, reference[0].time)
+
+    def test_particle_views(self):
+        particles = self.make_particles()
+        # Particles only get their own History once they record a state, which attached particles never do.
+        self.assertIsNone(particles[0].history)
+        system = ParticleSystem.from_particles(particles)
+        self.assertIsNone(particles[0].history)
+        self.assertEqual(len(particles[0].times), 0)
+        particles[1].pos = [5, 5, 5]
+        np.testing.assert_array_equal(system.pos[1], [5, 5, 5])
+        system.vel[2] = [1, 2, 3]
+        np.testing.assert_array_equal(particles[2].vel, [1, 2, 3])
+        particles[0].diameter = 0.3
+        self.assertAlmostEqual(system.mass[0], particles[0].get_mass())
+        with self.assertRaises(ParameterException):
+            particles[0].iterate(0.001)
+
+    def test_callbacks(self):
+        def get_gravity(p):
+            return [0, -p.time, 0]
+
+        reference = self.make_particles(get_gravity=get_gravity, get_vel_fluid=lambda p: [p.pos[1], 0, 0])
+        particles = self.make_particles(get_gravity=get_gravity, get_vel_fluid=lambda p: [p.pos[1], 0, 0])
+        system = ParticleSystem.from_particles(particles)
+        for _ in range(100):
+            for p in reference:
+                p.iterate(0.01)
+            system.iterate(0.01)
+        for p_ref, p in zip(reference, particles):
+            np.testing.assert_allclose(p.vel, p_ref.vel, rtol=1e-12)
+
+    def test_low_mem_particles(self):
+        particles = self.make_particles(LowMemParticle)
+        system = ParticleSystem.from_particles(particles)
+        system.iterate(0.01)
+        self.assertFalse(system.record_history)
+        # Systems that do not record history never allocate one for it.
+        self.assertIsNone(system.history)
+        self.assertIsNone(particles[0].pos_history)
+        self.assertEqual(len(system.times), 0)
+
+    def test_field_step(self):
+        """ Tests that fields are evaluated once per field step and held or interpolated in between. """
+        evaluations = []
+
+        def get_gravity(system):
+            evaluations.append(system.time)
+            return [0, -system.time, 0]
+
+        def make_system(**kwargs):
+            return ParticleSystem([[0, 0, 0], [1, 0, 0]], [[0, 0, 0], [0, 1, 0]], get_gravity=get_gravity, **kwargs)
+
+        reference = make_system()
+        held = make_system(field_step=0.0005)
+        for _ in range(100):
+            reference.iterate(0.0005)
+            held.iterate(0.0005)
+        np.testing.assert_array_equal(held.vel, reference.vel)
+
+        # Gravity is linear in time, so interpolating between evaluations is exact.
+        interpolated = make_system(field_step=0.005, interpolate_fields=True)
+        del evaluations[:]
+        for _ in range(100):
+            interpolated.iterate(0.0005)
+        np.testing.assert_allclose(interpolated.vel, reference.vel, rtol=1e-10)
+        self.assertEqual(len(evaluations), 11)
+        self.assertEqual(interpolated.time, reference.time)
+
+    def test_history(self):
+        """ Tests that histories are recorded into growing arrays and exposed as views without copying. """
+        particles = self.make_particles()
+        system = ParticleSystem.from_particles(particles)
+        standalone = Particle(3, [0, 0, 0], [1, 0, 0])
+        for _ in range(100):
+            system.iterate(0.01)
+            standalone.iterate(0.01)
+
+        self.assertEqual(system.pos_history.shape, (100, 3, 3))
+        self.assertEqual(system.history.capacity, 128)
+        np.testing.assert_array_equal(system.pos_history[-1], system.pos)
+        np.testing.assert_allclose(system.times, np.arange(1, 101) * 0.01)
+        self.assertTrue(np.shares_memory(particles[1].pos_history, system.pos_history))
+        np.testing.assert_array_equal(particles[1].vel_history, system.vel_history[:, 1])
+
+        self.assertEqual(standalone.pos_history.shape, (100, 3))
+        np.testing.assert_array_equal(standalone.vel_history[-1], standalone.vel)
+        self.assertEqual(standalone.get_speed_at_time(standalone.times[10]), standalone.get_speed_at_index(10))
+
+    def test_recording_policies(self):
+        reference = ParticleSystem([[0, 0, 0]], [[1, 0, 0]], record_history=True)
+        strided = ParticleSystem([[0, 0, 0]], [[1, 0, 0]], record_history=RecordingPolicy(stride=3))
+        timed = ParticleSystem.from_particles(self.make_particles(recording=RecordingPolicy(interval=0.025)))
+        ring = ParticleSystem.from_particles(self.make_particles(recording=RecordingPolicy(length=5)))
+        standalone = Particle(0, [0, 0, 0], [1, 0, 0], recording=RecordingPolicy(length=5))
+        for _ in range(12):
+            for system in [reference, strided, timed, ring]:
+                system.iterate(0.01)
+            standalone.iterate(0.01)
+
+        np.testing.assert_array_equal(strided.pos_history, reference.pos_history[::3])
+        np.testing.assert_allclose(timed.times, [0.01, 0.04, 0.07, 0.1])
+        np.testing.assert_allclose(ring.times, np.arange(8, 13) * 0.01)
+        self.assertEqual(ring.pos_history.shape, (5, 3, 3))
+        np.testing.assert_array_equal(ring.pos_history[-1], ring.pos)
+        self.assertTrue(np.shares_memory(ring.particles[0].pos_history, ring.history._pos))
+        np.testing.assert_allclose(standalone.times, np.arange(8, 13) * 0.01)
+        np.testing.assert_array_equal(standalone.pos_history[:, 0], reference.pos_history[7:, 0, 0])
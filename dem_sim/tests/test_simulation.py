@@ -0,0 +1,308 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from dem_sim.generators.box import generate_closed_cube_box
+from dem_sim.objects.checkpoint import Checkpointer, resume
+from dem_sim.objects.collision import AAWallCollision, AAWallCollisionKernel, CollisionKernel
+from dem_sim.objects.cv import CellList
+from dem_sim.objects.fields import UniformField
+from dem_sim.objects.parallel import ParallelSimulation
+from dem_sim.objects.particle import Particle
+from dem_sim.objects.particle_system import ParticleSystem
+from dem_sim.objects.simulation import Simulation, thread_speedup
+from dem_sim.objects.sleep import SleepTracker
+from dem_sim.objects.timestep import TimestepController
+from dem_sim.sims.gravity_shift_closed_box import gravity_shift_closed_box
+from dem_sim.util.exceptions import ParameterException
+
+
+def make_box_particles(seed=0):
+    rng = np.random.RandomState(seed)
+    particles = []
+    for y in [-0.18, 0.1, 0.32]:
+        for x in np.arange(-0.4, 0.41, 0.2):
+            for z in np.arange(-0.4, 0.41, 0.2):
+                pos = np.array([x + 0.05 * (rng.uniform() - 0.5), y, z + 0.05 * (rng.uniform() - 0.5)])
+                particles.append(Particle(len(particles), pos, np.array([pos[0], 0, pos[2]]), diameter=0.1))
+    return particles
+
+
+def draw_random():
+    return [random.gauss(0, 1), random.random(), np.random.standard_normal(), np.random.random()]
+
+
+WALL_PROPERTIES = {"restitution": 0.8, "friction_coefficient": 0.4, "friction_stiffness": 5e4}
+
+
+class TestSimulation(TestCase):
+    def test_wall_broad_phase(self):
+        """ Tests that the wall broad phase and kernel reproduce every particle against every AAWallCollision. """
+        walls = generate_closed_cube_box(1, [0, 0, 0])
+
+        reference = ParticleSystem.from_particles(make_box_particles())
+        wall_cols = [AAWallCollision(p, wall, **WALL_PROPERTIES) for p in reference.particles for wall in walls]
+        cells = CellList(10, 0.5, -0.5)
+        kernel = CollisionKernel()
+
+        system = ParticleSystem.from_particles(make_box_particles())
+        sim = Simulation(system, CellList(10, 0.5, -0.5), walls, wall_kernel=AAWallCollisionKernel(**WALL_PROPERTIES))
+
+        contacts = []
+        for _ in range(400):
+            cells.add_particles(reference)
+            i, j = cells.get_pairs()
+            kernel.calculate(reference, i, j, 0.0005)
+            contacts.append(sum(col.calculate(0.0005) for col in wall_cols))
+            reference.iterate(0.0005)
+            sim.step(0.0005)
+
+        np.testing.assert_allclose(system.pos, reference.pos, rtol=1e-10, atol=1e-12)
+        self.assertEqual(sim.wall_contacts, contacts)
+        self.assertGreater(sum(contacts), 0)
+        self.assertLess(np.mean(sim.wall_candidates), len(wall_cols))
+
+    def test_parallel_matches_serial(self):
+        walls = generate_closed_cube_box(1, [0, 0, 0])
+        wall_kernel = AAWallCollisionKernel(**WALL_PROPERTIES)
+
+        serial = Simulation(ParticleSystem.from_particles(make_box_particles()), CellList(10, 0.5, -0.5), walls,
+                            wall_kernel=wall_kernel)
+        system = ParticleSystem.from_particles(make_box_particles())
+        with ParallelSimulation(Simulation(system, CellList(10, 0.5, -0.5), walls, wall_kernel=wall_kernel),
+                                workers=3) as parallel:
+            for _ in range(300):
+                serial.step(0.0005)
+                parallel.step(0.0005)
+            np.testing.assert_allclose(system.pos, serial.system.pos, rtol=1e-9, atol=1e-12)
+            self.assertEqual(parallel.sim.wall_candidates, serial.wall_candidates)
+            self.assertEqual(parallel.sim.wall_contacts, serial.wall_contacts)
+
+        # State is copied back out of shared memory on close.
+        np.testing.assert_allclose(system.vel, serial.system.vel, rtol=1e-9, atol=1e-12)
+        self.assertAlmostEqual(system.time, serial.system.time)
+        self.assertEqual(len(system.times), 300)
+        # Particles from the serial and parallel runs are views into their own systems.
+        np.testing.assert_allclose(system.particles[5].pos, serial.system.particles[5].pos, rtol=1e-9)
+
+    def test_parallel_dense_matches_serial(self):
+        """ Tests a system dense enough for workers to share contacts across slab boundaries on every step. """
+        def make_simulation():
+            rng = np.random.RandomState(0)
+            pos = rng.uniform(-0.97, 0.97, (20000, 3))
+            vel = rng.uniform(-1, 1, (20000, 3))
+            walls = generate_closed_cube_box(2, [0, 0, 0])
+            return Simulation(ParticleSystem(pos, vel, 0.05), CellList(40, 1, -1), walls,
+                              wall_kernel=AAWallCollisionKernel(**WALL_PROPERTIES))
+
+        serial = make_simulation()
+        with ParallelSimulation(make_simulation(), workers=4) as parallel:
+            for _ in range(10):
+                serial.step(0.0002)
+                parallel.step(0.0002)
+                np.testing.assert_allclose(parallel.system.vel, serial.system.vel, rtol=1e-9, atol=1e-12)
+                self.assertEqual(parallel.pair_contacts, len(serial.registry))
+                self.assertAlmostEqual(parallel.min_contact_mass, serial.min_contact_mass)
+            self.assertEqual(parallel.wall_contacts, serial.wall_contacts)
+
+    def test_parallel_run(self):
+        """ Tests that a TimestepController drives a ParallelSimulation the same way as a Simulation. """
+        walls = generate_closed_cube_box(1, [0, 0, 0])
+        wall_kernel = AAWallCollisionKernel(**WALL_PROPERTIES)
+        serial = Simulation(ParticleSystem.from_particles(make_box_particles()), CellList(10, 0.5, -0.5), walls,
+                            wall_kernel=wall_kernel)
+        serial_controller = TimestepController(max_timestep=0.005)
+        serial.run(0.1, serial_controller)
+
+        sim = Simulation(ParticleSystem.from_particles(make_box_particles()), CellList(10, 0.5, -0.5), walls,
+                         wall_kernel=wall_kernel)
+        controller = TimestepController(max_timestep=0.005)
+        steps = []
+        with ParallelSimulation(sim, workers=2) as parallel:
+            parallel.run(0.1, controller, callback=lambda s: steps.append(s.system.time))
+        self.assertAlmostEqual(sim.system.time, 0.1, places=12)
+        self.assertEqual(len(steps), len(controller.timesteps))
+        np.testing.assert_allclose(controller.timesteps, serial_controller.timesteps, rtol=1e-9)
+        np.testing.assert_allclose(sim.system.pos, serial.system.pos, rtol=1e-9, atol=1e-12)
+
+    def test_parallel_checkpoint_resume(self):
+        """ Tests that a parallel run with held fields resumes from a checkpoint exactly as the uninterrupted run. """
+        walls = generate_closed_cube_box(1, [0, 0, 0])
+        gravity = UniformField(lambda t: [9.81 * np.sin(5 * t), -9.81 * np.cos(5 * t), 0])
+
+        def make_simulation():
+            system = ParticleSystem.from_particles(make_box_particles(), field_step=0.015, interpolate_fields=True)
+            system.get_gravity = gravity
+            return Simulation(system, CellList(5, 0.5, -0.5), walls,
+                              wall_kernel=AAWallCollisionKernel(**WALL_PROPERTIES))
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "box.checkpoint")
+            reference = make_simulation()
+            reference_timestep = TimestepController(max_timestep=0.002)
+            checkpointer = Checkpointer(filename, sim_interval=0.1)
+            with ParallelSimulation(reference, workers=2) as parallel:
+                parallel.run(0.1, reference_timestep, checkpointer=checkpointer)
+                parallel.run(0.2, reference_timestep)
+            self.assertEqual(checkpointer.saves, 1)
+
+            resumed = make_simulation()
+            resumed_timestep = TimestepController(max_timestep=0.002)
+            resumed_time = resume(resumed, filename, resumed_timestep)
+            # The checkpoint falls inside a field interval, so the held samples must be restored to continue exactly.
+            self.assertNotAlmostEqual(resumed_time % 0.015, 0)
+            self.assertIsNotNone(resumed.system.field_samples)
+            with ParallelSimulation(resumed, workers=2) as parallel:
+                parallel.run(0.2, resumed_timestep)
+
+        np.testing.assert_array_equal(resumed.system.pos, reference.system.pos)
+        np.testing.assert_array_equal(resumed.system.vel, reference.system.vel)
+        self.assertEqual(resumed.system.time, reference.system.time)
+
+    def test_parallel_unsupported_options(self):
+        walls = generate_closed_cube_box(1, [0, 0, 0])
+        for options in [{"skin": 0.02}, {"sleep": SleepTracker()}, {"threads": 2}]:
+            with Simulation(ParticleSystem.from_particles(make_box_particles()), CellList(10, 0.5, -0.5), walls,
+                            **options) as sim:
+                with self.assertRaises(ParameterException):
+                    ParallelSimulation(sim)
+
+    def test_threaded_matches_serial(self):
+        walls = generate_closed_cube_box(1, [0, 0, 0])
+
+        def make_simulation(threads):
+            return Simulation(ParticleSystem.from_particles(make_box_particles()), CellList(10, 0.5, -0.5), walls,
+                              wall_kernel=AAWallCollisionKernel(**WALL_PROPERTIES), threads=threads)
+
+        serial = make_simulation(None)
+        with make_simulation(4) as threaded:
+            for _ in range(300):
+                serial.step(0.0005)
+                threaded.step(0.0005)
+            np.testing.assert_allclose(threaded.system.pos, serial.system.pos, rtol=1e-9, atol=1e-12)
+            self.assertEqual(threaded.wall_contacts, serial.wall_contacts)
+            self.assertEqual(len(threaded.system.times), 300)
+
+        self.assertGreater(thread_speedup(make_simulation, 2, steps=5), 0)
+
+    def test_timestep_controller(self):
+        """ Tests that the timestep grows in free flight, shrinks to resolve contacts, and the run ends on time. """
+        walls = generate_closed_cube_box(1, [0, 0, 0])
+        system = ParticleSystem([[0, 0.3, 0]], [[0, 0, 0]])
+        sim = Simulation(system, CellList(10, 0.5, -0.5), walls, wall_kernel=AAWallCollisionKernel(**WALL_PROPERTIES))
+        controller = TimestepController(max_timestep=0.005, contact_steps=20)
+        sim.run(1.5, controller)
+
+        self.assertAlmostEqual(system.time, 1.5, places=12)
+        self.assertEqual(len(controller.timesteps), len(controller.times))
+        self.assertAlmostEqual(np.sum(controller.timesteps), 1.5, places=12)
+        contact_limit = np.pi * np.sqrt(system.mass[0] / 1e5) / 20
+        in_contact = np.array(sim.wall_contacts) > 0
+        self.assertTrue(np.any(in_contact))
+        timesteps = np.array(controller.timesteps)
+        self.assertTrue(np.all(timesteps[1:][in_contact[:-1]] <= contact_limit * (1 + 1e-12)))
+        # The step that brings the particle into contact with the floor is resolved as finely as the contact.
+        self.assertTrue(np.all(timesteps[:-1][in_contact[1:]] <= contact_limit * (1 + 1e-12)))
+        self.assertEqual(np.max(controller.timesteps), 0.005)
+        self.assertLess(len(controller.timesteps), 1.5 / contact_limit)
+
+    def test_sleep(self):
+        """ Tests that particles resting on the floor fall asleep and are woken by contact and by gravity changes. """
+        walls = generate_closed_cube_box(1, [0, 0, 0])
+        x, z = np.meshgrid(np.arange(-0.4, 0.41, 0.2), np.arange(-0.4, 0.41, 0.2))
+        pos = np.stack([x.ravel(), np.full(x.size, -0.4), z.ravel()], axis=1)
+        system = ParticleSystem(pos, np.zeros_like(pos))
+        sleep = SleepTracker(sleep_steps=50)
+        sim = Simulation(system, CellList(10, 0.5, -0.5), walls, sleep=sleep,
+                         wall_kernel=AAWallCollisionKernel(restitution=0.5, friction_coefficient=0.4))
+        sim.run(0.6, 0.0005)
+        self.assertEqual(sleep.active_fraction, 0)
+        self.assertEqual(sleep.active_fractions[0], 1)
+        np.testing.assert_array_equal(system.vel, 0)
+        resting = system.pos.copy()
+        sim.run(0.7, 0.0005)
+        np.testing.assert_array_equal(system.pos, resting)
+
+        # Particle 0 is pushed into particle 1, which lies next to it along x.
+        sleep.wake(0)
+        system.vel[0] = [2, 0, 0]
+        sim.run(0.8, 0.0005)
+        self.assertFalse(sleep.asleep[1])
+        self.assertTrue(sleep.asleep[24])
+
+        system.get_gravity = lambda s: np.array([1, -9.81, 0])
+        sim.step(0.0005)
+        self.assertEqual(sleep.active_fraction, 1)
+
+    def test_checkpoint_resume(self):
+        """ Tests that a run resumed from a checkpoint continues exactly as the uninterrupted run. """
+        walls = generate_closed_cube_box(1, [0, 0, 0])
+
+        def make_simulation():
+            system = ParticleSystem.from_particles(make_box_particles(), field_step=0.002)
+            return Simulation(system, CellList(5, 0.5, -0.5), walls, skin=0.05, sleep=SleepTracker(),
+                              wall_kernel=AAWallCollisionKernel(**WALL_PROPERTIES))
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "box.checkpoint")
+            reference = make_simulation()
+            reference_timestep = TimestepController(max_timestep=0.002)
+            checkpointer = Checkpointer(filename, sim_interval=0.1)
+            # Both generators hold a cached Gaussian when the checkpoint is saved.
+            random.gauss(0, 1)
+            np.random.standard_normal()
+            reference.run(0.1, reference_timestep, checkpointer=checkpointer)
+            expected_random = draw_random()
+            reference.run(0.2, reference_timestep)
+            self.assertEqual(checkpointer.saves, 1)
+            self.assertEqual(os.listdir(directory), ["box.checkpoint"])
+
+            resumed = make_simulation()
+            resumed_timestep = TimestepController(max_timestep=0.002)
+            self.assertEqual(resume(resumed, filename, resumed_timestep), 0.1)
+            self.assertEqual(draw_random(), expected_random)
+            resumed.run(0.2, resumed_timestep)
+
+        np.testing.assert_array_equal(resumed.system.pos, reference.system.pos)
+        np.testing.assert_array_equal(resumed.system.vel, reference.system.vel)
+        np.testing.assert_array_equal(resumed.system.pos_history, reference.system.pos_history)
+        np.testing.assert_array_equal(resumed.registry.tangential_displacement,
+                                      reference.registry.tangential_displacement)
+        self.assertEqual(resumed.system.time, reference.system.time)
+
+    def test_killed_run_resumes(self):
+        """ Tests that a killed gravity shift closed box run resumes from its checkpoint and ends as an uninterrupted
+        run does. """
+        def run_box(directory, max_time):
+            random.seed(0)
+            return gravity_shift_closed_box(os.path.join(directory, "frames") + os.sep,
+                                            os.path.join(directory, "box.checkpoint"), max_time, sim_interval=0.05)
+
+        with tempfile.TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, "reference"))
+            reference = run_box(os.path.join(directory, "reference"), 0.3)
+
+            killed = os.path.join(directory, "killed")
+            os.mkdir(killed)
+            process = multiprocessing.get_context("fork").Process(target=run_box, args=(killed, 0.3))
+            process.start()
+            while not os.path.exists(os.path.join(killed, "box.checkpoint")) and process.is_alive():
+                time.sleep(0.001)
+            process.kill()
+            process.join()
+            with np.load(os.path.join(killed, "box.checkpoint")) as data:
+                self.assertLess(data["time"], 0.3)
+            frames = os.listdir(os.path.join(killed, "frames"))
+            resumed = run_box(killed, 0.3)
+
+            # Frames logged before the kill are kept.
+            self.assertTrue(set(frames) <= set(os.listdir(os.path.join(killed, "frames"))))
+        self.assertEqual(resumed.wall_contacts, reference.wall_contacts)
+        np.testing.assert_array_equal(resumed.system.pos, reference.system.pos)
+        np.testing.assert_array_equal(resumed.system.vel, reference.system.vel)
+        self.assertEqual(resumed.system.time, reference.system.time)
@@ -1,6 +1,13 @@
+import base64
+import gzip
 import os
+import queue
 import shutil
-from dem_sim.util import num_utils
+import threading
+
+import numpy as np
+
+from dem_sim.util.exceptions import ParameterException
 
 
 def particles_from_files(filename_root):
@@ -8,7 +15,12 @@ def particles_from_files(filename_root):
     return particles
 
 
-def particles_to_binary(particles, filename_root, path="", ignore_warnings=False):
+def prepare_directory(path, ignore_warnings=False):
+    """
+    Creates an empty output directory, removing any existing one.
+
+    :return: False if the user chose not to remove an existing directory, True otherwise.
+    """
     if os.path.exists(path) and not ignore_warnings:
         ans = input(path + " already exists. Remove and continue? [y/N]\n")
         cont = True
@@ -25,7 +37,7 @@ def particles_to_binary(particles, filename_root, path="", ignore_warnings=False
                 cont = False
             else:
                 print("Ending...")
-                return
+                return False
     elif os.path.exists(path):
         shutil.rmtree(path)
         cont = True
@@ -37,17 +49,164 @@ def particles_to_binary(particles, filename_root, path="", ignore_warnings=False
                 print("PermissionError, trying again.")
     else:
         os.mkdir(path)
+    return True
 
-    times = particles[0].times
+
+def get_whole_system(particles):
+    """ Returns the ParticleSystem that the particles make up, in order, or None if they do not make up one. """
+    system = particles[0].system if len(particles) > 0 else None
+    if system is not None and system.particles is not None and len(system.particles) == len(particles) \
+            and all(p is q for p, q in zip(particles, system.particles)):
+        return system
+    return None
+
+
+def get_history_arrays(particles):
+    """
+    Gathers the recorded histories of a list of particles.
+
+    :return: (steps,) times, (steps, N, 3) positions, (steps, N, 3) velocities, and (N,) diameters.
+    """
+    system = get_whole_system(particles)
+    if system is not None:
+        # Particles that make up a whole system share its history block, so no copy is needed.
+        return system.times, system.pos_history, system.vel_history, system.diameter
+    return (np.asarray(particles[0].times),
+            np.stack([p.pos_history for p in particles], axis=1),
+            np.stack([p.vel_history for p in particles], axis=1),
+            np.array([p.diameter for p in particles], dtype=float))
+
+
+def particles_to_binary(particles, filename_root, path="", ignore_warnings=False, fps=None, encoding="raw"):
+    """
+    Writes the particle histories as binary VTK PolyData files, one per frame, with a .pvd collection for ParaView.
+
+    :param particles: A list of Particle objects with recorded histories.
+    :param filename_root: Root of the output file names.
+    :param path: Output directory.
+    :param ignore_warnings: Whether to remove an existing output directory without asking.
+    :param fps: Frames per second of simulation time to write. Default: every recorded state.
+    :param encoding: "raw" or "base64" encoding of the appended data.
+    """
+    if not prepare_directory(path, ignore_warnings):
+        return
+
+    times, pos_history, vel_history, diameters = get_history_arrays(particles)
+    writer = VTKWriter(filename_root, path, encoding)
+    last_log = None
     for i in range(len(times)):
-        millis = int(times[i] * 1000)
-        file = open(path + filename_root + "_" + str(millis) + ".raw", 'w')
-        for p in particles:
-            # TODO: Make this actually do binary output and test with ParaView.
-            file.write("{0}{1}{2}{3}".format(num_utils.float_to_bin(p.pos_history[i][0]),
-                                             num_utils.float_to_bin(p.pos_history[i][1]),
-                                             num_utils.float_to_bin(p.pos_history[i][2]),
-                                             num_utils.float_to_bin(p.get_speed_at_index(i))))
+        if fps is not None and last_log is not None and times[i] - last_log < 1 / fps:
+            continue
+        last_log = times[i]
+        writer.write(times[i], pos_history[i], vel_history[i], diameters)
+    writer.close()
+
+
+class VTKWriter:
+    """
+    Writes particle states as VTK XML PolyData (.vtp) files with appended binary data, plus a .pvd collection file
+    that lets ParaView load every frame as one time series.
+
+    Each frame holds position points with velocity, speed, and diameter point data. Every array is written with a
+    single buffered write.
+    """
+    filename_root = None
+    path = None
+    encoding = None
+    frames = None
+
+    def __init__(self, filename_root, path="", encoding="raw"):
+        """
+        :param filename_root: Root of the output file names.
+        :param path: Output directory, which must already exist.
+        :param encoding: "raw" for raw bytes or "base64" for base64 text in the appended data section.
+        """
+        if encoding not in ["raw", "base64"]:
+            raise ParameterException("Unknown VTK encoding: {0}".format(encoding))
+        self.filename_root = filename_root
+        self.path = path
+        self.encoding = encoding
+        self.frames = []
+
+    def write(self, time, positions, velocities, diameters):
+        """
+        Writes a single frame.
+
+        :param time: Simulation time of the frame.
+        :param positions: (N, 3) array of positions.
+        :param velocities: (N, 3) array of velocities.
+        :param diameters: (N,) array or a single diameter for all particles.
+        :return: The name of the file written.
+        """
+        positions = np.ascontiguousarray(positions, dtype='<f8')
+        velocities = np.ascontiguousarray(velocities, dtype='<f8')
+        n = len(positions)
+        diameters = np.ascontiguousarray(np.broadcast_to(np.asarray(diameters, dtype='<f8'), (n,)))
+        speed = np.sqrt(np.einsum('ij,ij->i', velocities, velocities))
+        vertices = np.arange(n, dtype='<i8')
+
+        # (section, name, components, array) in file order.
+        arrays = [("PointData", "velocity", 3, velocities),
+                  ("PointData", "speed", 1, speed),
+                  ("PointData", "diameter", 1, diameters),
+                  ("Points", "position", 3, positions),
+                  ("Verts", "connectivity", 1, vertices),
+                  ("Verts", "offsets", 1, vertices + 1)]
+
+        offsets = []
+        offset = 0
+        for _, _, _, array in arrays:
+            offsets.append(offset)
+            size = 8 + array.nbytes
+            offset += size if self.encoding == "raw" else 4 * ((size + 2) // 3)
+
+        sections = {"PointData": [], "Points": [], "Verts": []}
+        for (section, name, components, array), offset in zip(arrays, offsets):
+            data_type = "Float64" if array.dtype.kind == 'f' else "Int64"
+            sections[section].append(
+                '        <DataArray type="{0}" Name="{1}" NumberOfComponents="{2}" format="appended" offset="{3}"/>\n'
+                .format(data_type, name, components, offset))
+
+        header = ('<?xml version="1.0"?>\n'
+                  '<VTKFile type="PolyData" version="1.0" byte_order="LittleEndian" header_type="UInt64">\n'
+                  '  <PolyData>\n'
+                  '    <Piece NumberOfPoints="{0}" NumberOfVerts="{0}" NumberOfLines="0" NumberOfStrips="0" '
+                  'NumberOfPolys="0">\n'
+                  '      <PointData Scalars="speed" Vectors="velocity">\n{1}      </PointData>\n'
+                  '      <Points>\n{2}      </Points>\n'
+                  '      <Verts>\n{3}      </Verts>\n'
+                  '    </Piece>\n'
+                  '  </PolyData>\n'
+                  '  <AppendedData encoding="{4}">\n'
+                  '   _').format(n, "".join(sections["PointData"]), "".join(sections["Points"]),
+                                 "".join(sections["Verts"]), self.encoding)
+
+        filename = "{0}_{1}.vtp".format(self.filename_root, len(self.frames))
+        with open(self.path + filename, 'wb') as file:
+            file.write(header.encode())
+            for _, _, _, array in arrays:
+                size = np.array(array.nbytes, dtype='<u8')
+                if self.encoding == "raw":
+                    file.write(size.tobytes())
+                    array.tofile(file)
+                else:
+                    file.write(base64.b64encode(size.tobytes() + array.tobytes()))
+            file.write(b'\n  </AppendedData>\n</VTKFile>\n')
+
+        self.frames.append((time, filename))
+        return filename
+
+    def close(self):
+        """ Writes the .pvd collection file listing every frame written so far. """
+        with open(self.path + self.filename_root + ".pvd", 'w') as file:
+            file.write('<?xml version="1.0"?>\n'
+                       '<VTKFile type="Collection" version="0.1" byte_order="LittleEndian">\n'
+                       '  <Collection>\n')
+            for time, filename in self.frames:
+                file.write('    <DataSet timestep="{0!r}" group="" part="0" file="{1}"/>\n'.format(float(time),
+                                                                                                 filename))
+            file.write('  </Collection>\n'
+                       '</VTKFile>\n')
 
 
 def particles_to_file(particles, filename_root, path, time):
@@ -58,35 +217,71 @@ def particles_to_file(particles, filename_root, path, time):
     file.close()
 
 
+class TimeSeriesWriter:
+    """
+    Writes the positions and velocities of a fixed set of particles over time to a single binary file.
+
+    The file holds a header with the number of particles, followed by one row per recorded time holding the time and
+    then the positions and velocities of every particle, all as little-endian float64. The whole file can be read back
+    with load_time_series in one read.
+    """
+    magic = b"DEMTIME1"
+
+    filename = None
+    number_of_particles = None
+    file = None
+
+    def __init__(self, filename, number_of_particles):
+        """
+        :param filename: The output file name.
+        :param number_of_particles: Number of particles written at every time.
+        """
+        self.filename = filename
+        self.number_of_particles = number_of_particles
+        self.file = open(filename, 'wb')
+        self.file.write(self.magic + np.array(number_of_particles, dtype='<u8').tobytes())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, time, particles):
+        """ Appends a row with the current positions and velocities of the given particles. """
+        if len(particles) != self.number_of_particles:
+            raise ParameterException("Expected {0} particles, got {1}.".format(self.number_of_particles,
+                                                                              len(particles)))
+        row = np.empty(1 + 6 * self.number_of_particles, dtype='<f8')
+        row[0] = time
+        row[1:1 + 3 * self.number_of_particles] = np.ravel([p.pos for p in particles])
+        row[1 + 3 * self.number_of_particles:] = np.ravel([p.vel for p in particles])
+        row.tofile(self.file)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def load_time_series(filename):
+    """
+    Reads a file written by TimeSeriesWriter.
+
+    :return: (steps,) times, (steps, N, 3) positions, and (steps, N, 3) velocities.
+    """
+    with open(filename, 'rb') as file:
+        header = file.read(16)
+        if header[:8] != TimeSeriesWriter.magic:
+            raise ParameterException("{0} is not a time series file.".format(filename))
+        n = int(np.frombuffer(header, '<u8', 1, 8)[0])
+        rows = np.fromfile(file, dtype='<f8').reshape((-1, 1 + 6 * n))
+    return rows[:, 0], rows[:, 1:1 + 3 * n].reshape((-1, n, 3)), rows[:, 1 + 3 * n:].reshape((-1, n, 3))
+
+
 def particles_to_paraview(particles, filename_root, path="", ignore_warnings=False, fps=60):
-    if os.path.exists(path) and not ignore_warnings:
-        ans = input(path + " already exists. Remove and continue? [y/N]\n")
-        cont = True
-        while cont:
-            if ans == "y" or ans == "Y":
-                shutil.rmtree(path)
-                try:
-                    os.mkdir(path)
-                except PermissionError:
-                    print("PermissionError, path may be active somewhere.")
-                    ans = input("Try again? [y/N]\n")
-                    continue
-                print("Continuing...")
-                cont = False
-            else:
-                print("Ending...")
-                return
-    elif os.path.exists(path):
-        shutil.rmtree(path)
-        cont = True
-        while cont:
-            try:
-                os.mkdir(path)
-                cont = False
-            except PermissionError:
-                print("PermissionError, trying again.")
-    else:
-        os.mkdir(path)
+    if not prepare_directory(path, ignore_warnings):
+        return
 
     times = particles[0].times
     log_step = 1 / fps
@@ -111,7 +306,18 @@ def particles_to_paraview(particles, filename_root, path="", ignore_warnings=Fal
 
 
 class Logger:
-    # TODO: Add full state logging to allow for simulation continuation in the case of a crash.
+    """
+    Logs the particle positions and speeds to a text file per frame, at a fixed number of frames per second of
+    simulation time.
+
+    In asynchronous mode log() only copies the particle state into a bounded queue, and a background thread formats,
+    optionally compresses, and writes the files. When the queue is full log() blocks until the writer catches up.
+    flush() waits for every queued frame to be written, and close() also stops the writer thread. A closed Logger
+    cannot log any more frames.
+
+    Only positions and speeds are logged, full simulation state for restarts is saved by
+    dem_sim.objects.checkpoint.Checkpointer.
+    """
 
     particles = None
     filename_root = None
@@ -119,46 +325,55 @@ class Logger:
     ignore_warnings = None
     log_step = None
     last_log = None
+    compress = None
+
+    queue = None
+    writer = None
+    error = None
+    closed = False
 
-    def __init__(self, particles, filename_root, path="", ignore_warnings=False, fps=60):
+    def __init__(self, particles, filename_root, path="", ignore_warnings=False, fps=60, asynchronous=False,
+                 queue_size=8, compress=False, append=False):
+        """
+        :param particles: A list of Particle objects.
+        :param filename_root: Root of the output file names.
+        :param path: Output directory.
+        :param ignore_warnings: Whether to remove an existing output directory without asking.
+        :param fps: Frames per second of simulation time to log.
+        :param asynchronous: Whether to write files on a background thread.
+        :param queue_size: Maximum number of frames waiting to be written in asynchronous mode.
+        :param compress: Whether to gzip the files.
+        :param append: Whether to keep the frames in an existing output directory, e.g. when continuing a run resumed
+                       from a checkpoint, instead of removing it.
+        """
         self.particles = particles
         self.filename_root = filename_root
         self.path = path
         self.ignore_warnings = ignore_warnings
+        self.compress = compress
 
         self.log_step = 1 / fps
 
-        if os.path.exists(path) and not ignore_warnings:
-            ans = input(path + " already exists. Remove and continue? [y/N]\n")
-            cont = True
-            while cont:
-                if ans == "y" or ans == "Y":
-                    shutil.rmtree(path)
-                    try:
-                        os.mkdir(path)
-                    except PermissionError:
-                        print("PermissionError, path may be active somewhere.")
-                        ans = input("Try again? [y/N]\n")
-                        continue
-                    print("Continuing...")
-                    cont = False
-                else:
-                    print("Ending...")
-                    return
-        elif os.path.exists(path):
-            shutil.rmtree(path)
-            cont = True
-            while cont:
-                try:
-                    os.mkdir(path)
-                    cont = False
-                except PermissionError:
-                    print("PermissionError, trying again.")
-        else:
-            os.mkdir(path)
+        if append:
+            os.makedirs(path, exist_ok=True)
+        elif not prepare_directory(path, ignore_warnings):
+            return
         print("At {0} frames per second, logging every {1} seconds.".format(fps, round(self.log_step, 4)))
 
+        if asynchronous:
+            self.queue = queue.Queue(maxsize=queue_size)
+            self.writer = threading.Thread(target=self.run_writer, daemon=True)
+            self.writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     def log(self, time):
+        if self.closed:
+            raise ParameterException("Cannot log to a closed Logger.")
         log = False
         if self.last_log is None:
             self.last_log = time
@@ -168,7 +383,65 @@ class Logger:
             log = True
 
         if log:
-            millis = int(time * 1000)
-            file = open(self.path + self.filename_root + "_" + str(millis) + ".txt", 'w')
-            for p in self.particles:
-                file.write(str(p) + "\n")
+            pos, speed = self.get_state()
+            if self.queue is None:
+                self.write_frame(time, pos, speed)
+            else:
+                self.check_writer()
+                self.queue.put((time, pos, speed))
+
+    def get_state(self):
+        """ Returns copies of the current (N, 3) positions and (N,) speeds. """
+        system = get_whole_system(self.particles)
+        if system is not None:
+            return system.pos.copy(), system.get_speed()
+        return (np.array([p.pos for p in self.particles], dtype=float),
+                np.array([p.get_speed() for p in self.particles], dtype=float))
+
+    def write_frame(self, time, pos, speed):
+        millis = int(time * 1000)
+        filename = self.path + self.filename_root + "_" + str(millis) + ".txt"
+        lines = ["{0:.5f},{1:.5f},{2:.5f},{3:.5f}\n\n".format(x, y, z, v) for (x, y, z), v in zip(pos.tolist(),
+                                                                                                 speed.tolist())]
+        if self.compress:
+            with gzip.open(filename + ".gz", 'wt') as file:
+                file.write("".join(lines))
+        else:
+            with open(filename, 'w') as file:
+                file.write("".join(lines))
+
+    def run_writer(self):
+        while True:
+            frame = self.queue.get()
+            try:
+                if frame is None:
+                    return
+                if self.error is None:
+                    self.write_frame(*frame)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def check_writer(self):
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def flush(self):
+        """ Blocks until every logged frame has been written. """
+        if self.queue is not None:
+            self.queue.join()
+            self.check_writer()
+
+    def close(self):
+        """ Writes any remaining frames and stops the writer thread. """
+        self.closed = True
+        if self.writer is None:
+            return
+        self.queue.put(None)
+        self.writer.join()
+        self.writer = None
+        self.queue = None
+        self.check_writer()
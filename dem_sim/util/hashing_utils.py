@@ -1,7 +1,17 @@
+import numpy as np
+
+
 def commutative_cantor(i, j):
     i = int(i)
     j = int(j)
     i, j = sorted([i, j])
-    return (i + j) * (i + j + 1) / 2 + j
+    return (i + j) * (i + j + 1) // 2 + j
 
     # TODO: Test other hashing functions.
+
+
+def pair_keys(i, j):
+    """ Returns exact int64 keys for unordered index pairs, packing the smaller index into the upper 32 bits. """
+    i = np.asarray(i, dtype=np.int64)
+    j = np.asarray(j, dtype=np.int64)
+    return (np.minimum(i, j) << 32) | np.maximum(i, j)
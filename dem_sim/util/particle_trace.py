@@ -26,16 +26,15 @@ def trace_animation(particles, trail_length=None, speed=1, xmin=None, xmax=None,
     if zmin is not None and zmax is not None:
         ax.set_ylim(zmin, zmax)
 
-    for p in particles:
-        p.pos_history = np.array(p.pos_history)
+    pos_histories = [np.asarray(p.pos_history) for p in particles]
 
     # y and z axis switched so that particle y coordinates are on the vertical axis.
-    lines = [ax.plot(p.pos_history[0:1, 0], p.pos_history[0:1, 2], p.pos_history[0:1, 1])[0] for p in particles]
+    lines = [ax.plot(pos_history[0:1, 0], pos_history[0:1, 2], pos_history[0:1, 1])[0] for pos_history in pos_histories]
 
-    def update_lines(num, particles, lines):
+    def update_lines(num, pos_histories, lines):
         num *= speed
-        for line, p in zip(lines, particles):
-            p_hist_trans = p.pos_history.transpose()
+        for line, pos_history in zip(lines, pos_histories):
+            p_hist_trans = pos_history.transpose()
 
             i = 0
             if trail_length is not None:
@@ -46,8 +45,8 @@ def trace_animation(particles, trail_length=None, speed=1, xmin=None, xmax=None,
             line.set_data(p_hist_trans[(0, 2), i:num])
             line.set_3d_properties(p_hist_trans[1, i:num])
 
-    line_ani = animation.FuncAnimation(fig, update_lines, math.ceil(len(particles[0].pos_history) / speed),
-                                       fargs=(particles, lines), interval=1, blit=False, repeat=True)
+    line_ani = animation.FuncAnimation(fig, update_lines, math.ceil(len(pos_histories[0]) / speed),
+                                       fargs=(pos_histories, lines), interval=1, blit=False, repeat=True)
     plt.show()
     return line_ani
 
@@ -58,7 +57,7 @@ def trace_plot(particles):
     ax = fig.gca(projection='3d')
 
     for particle in particles:
-        particle.pos_history = np.array(particle.pos_history)
+        pos_history = np.asarray(particle.pos_history)
         # y and z axis switched so that particle y coordinates are on the vertical axis.
-        ax.plot(particle.pos_history[:, 0], particle.pos_history[:, 2], particle.pos_history[:, 1], color="r")
+        ax.plot(pos_history[:, 0], pos_history[:, 2], pos_history[:, 1], color="r")
     plt.show()
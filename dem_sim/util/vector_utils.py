@@ -24,3 +24,16 @@ def mag_squared(vector):
 def subtract(v1, v2):
     """ Subtracts v2 from v1. """
     return [v1[0] - v2[0], v1[1] - v2[1], v1[2] - v2[2]]
+
+
+def mag_rows(vectors):
+    """ Returns the magnitudes of each row of an (N, 3) array. """
+    return np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+
+
+def normalize_rows(vectors, magnitudes=None):
+    """ Normalizes each row of an (N, 3) array, leaving zero length rows as zero. """
+    if magnitudes is None:
+        magnitudes = mag_rows(vectors)
+    safe = np.where(magnitudes == 0, 1, magnitudes)
+    return vectors / safe[:, np.newaxis]
@@ -1,6 +1,6 @@
 from dem_sim.objects.collision import *
 from dem_sim.objects.particle import Particle
-from dem_sim.util.file_io import particles_to_file
+from dem_sim.util.file_io import TimeSeriesWriter
 import numpy as np
 from math import *
 
@@ -27,11 +27,12 @@ def drag():
         timestep = tau / interval
 
         last_time = 0
-        for time in np.arange(0, sim_length + timestep, timestep):
-            delta_t = time - last_time
-            p1.iterate(delta_t)
-            last_time = time
-            particles_to_file([p1], "1_drag_" + str(interval), "data/", time)
+        with TimeSeriesWriter("data/1_drag_" + str(interval) + ".dat", 1) as writer:
+            for time in np.arange(0, sim_length + timestep, timestep):
+                delta_t = time - last_time
+                p1.iterate(delta_t)
+                last_time = time
+                writer.write(time, [p1])
 
 
 drag()
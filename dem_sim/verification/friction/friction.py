@@ -1,6 +1,6 @@
 from dem_sim.objects.collision import *
 from dem_sim.objects.particle import Particle
-from dem_sim.util.file_io import particles_to_file
+from dem_sim.util.file_io import TimeSeriesWriter
 import numpy as np
 from math import *
 
@@ -37,14 +37,15 @@ def friction():
         log_step = 0.01
         last_log = None
 
-        for time in np.arange(0, 0.5 + timestep, timestep):
-            delta_t = time - last_time
-            fcol.calculate(delta_t)
-            fp.iterate(delta_t)
-            last_time = time
-            if last_log is None or time - last_log >= log_step:
-                particles_to_file([fp], "1_friction_" + str(interval), "data/", time)
-                last_log = time
+        with TimeSeriesWriter("data/1_friction_" + str(interval) + ".dat", 1) as writer:
+            for time in np.arange(0, 0.5 + timestep, timestep):
+                delta_t = time - last_time
+                fcol.calculate(delta_t)
+                fp.iterate(delta_t)
+                last_time = time
+                if last_log is None or time - last_log >= log_step:
+                    writer.write(time, [fp])
+                    last_log = time
 
 
 friction()
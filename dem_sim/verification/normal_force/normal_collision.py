@@ -1,6 +1,6 @@
 from dem_sim.objects.collision import *
 from dem_sim.objects.particle import Particle
-from dem_sim.util.file_io import particles_to_file
+from dem_sim.util.file_io import TimeSeriesWriter
 import numpy as np
 from math import *
 
@@ -27,13 +27,14 @@ def normal_collision():
         timestep = col_duration / interval
 
         last_time = 0
-        for time in np.arange(0, col_duration + timestep, timestep):
-            delta_t = time - last_time
-            col.calculate(delta_t)
-            p1.iterate(delta_t)
-            p2.iterate(delta_t)
-            last_time = time
-            particles_to_file([p1, p2], "2_normal_force_" + str(interval), "data/", time)
+        with TimeSeriesWriter("data/2_normal_force_" + str(interval) + ".dat", 2) as writer:
+            for time in np.arange(0, col_duration + timestep, timestep):
+                delta_t = time - last_time
+                col.calculate(delta_t)
+                p1.iterate(delta_t)
+                p2.iterate(delta_t)
+                last_time = time
+                writer.write(time, [p1, p2])
 
 
 normal_collision()
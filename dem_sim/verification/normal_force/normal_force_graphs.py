@@ -4,6 +4,8 @@ import matplotlib.pyplot as plt
 import os
 import re
 
+from dem_sim.util.file_io import load_time_series
+
 
 def calculate_damping_coefficient(stiffness, restitution, m1, m2):
     ln_rest = log(restitution)
@@ -56,33 +58,22 @@ def plot_pos_and_vel():
     increments = []
     data_dir = os.listdir("data")
     for filename in data_dir:
-        name_match = re.match("2_normal_force_(\d+)_\d+.txt", filename)
+        name_match = re.match("2_normal_force_(\d+).dat", filename)
         if name_match:
             i = int(name_match.group(1))
             if increments.count(i) == 0:
                 increments.append(i)
     increments.sort()
     for i in increments:
-        timestep_data = np.array([]).reshape((0, 3))  # Times, Positions, Velocities
-        for filename in data_dir:
-            name_match = re.match("2_normal_force_" + str(i) + "_(\d+).txt", filename)
-            if name_match:
-                time = int(name_match.group(1)) / 1e6
-                file = open("data/" + filename, "r")
-                line = file.readlines()[1]
-                data_match = re.match("(\d+\.\d+),(\d+\.\d+),(\d+\.\d+),(-?\d+\.\d+),(\d+\.\d+),(\d+\.\d+)", line)
-                if data_match and time <= col_duration * 1.2:
-                    timestep_data = np.append(timestep_data,
-                                              [[time, float(data_match.group(1)), float(data_match.group(4))]], axis=0)
-        timestep_data = timestep_data[timestep_data[:, 0].argsort()]  # Sort by time
+        sim_times, pos, vel = load_time_series("data/2_normal_force_" + str(i) + ".dat")
+        timestep_data = np.column_stack((sim_times, pos[:, 1, 0], vel[:, 1, 0]))  # Times, Positions, Velocities
+        timestep_data = timestep_data[sim_times <= col_duration * 1.2]
         data.append(timestep_data)
 
     # Normalize Data
     for incr_data in data:
-        for n in range(len(incr_data)):
-            incr_data[n, 0] = incr_data[n, 0] / col_duration  # Normalize time with collision duration
-            incr_data[n, 1] = incr_data[n, 1] / diameter  # Normalize position with particle diameter
-            incr_data[n, 2] = incr_data[n, 2] / u_0  # Normalize velocity with initial velocity
+        # Normalize time with collision duration, position with particle diameter, and velocity with initial velocity.
+        incr_data /= [col_duration, diameter, u_0]
 
     for n in range(len(positions)):
         times[n] = times[n] / col_duration